@@ -1,14 +1,24 @@
 import os
 import json
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple, Union
-from dataclasses import dataclass, asdict, field
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Any, Tuple, Union
+from dataclasses import dataclass, asdict, field, replace
 from pathlib import Path
 import logging
 import re
 import copy
-from collections import Counter
+import time
+import heapq
+import hmac
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # 라이브러리
 from notion_client import AsyncClient as NotionClient
@@ -16,13 +26,13 @@ import httpx  # Ollama API 호출용
 import pandas as pd
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+from openpyxl.utils import get_column_letter, coordinate_to_tuple
 from weasyprint import HTML #pdf생성 라이브러리
 import zipfile
 from cryptography.fernet import Fernet
 import boto3
 import requests
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, Request
 from pydantic import BaseModel
 import uvicorn
 import logging
@@ -30,9 +40,11 @@ from dotenv import load_dotenv
 
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.styles.fonts import DEFAULT_FONT
 from openpyxl.utils import get_column_letter
 from openpyxl.chart import BarChart, LineChart, Reference
 from openpyxl.chart.label import DataLabelList
+from openpyxl.cell import WriteOnlyCell
 
 # 환경변수 로드
 load_dotenv()
@@ -45,6 +57,7 @@ logger.setLevel(logging.DEBUG)
 BASE_DIR = Path(__file__).resolve().parent
 filter_select_prompt_path = BASE_DIR / "filter_select_prompt"
 table_select_prompt_path = BASE_DIR / "table_select_prompt"
+combined_select_prompt_path = BASE_DIR / "combined_select_prompt"
 
 with filter_select_prompt_path.open("r", encoding="utf-8") as f:
     FILTER_SELECT_PROMPT = f.read()
@@ -52,6 +65,9 @@ with filter_select_prompt_path.open("r", encoding="utf-8") as f:
 with table_select_prompt_path.open("r", encoding="utf-8") as f:
     TABLE_SELECT_PROMPT = f.read()
 
+with combined_select_prompt_path.open("r", encoding="utf-8") as f:
+    COMBINED_SELECT_PROMPT = f.read()
+
 
 
 class Config:
@@ -64,6 +80,78 @@ class Config:
     OLLAMA_URL: str = os.getenv("OLLAMA_URL", "http://localhost:11434")
     OLLAMA_ENTITY_MODEL: str = os.getenv("OLLAMA_ENTITY_MODEL", "qwen3:8b")
     OLLAMA_QUERY_MODEL: str = os.getenv("OLLAMA_QUERY_MODEL", "qwencoder:7b")
+    OLLAMA_TIMEOUT: float = float(os.getenv("OLLAMA_TIMEOUT", "30"))
+    ANALYZE_DEADLINE: float = float(os.getenv("ANALYZE_DEADLINE", "40"))  # 질문 분석 전체 마감 시간(초)
+    ANALYZE_MODE: str = os.getenv("ANALYZE_MODE", "split").lower()  # split: 필터/테이블 2회 호출, combined: 통합 프롬프트 1회 호출
+    # analyze_question 결과 캐시
+    ANALYSIS_CACHE_ENABLED: bool = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+    ANALYSIS_CACHE_PATH: Path = Path(os.getenv("ANALYSIS_CACHE_PATH", "data/analysis_cache.json"))
+    ANALYSIS_CACHE_TTL: float = float(os.getenv("ANALYSIS_CACHE_TTL", "86400"))  # 초
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "500"))
+    ANALYSIS_CACHE_SIMILARITY: float = float(os.getenv("ANALYSIS_CACHE_SIMILARITY", "0"))  # 유사 질문 매칭 임계값 (0이면 사용 안 함, 예: 0.9)
+    ANALYSIS_CACHE_SAVE_DELAY: float = float(os.getenv("ANALYSIS_CACHE_SAVE_DELAY", "5"))  # 추가 후 이 시간 동안 모아서 파일에 한 번 저장(초)
+    # Ollama 커넥션 풀 (PollingSystem 워커 수에 맞춰 조정)
+    OLLAMA_MAX_CONNECTIONS: int = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "4"))
+    OLLAMA_MAX_KEEPALIVE: int = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "4"))
+    OLLAMA_KEEPALIVE_EXPIRY: float = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+    OLLAMA_HTTP2: bool = os.getenv("OLLAMA_HTTP2", "false").lower() == "true"  # https 프록시 뒤에서만 의미 있음 (h2 패키지 필요)
+
+    # 로컬 미러: class/discharge DB를 SQLite에 복제해두고 증분 동기화
+    MIRROR_ENABLED: bool = os.getenv("MIRROR_ENABLED", "true").lower() == "true"
+    MIRROR_PATH: Path = Path(os.getenv("MIRROR_PATH", "data/notion_mirror.sqlite3"))
+    MIRROR_SYNC_INTERVAL: float = float(os.getenv("MIRROR_SYNC_INTERVAL", "10"))  # 증분 동기화 최소 간격(초)
+    MIRROR_FULL_RESYNC_INTERVAL: float = float(os.getenv("MIRROR_FULL_RESYNC_INTERVAL", "3600"))  # 삭제 반영용 전체 동기화 간격(초)
+    MIRROR_ROLLUP_ENABLED: bool = os.getenv("MIRROR_ROLLUP_ENABLED", "true").lower() == "true"  # 월별 입퇴소 건수 롤업 유지
+
+    # 멀티 테이블 조회 동시성/타임아웃
+    NOTION_MAX_CONCURRENCY: int = int(os.getenv("NOTION_MAX_CONCURRENCY", "3"))
+    NOTION_TABLE_TIMEOUT: float = float(os.getenv("NOTION_TABLE_TIMEOUT", "60"))  # 테이블당 조회 제한 시간(초)
+    NOTION_SCHEMA_TTL: float = float(os.getenv("NOTION_SCHEMA_TTL", "600"))  # DB 스키마(속성 타입) 캐시 유지 시간(초)
+
+    # 입퇴소 추이 기간
+    TREND_MONTHS: int = int(os.getenv("TREND_MONTHS", "12"))  # 기본 추이 기간 (3, 6, 12, 24, 36 중 하나)
+    FISCAL_YEAR_START_MONTH: int = int(os.getenv("FISCAL_YEAR_START_MONTH", "3"))  # 회계연도(학년도) 시작 월
+
+    # Excel 렌더링은 이벤트 루프 밖(프로세스/스레드 풀)에서 실행
+    EXCEL_EXECUTOR: str = os.getenv("EXCEL_EXECUTOR", "process").lower()  # process | thread
+    EXCEL_MAX_WORKERS: int = int(os.getenv("EXCEL_MAX_WORKERS", "2"))
+    EXCEL_MAX_CONCURRENCY: int = int(os.getenv("EXCEL_MAX_CONCURRENCY", "2"))  # 동시에 렌더링할 보고서 수
+    EXCEL_STREAMING_ROWS: int = int(os.getenv("EXCEL_STREAMING_ROWS", "5000"))  # 상세 명단이 이 행 수 이상이면 write-only 모드 (0이면 항상)
+
+    # 요청 처리 기록 (재시작 후에도 중복 처리 방지)
+    LEDGER_PATH: Path = Path(os.getenv("LEDGER_PATH", "data/request_ledger.sqlite3"))
+    LEDGER_CACHE_SIZE: int = int(os.getenv("LEDGER_CACHE_SIZE", "10000"))  # 메모리에 둘 최근 요청 수
+    LEDGER_RETENTION_DAYS: float = float(os.getenv("LEDGER_RETENTION_DAYS", "90"))  # 끝난 요청 기록 보관 기간(일)
+    MAX_REQUEST_RETRIES: int = int(os.getenv("MAX_REQUEST_RETRIES", "3"))  # 처리 실패 시 재시도 횟수
+
+    # 요청 수집: 웹훅이 기본, 폴링은 놓친 이벤트를 위한 적응형 보조 수단
+    POLL_MIN_INTERVAL: float = float(os.getenv("POLL_MIN_INTERVAL", "30"))  # 활동 직후 폴링 간격(초, 웹훅이 주 경로이므로 30초 미만은 API 호출만 늘림)
+    POLL_MAX_INTERVAL: float = float(os.getenv("POLL_MAX_INTERVAL", "120"))  # 한가할 때 최대 폴링 간격(초)
+    NOTION_WEBHOOK_SECRET: str = os.getenv("NOTION_WEBHOOK_SECRET", "")  # 웹훅 서명(X-Notion-Signature) 검증용 (비어 있으면 검증 안 함)
+    PENDING_FULL_SCAN_INTERVAL: float = float(os.getenv("PENDING_FULL_SCAN_INTERVAL", "3600"))  # 변경분만 보다가 이 간격마다 대기중 요청 전체 재확인(초)
+    WEBHOOK_TOKEN_PATH: Path = Path(os.getenv("WEBHOOK_TOKEN_PATH", "data/notion_webhook_token"))  # 구독 검증 토큰 저장 위치
+    WEBHOOK_EVENT_CACHE: int = int(os.getenv("WEBHOOK_EVENT_CACHE", "1000"))  # 중복 제거용으로 기억할 최근 이벤트 ID 수
+
+    # 처리 큐 스케줄링: 요청자별 공정 큐 + 비용 등급(light/normal/heavy) 우선순위
+    SCHED_COST_WEIGHTS: Dict[str, float] = {"light": 1.0, "normal": 3.0, "heavy": 10.0}  # 등급별 가상 비용 (작을수록 먼저)
+    RETRY_BACKOFF_BASE: float = float(os.getenv("RETRY_BACKOFF_BASE", "5"))  # 첫 재시도 대기(초), 시도마다 두 배
+    RETRY_BACKOFF_MAX: float = float(os.getenv("RETRY_BACKOFF_MAX", "300"))  # 재시도 대기 상한(초)
+
+    # 워커 풀 자동 조정 (Notion/Ollama/Excel 단계는 각각 NOTION_MAX_CONCURRENCY, OLLAMA_MAX_CONNECTIONS, EXCEL_MAX_CONCURRENCY로 따로 제한)
+    WORKER_MIN: int = int(os.getenv("WORKER_MIN", "1"))
+    WORKER_MAX: int = int(os.getenv("WORKER_MAX", "4"))
+    WORKER_SCALE_INTERVAL: float = float(os.getenv("WORKER_SCALE_INTERVAL", "2"))  # 큐 상태 확인 간격(초)
+    WORKER_SCALE_UP_WAIT: float = float(os.getenv("WORKER_SCALE_UP_WAIT", "5"))  # 가장 오래 기다린 요청이 이만큼 기다리면 워커 추가(초)
+    WORKER_IDLE_TIMEOUT: float = float(os.getenv("WORKER_IDLE_TIMEOUT", "60"))  # 이만큼 놀던 워커는 종료 (최소 수는 유지)
+    WORKER_DRAIN_TIMEOUT: float = float(os.getenv("WORKER_DRAIN_TIMEOUT", "120"))  # 종료 시 처리 중인 요청을 기다리는 시간(초)
+
+    # 요청 처리 파이프라인: 단계별 동시 처리 수, 단계 사이 대기열 크기 (가득 차면 앞 단계가 기다림)
+    PIPELINE_ANALYZE_CONCURRENCY: int = int(os.getenv("PIPELINE_ANALYZE_CONCURRENCY", "2"))  # 질문 분석 (Ollama)
+    PIPELINE_FETCH_CONCURRENCY: int = int(os.getenv("PIPELINE_FETCH_CONCURRENCY", "2"))  # 데이터 조회 (Notion/미러)
+    PIPELINE_AGGREGATE_CONCURRENCY: int = int(os.getenv("PIPELINE_AGGREGATE_CONCURRENCY", "1"))  # 집계 (CPU)
+    PIPELINE_RENDER_CONCURRENCY: int = int(os.getenv("PIPELINE_RENDER_CONCURRENCY", "2"))  # Excel 렌더링
+    PIPELINE_PUBLISH_CONCURRENCY: int = int(os.getenv("PIPELINE_PUBLISH_CONCURRENCY", "2"))  # 완료 상태 기록 (Notion)
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
 
     TEMP_DIR = Path("temp")
     REPORTS_DIR = Path("reports")
@@ -77,30 +165,89 @@ config = Config()
 
 #### 데이터 클래스 정의
 
-@dataclass
-class Class:
-    id: str
-    student_name: str
-    teacher_name: list[str]
-    class_name: str
-    parent_phone_number: str
-    start_date: datetime
-    school_name: str
-    grade: int
+class RowRecord:
+    """조회 결과 행 레코드 공통부 (슬롯 dataclass를 기존 dict 행처럼 읽을 수 있게 함)"""
 
-@dataclass
-class DISCHARGE:
-    id: str
-    student_name: str
-    teacher_name: list[str]
-    class_name: str
-    parent_phone_number: str
-    student_phone_number: str
-    discharge_date: datetime
-    start_date: datetime
-    discharging_reason: str
-    school_name: str
-    grade: int
+    __slots__ = ()
+
+    def get(self, key: str, default=None):
+        if key in self.__dataclass_fields__:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__dataclass_fields__
+
+    def keys(self) -> List[str]:
+        return list(self.__dataclass_fields__)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, getattr(self, key)) for key in self.__dataclass_fields__]
+
+
+@lru_cache(maxsize=4096)
+def _parse_iso_date(value: str) -> Optional[date]:
+    """ISO 날짜(시각 포함 가능) 문자열 → date, 형식이 잘못되면 None (같은 날짜는 한 번만 파싱)"""
+    try:
+        return date.fromisoformat(value.split("T")[0])
+    except ValueError:
+        return None
+
+
+def to_date(value) -> Optional[date]:
+    """date / datetime / ISO 문자열 → date (값이 없거나 해석할 수 없으면 None)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str) and value:
+        return _parse_iso_date(value)
+    return None
+
+
+@dataclass(slots=True)
+class Class(RowRecord):
+    id: Optional[str] = None
+    student_name: Optional[str] = None
+    teacher_name: Optional[list[str]] = None
+    class_name: Optional[str] = None
+    parent_phone_number: Optional[str] = None
+    start_date: Optional[date] = None
+    school_name: Optional[str] = None
+    grade: Optional[int] = None
+
+@dataclass(slots=True)
+class DISCHARGE(RowRecord):
+    id: Optional[str] = None
+    student_name: Optional[str] = None
+    teacher_name: Optional[list[str]] = None
+    class_name: Optional[str] = None
+    parent_phone_number: Optional[str] = None
+    student_phone_number: Optional[str] = None
+    discharge_date: Optional[date] = None
+    start_date: Optional[date] = None
+    discharging_reason: Optional[str] = None
+    school_name: Optional[str] = None
+    grade: Optional[int] = None
+
+
+@dataclass(slots=True)
+class DetailRow(RowRecord):
+    """상세 명단 한 행 (표시용 한글 라벨/문자열은 시트 생성 시 DETAIL_COLUMNS로 만든다)"""
+    student_name: Optional[str] = None
+    grade: Optional[int] = None
+    class_name: Optional[str] = None
+    start_date: Optional[date] = None
+    discharge_date: Optional[date] = None
+    status: str = "enrolled"  # enrolled, discharged
+    tenure_days: Optional[int] = None
+    discharging_reason: Optional[str] = None
+    parent_phone_number: Optional[str] = None
 
 
 @dataclass
@@ -112,6 +259,18 @@ class ReportRequest:
     created_at: datetime
     updated_at: datetime
 
+@dataclass
+class PipelineJob:
+    """파이프라인 단계 사이를 오가는 요청 하나의 중간 결과"""
+    request: ReportRequest
+    future: asyncio.Future
+    query: Any = None
+    query_results: Any = None
+    monthly_counts: Optional[Dict] = None
+    report_data: Optional[Dict] = None
+    excel_path: Optional[Path] = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
 @dataclass
 class ReportQuery:
     target_table: Optional[str] = None 
@@ -122,44 +281,568 @@ class ReportQuery:
     date_range: Optional[Dict[str, str]] = None
 
 
+@dataclass
+class FilterPlan:
+    """쿼리 조건 분리 결과: Notion이 정확히 처리하는 조건(server)과 페이지에 로컬로 적용할 술어(local)"""
+    server: Optional[Dict] = None
+    local: List[Callable[[Dict], bool]] = field(default_factory=list)
+    local_labels: List[str] = field(default_factory=list)
+    local_properties: List[str] = field(default_factory=list)  # 로컬 술어가 읽는 속성 (응답에 포함돼야 함)
+
+    def add_local(self, prop: str, label: str, predicate: Callable[[Dict], bool]):
+        self.local_properties.append(prop)
+        self.local_labels.append(label)
+        self.local.append(predicate)
+
+    def matches(self, page: Dict) -> bool:
+        return all(predicate(page) for predicate in self.local)
+
+
+@dataclass
+class TableQueryError:
+    table: str
+    error_type: str  # timeout, error
+    message: str
+
+
+class MultiTableResult(dict):
+    """테이블명 -> 행 목록. 실패한 테이블은 빈 목록으로 두고 errors에 원인을 기록"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.errors: Dict[str, TableQueryError] = {}
+
+
 ####
 
 
+class NotionMirror:
+    """Notion DB 페이지를 SQLite에 복제해두는 로컬 미러
+
+    last_edited_time 기준으로 변경된 페이지만 증분 동기화하고, 삭제(보관/휴지통)된 페이지는
+    주기적인 전체 동기화 때 정리한다 (databases.query는 삭제된 페이지를 돌려주지 않으므로
+    증분 동기화로는 알 수 없다). client는 `databases.query`를 가진 객체면
+    무엇이든 되므로 테스트에서는 가짜 클라이언트를 넣을 수 있다.
+
+    SQLite 읽기/쓰기는 모두 전용 스레드 하나에서 순서대로 실행해 이벤트 루프를 막지 않는다.
+
+    register_rollup으로 등록한 DB는 (년, 월, 차원 값) 별 페이지 수를 monthly_rollup에
+    함께 유지한다. 차원 값은 등록 때 받은 normalize로 속성 dict를 정규화해 저장하고,
+    페이지마다 기여한 키를 rollup_keys에 기록해두고 바뀐 페이지만 빼고 더한다.
+    """
+
+    ROLLUP_FORMAT = 2  # 롤업 차원 값 저장 형식 (바뀌면 저장된 페이지로 롤업을 다시 만든다)
+
+    def __init__(self, client, path: Path = None,
+                 sync_interval: float = None,
+                 full_resync_interval: float = None):
+        self.client = client
+        self.path = Path(path or config.MIRROR_PATH)
+        self.sync_interval = config.MIRROR_SYNC_INTERVAL if sync_interval is None else sync_interval
+        self.full_resync_interval = (config.MIRROR_FULL_RESYNC_INTERVAL
+                                     if full_resync_interval is None else full_resync_interval)
+
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                db_id TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                last_edited_time TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (db_id, page_id)
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                db_id TEXT PRIMARY KEY,
+                checkpoint TEXT,
+                last_full_sync REAL
+            );
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                db_id TEXT PRIMARY KEY,
+                spec TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rollup_keys (
+                db_id TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                dims TEXT NOT NULL,
+                PRIMARY KEY (db_id, page_id)
+            );
+            CREATE TABLE IF NOT EXISTS monthly_rollup (
+                db_id TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                dims TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (db_id, year, month, dims)
+            );
+        """)
+        self.conn.commit()
+
+        self._rollups: Dict[str, Tuple[str, Tuple[str, ...], Callable[[Dict], Any]]] = {}  # db_id -> (월 기준 날짜 속성, 차원 속성, 정규화 함수)
+        self._sync_tasks: Dict[str, asyncio.Task] = {}  # db_id -> 진행 중인 동기화 태스크
+        self._last_sync: Dict[str, float] = {}  # db_id -> 마지막 동기화 시각 (monotonic)
+        self._page_cache: Dict[str, List[Dict]] = {}  # db_id -> 디코딩된 페이지 목록
+        self._versions: Counter = Counter()  # db_id -> 페이지 변경 횟수 (늦게 끝난 읽기가 캐시를 덮지 않도록)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mirror")
+
+    async def _db(self, fn, *args):
+        """SQLite 작업을 미러 전용 스레드에서 실행"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _invalidate(self, db_id: str):
+        self._versions[db_id] += 1
+        self._page_cache.pop(db_id, None)
+
+    async def sync(self, db_id: str, force: bool = False) -> int:
+        """필요하면 동기화를 수행하고 변경된 페이지 수를 반환
+
+        동기화는 DB마다 태스크 하나로 돌고 호출자는 shield로 기다린다. 호출자가 테이블 조회
+        제한 시간에 걸려 취소돼도 동기화는 끝까지 진행되어 커밋되므로, 큰 DB의 첫 전체 동기화도
+        다음 요청(또는 같은 동기화를 기다리는 다른 요청)에서 이어서 쓸 수 있다.
+        """
+        task = self._sync_tasks.get(db_id)
+        if task is None or task.done():
+            task = self._sync_tasks[db_id] = asyncio.create_task(self._sync(db_id, force))
+            task.add_done_callback(self._log_sync_failure)
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _log_sync_failure(task: asyncio.Task):
+        # 기다리던 호출자가 모두 취소된 뒤 실패해도 로그는 남김
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ 미러 동기화 실패: {task.exception()}")
+
+    async def _sync(self, db_id: str, force: bool) -> int:
+        last = self._last_sync.get(db_id)
+        if not force and last is not None and time.monotonic() - last < self.sync_interval:
+            return 0
+
+        checkpoint, last_full_sync = await self._db(self._get_state, db_id)
+        if checkpoint is None or last_full_sync is None or \
+                time.time() - last_full_sync >= self.full_resync_interval:
+            changed = await self._full_sync(db_id)
+        else:
+            changed = await self._incremental_sync(db_id, checkpoint)
+
+        self._last_sync[db_id] = time.monotonic()
+        return changed
+
+    async def pages(self, db_id: str) -> List[Dict]:
+        """미러에 저장된 페이지 목록 (변경이 없으면 메모리 캐시 재사용)"""
+        cached = self._page_cache.get(db_id)
+        if cached is not None:
+            return cached
+        version = self._versions[db_id]
+        pages = await self._db(self._load_pages, db_id)
+        if self._versions[db_id] == version:
+            self._page_cache[db_id] = pages
+        return pages
+
+    def _load_pages(self, db_id: str) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT payload FROM pages WHERE db_id = ?", (db_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def _fetch_pages(self, db_id: str, notion_filter: Optional[Dict] = None) -> List[Dict]:
+        results = []
+        start_cursor = None
+        while True:
+            kwargs = {
+                "database_id": db_id,
+                "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}],
+            }
+            if notion_filter:
+                kwargs["filter"] = notion_filter
+            if start_cursor:
+                kwargs["start_cursor"] = start_cursor
+            response = await self.client.databases.query(**kwargs)
+            results.extend(response.get("results", []))
+            if not response.get("has_more"):
+                break
+            start_cursor = response.get("next_cursor")
+        return results
+
+    async def _full_sync(self, db_id: str) -> int:
+        logger.info(f"🗄️ 미러 전체 동기화: {db_id}")
+        pages = await self._fetch_pages(db_id)
+        live = [p for p in pages if not (p.get("archived") or p.get("in_trash"))]
+        await self._db(self._store_full, db_id, live)
+        self._invalidate(db_id)
+        logger.info(f"✅ 미러 전체 동기화 완료: {len(live)}건")
+        return len(live)
+
+    def _store_full(self, db_id: str, live: List[Dict]):
+        with self.conn:
+            self.conn.execute("DELETE FROM pages WHERE db_id = ?", (db_id,))
+            self.conn.executemany(
+                "INSERT INTO pages (db_id, page_id, last_edited_time, payload) VALUES (?, ?, ?, ?)",
+                [(db_id, p["id"], p.get("last_edited_time", ""), json.dumps(p, ensure_ascii=False))
+                 for p in live]
+            )
+            checkpoint = self._max_edited(live) or datetime.utcnow().strftime("%Y-%m-%dT%H:%M:00.000Z")
+            self._set_state(db_id, checkpoint, time.time())
+            if db_id in self._rollups:
+                self._rebuild_rollup(db_id, live)
+
+    async def _incremental_sync(self, db_id: str, checkpoint: str) -> int:
+        # last_edited_time은 분 단위로 잘리므로 같은 분에 수정된 페이지를 놓치지 않도록 on_or_after 사용
+        pages = await self._fetch_pages(db_id, {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": checkpoint}
+        })
+        if not pages:
+            return 0
+
+        changed = await self._db(self._store_changes, db_id, checkpoint, pages)
+        if changed:
+            self._invalidate(db_id)
+            logger.info(f"🗄️ 미러 증분 동기화: {db_id} {changed}건 변경")
+        return changed
+
+    def _store_changes(self, db_id: str, checkpoint: str, pages: List[Dict]) -> int:
+        # 삭제된 페이지는 query 결과에 나오지 않으므로 여기서는 추가/수정만 (삭제는 전체 동기화에서)
+        changed = 0
+        rollup = db_id in self._rollups
+        with self.conn:
+            for p in pages:
+                cur = self.conn.execute(
+                    "INSERT INTO pages (db_id, page_id, last_edited_time, payload) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (db_id, page_id) DO UPDATE SET "
+                    "last_edited_time = excluded.last_edited_time, payload = excluded.payload "
+                    "WHERE pages.payload != excluded.payload",
+                    (db_id, p["id"], p.get("last_edited_time", ""), json.dumps(p, ensure_ascii=False))
+                )
+                changed += cur.rowcount
+                if rollup and cur.rowcount:
+                    # 바뀐 페이지만 이전 기여분을 빼고 새 키로 다시 더함
+                    self._rollup_remove(db_id, p["id"])
+                    self._rollup_add(db_id, p)
+            self._set_state(db_id, max(checkpoint, self._max_edited(pages) or checkpoint))
+        return changed
+
+    def _get_state(self, db_id: str) -> Tuple[Optional[str], Optional[float]]:
+        row = self.conn.execute(
+            "SELECT checkpoint, last_full_sync FROM sync_state WHERE db_id = ?", (db_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def _set_state(self, db_id: str, checkpoint: Optional[str], last_full_sync: Optional[float] = None):
+        if last_full_sync is None:
+            self.conn.execute(
+                "UPDATE sync_state SET checkpoint = ? WHERE db_id = ?", (checkpoint, db_id)
+            )
+        else:
+            self.conn.execute(
+                "INSERT INTO sync_state (db_id, checkpoint, last_full_sync) VALUES (?, ?, ?) "
+                "ON CONFLICT (db_id) DO UPDATE SET checkpoint = excluded.checkpoint, "
+                "last_full_sync = excluded.last_full_sync",
+                (db_id, checkpoint, last_full_sync)
+            )
+
+    async def register_rollup(self, db_id: str, date_property: str, dimensions: Tuple[str, ...],
+                              normalize: Callable[[Dict], Any]):
+        """db_id의 월별 페이지 수 롤업을 유지 (설정이 바뀌었으면 저장된 페이지로 다시 만든다)
+
+        등록 이후의 동기화부터 롤업에 반영되므로 해당 DB를 동기화하기 전에 등록해야 한다.
+        이미 등록된 DB는 바로 돌아온다.
+        """
+        if db_id in self._rollups:
+            return
+        self._rollups[db_id] = (date_property, tuple(dimensions), normalize)
+        spec = json.dumps([date_property, list(dimensions), self.ROLLUP_FORMAT], ensure_ascii=False)
+        try:
+            rebuilt = await self._db(self._ensure_rollup, db_id, spec)
+        except Exception:
+            self._rollups.pop(db_id, None)
+            raise
+        if rebuilt:
+            logger.info(f"🗄️ 미러 롤업 생성: {db_id} ({date_property} 기준)")
+
+    def _ensure_rollup(self, db_id: str, spec: str) -> bool:
+        row = self.conn.execute("SELECT spec FROM rollup_state WHERE db_id = ?", (db_id,)).fetchone()
+        if row and row[0] == spec:
+            return False
+        with self.conn:
+            self._rebuild_rollup(db_id, self._load_pages(db_id))
+            self.conn.execute(
+                "INSERT INTO rollup_state (db_id, spec) VALUES (?, ?) "
+                "ON CONFLICT (db_id) DO UPDATE SET spec = excluded.spec", (db_id, spec)
+            )
+        return True
+
+    async def rollup(self, db_id: str) -> List[Tuple[int, int, str, int]]:
+        """(년, 월, 차원 값 JSON, 페이지 수) 목록"""
+        return await self._db(self._load_rollup, db_id)
+
+    def _load_rollup(self, db_id: str) -> List[Tuple[int, int, str, int]]:
+        return self.conn.execute(
+            "SELECT year, month, dims, count FROM monthly_rollup WHERE db_id = ?", (db_id,)
+        ).fetchall()
+
+    def _rollup_key(self, db_id: str, page: Dict) -> Optional[Tuple[int, int, str]]:
+        """페이지가 기여하는 (년, 월, 차원 JSON), 월 기준 날짜가 없으면 None"""
+        date_property, dimensions, normalize = self._rollups[db_id]
+        props = page.get("properties", {})
+        value = to_date(((props.get(date_property) or {}).get("date") or {}).get("start"))
+        if value is None:
+            return None
+        dims = {name: normalize(props[name]) for name in dimensions if name in props}
+        return value.year, value.month, json.dumps(dims, ensure_ascii=False, sort_keys=True)
+
+    def _rebuild_rollup(self, db_id: str, pages: List[Dict]):
+        self.conn.execute("DELETE FROM rollup_keys WHERE db_id = ?", (db_id,))
+        self.conn.execute("DELETE FROM monthly_rollup WHERE db_id = ?", (db_id,))
+        keys = [(p["id"], key) for p in pages if (key := self._rollup_key(db_id, p))]
+        self.conn.executemany(
+            "INSERT INTO rollup_keys (db_id, page_id, year, month, dims) VALUES (?, ?, ?, ?, ?)",
+            [(db_id, page_id, *key) for page_id, key in keys]
+        )
+        self.conn.executemany(
+            "INSERT INTO monthly_rollup (db_id, year, month, dims, count) VALUES (?, ?, ?, ?, ?)",
+            [(db_id, *key, count) for key, count in Counter(key for _, key in keys).items()]
+        )
+
+    def _rollup_add(self, db_id: str, page: Dict):
+        key = self._rollup_key(db_id, page)
+        if key is None:
+            return
+        self.conn.execute(
+            "INSERT INTO rollup_keys (db_id, page_id, year, month, dims) VALUES (?, ?, ?, ?, ?)",
+            (db_id, page["id"], *key)
+        )
+        self.conn.execute(
+            "INSERT INTO monthly_rollup (db_id, year, month, dims, count) VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT (db_id, year, month, dims) DO UPDATE SET count = count + 1",
+            (db_id, *key)
+        )
+
+    def _rollup_remove(self, db_id: str, page_id: str):
+        row = self.conn.execute(
+            "SELECT year, month, dims FROM rollup_keys WHERE db_id = ? AND page_id = ?", (db_id, page_id)
+        ).fetchone()
+        if row is None:
+            return
+        self.conn.execute("DELETE FROM rollup_keys WHERE db_id = ? AND page_id = ?", (db_id, page_id))
+        self.conn.execute(
+            "UPDATE monthly_rollup SET count = count - 1 WHERE db_id = ? AND year = ? AND month = ? AND dims = ?",
+            (db_id, *row)
+        )
+        self.conn.execute(
+            "DELETE FROM monthly_rollup WHERE db_id = ? AND year = ? AND month = ? AND dims = ? AND count <= 0",
+            (db_id, *row)
+        )
+
+    @staticmethod
+    def _max_edited(pages: List[Dict]) -> Optional[str]:
+        # ISO 8601 UTC 문자열은 사전순 비교가 시간순과 같다
+        times = [p.get("last_edited_time") for p in pages if p.get("last_edited_time")]
+        return max(times) if times else None
+
+    def close(self):
+        for task in self._sync_tasks.values():
+            task.cancel()
+        # 진행 중인 쓰기가 끝난 뒤에 연결을 닫는다
+        self._executor.shutdown(wait=True)
+        self.conn.close()
+
+
+# Notion 속성 타입별 값 추출 (속성 dict 하나 → 파이썬 값)
+def _prop_title(p: Dict):
+    return p["title"][0]["text"]["content"] if p.get("title") else ""
+
+def _prop_rich_text(p: Dict):
+    return p["rich_text"][0]["text"]["content"] if p.get("rich_text") else ""
+
+def _prop_number(p: Dict):
+    return p.get("number", 0)
+
+def _prop_select(p: Dict):
+    return p["select"]["name"] if p.get("select") else ""
+
+def _prop_multi_select(p: Dict):
+    return [v["name"] for v in p.get("multi_select") or []]
+
+def _prop_people(p: Dict):
+    return [v.get("name", "") for v in p.get("people") or []]
+
+def _prop_relation(p: Dict):
+    return [v["id"] for v in p.get("relation") or []]
+
+def _prop_date(p: Dict):
+    return p["date"]["start"] if p.get("date") else ""
+
+def _prop_date_value(p: Dict):
+    # 레코드의 날짜 필드용 (추출과 date 변환을 한 번에)
+    value = p["date"]["start"] if p.get("date") else None
+    return _parse_iso_date(value) if value else None
+
+def _prop_phone_number(p: Dict):
+    return p.get("phone_number", "")
+
+def _prop_empty(p: Dict):
+    return ""
+
+PROPERTY_EXTRACTORS = {
+    "title": _prop_title,
+    "rich_text": _prop_rich_text,
+    "number": _prop_number,
+    "select": _prop_select,
+    "multi_select": _prop_multi_select,
+    "people": _prop_people,
+    "relation": _prop_relation,
+    "date": _prop_date,
+    "phone_number": _prop_phone_number,
+}
+
+
 class NotionManager:
-    def __init__(self):
+    # 월별 롤업: 테이블별 월 기준 날짜 속성과 필터로 쓸 수 있는 차원 속성
+    ROLLUP_DATE_PROPERTIES = {"class": "start_date", "discharge": "discharge_date"}
+    ROLLUP_DIMENSIONS = ("teacher_name", "class_name", "school_name", "grade")
+
+    def __init__(self, mirror: Optional[NotionMirror] = None):
         self.client = NotionClient(auth=config.NOTION_TOKEN)
         self.db_map = {
             "class": config.DB_CLASS,
             "report_requests": config.DB_REPORTREQUEST,
             "discharge": config.DB_DISCHARGE
         }
+        # 보고서 대상 테이블은 로컬 미러에서 조회 (요청 DB는 항상 실시간 조회)
+        if mirror is None and config.MIRROR_ENABLED:
+            mirror = NotionMirror(self.client)
+        self.mirror = mirror
+        self._query_semaphore = asyncio.Semaphore(config.NOTION_MAX_CONCURRENCY)
+        # DB별 스키마 (조회 시각, 속성명 → 타입), 속성명 → 속성 ID, (DB, 컬럼, 레코드 타입)별 컴파일된 추출기
+        self._schemas: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        self._property_ids: Dict[str, Dict[str, str]] = {}
+        self._extractors: Dict[Tuple, Tuple[Dict[str, str], List[Tuple]]] = {}
+        # 대기중 요청 스캔 체크포인트 (이 시각 이후 수정된 요청만 다시 조회), 마지막 전체 스캔 시각
+        self._request_checkpoint: Optional[str] = None
+        self._last_full_request_scan = 0.0
+        # 이 통합(봇)의 사용자 ID (자기 상태 업데이트로 생긴 웹훅 이벤트를 거르는 용도)
+        self.bot_user_id: Optional[str] = None
 
-    async def get_pending_requests(self) -> List[ReportRequest]:
-        logger.info("📋 보고서 요청 DB 확인 중...")
-    
-        response = await self.client.databases.query(
-            database_id=self.db_map["report_requests"],
-            filter={
-                "property": "상태",
-                "status": {"equals": "대기중"}
-            }
-        )
+    async def load_bot_user(self):
+        """통합 봇 사용자 ID를 한 번 조회 (실패하면 None으로 두고 봇 이벤트도 조회)"""
+        try:
+            me = await self.client.users.me()
+            self.bot_user_id = me.get("id")
+        except Exception as e:
+            logger.warning(f"⚠️ 봇 사용자 조회 실패, 자체 수정 이벤트도 조회합니다: {e}")
+
+    def is_request_event(self, event: Dict) -> bool:
+        """웹훅 이벤트가 보고서 요청 DB 페이지에 대한 다른 사용자의 변경일 수 있는지 (페이지 조회 없이 판단)"""
+        parent = (event.get("data") or {}).get("parent") or {}
+        if parent.get("id"):
+            if parent.get("type") != "database":
+                return False
+            if parent["id"].replace("-", "") != self.db_map["report_requests"].replace("-", ""):
+                return False
+        authors = event.get("authors") or []
+        if self.bot_user_id and authors and all(a.get("id") == self.bot_user_id for a in authors):
+            return False
+        return True
+
+    async def warm_mirror(self):
+        """서버 시작 시 보고서 대상 DB를 미리 동기화 (첫 요청이 전체 동기화를 기다리지 않도록)"""
+        if not self.mirror:
+            return
+        for table_name in self.ROLLUP_DATE_PROPERTIES:
+            db_id = self.db_map.get(table_name)
+            if not db_id:
+                continue
+            try:
+                await self._register_rollups()
+                await self.mirror.sync(db_id)
+            except Exception as e:
+                logger.warning(f"⚠️ 미러 사전 동기화 실패 ({table_name}), 첫 조회 때 다시 시도: {e}")
+
+    async def _register_rollups(self):
+        """입소/퇴소 DB의 월별 건수 롤업을 미러에 등록 (추이는 전체 행을 읽지 않고 롤업에서)
 
-        requests = []
-        for page in response["results"]:
-            req = ReportRequest(
-                id=page["id"],
-                question=self._get_title(page, "질문"),
-                requester_name=self._get_person_name(page, "요청자"),
-                status="대기중",
-                created_at=datetime.fromisoformat(page["created_time"].replace("Z", "+00:00")),
-                updated_at=datetime.fromisoformat(page["last_edited_time"].replace("Z", "+00:00"))
+        롤업은 등록 이후의 동기화만 반영하므로 미러를 동기화하는 곳마다 먼저 부른다 (등록된 뒤에는 바로 반환).
+        """
+        if not (self.mirror and config.MIRROR_ROLLUP_ENABLED):
+            return
+        for table_name, date_property in self.ROLLUP_DATE_PROPERTIES.items():
+            if self.db_map.get(table_name):
+                await self.mirror.register_rollup(self.db_map[table_name], date_property,
+                                                  self.ROLLUP_DIMENSIONS, self._dimension_value)
+
+    async def get_pending_requests(self, full: bool = False) -> List[ReportRequest]:
+        """대기중 요청 조회 (체크포인트 이후 새로 생기거나 수정된 요청만, full이면 전체)"""
+        db_id = self.db_map["report_requests"]
+        if time.monotonic() - self._last_full_request_scan >= config.PENDING_FULL_SCAN_INTERVAL:
+            full = True
+        checkpoint = None if full else self._request_checkpoint
+        logger.info(f"📋 보고서 요청 DB 확인 중... ({'전체' if checkpoint is None else f'{checkpoint} 이후 변경분'})")
+
+        notion_filter = {"property": "상태", "status": {"equals": "대기중"}}
+        if checkpoint:
+            # last_edited_time은 분 단위로 잘리므로 같은 분에 수정된 요청은 다시 받고 ledger에서 걸러짐
+            notion_filter = {"and": [notion_filter, {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": checkpoint}
+            }]}
+        # 요청으로 만들 때 읽는 속성만 받기
+        await self._get_schema(db_id)
+        property_ids = self._filter_property_ids(db_id, ["질문", "요청자"])
+        extra = {"filter_properties": property_ids} if property_ids else {}
+
+        started = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:00.000Z")
+        pages = []
+        start_cursor = None
+        while True:
+            response = await self.client.databases.query(
+                database_id=db_id,
+                filter=notion_filter,
+                sorts=[{"timestamp": "last_edited_time", "direction": "ascending"}],
+                start_cursor=start_cursor,
+                page_size=100,
+                **extra
             )
-            requests.append(req)
+            pages.extend(response.get("results", []))
+            if not response.get("has_more"):
+                break
+            start_cursor = response.get("next_cursor")
+
+        # 모든 페이지를 받은 뒤에만 체크포인트 전진 (중간에 실패하면 다음 스캔에서 같은 구간을 다시 조회)
+        self._request_checkpoint = NotionMirror._max_edited(pages) or checkpoint or started
+        if checkpoint is None:
+            self._last_full_request_scan = time.monotonic()
+
+        requests = [self._to_request(page) for page in pages]
         
         if requests:
             logger.info(f"✅ {len(requests)}개의 요청 발견")
         return requests
+
+    async def get_request(self, page_id: str) -> Optional[ReportRequest]:
+        """웹훅으로 알려진 페이지 하나만 조회 (보고서 요청 DB의 대기중 요청이 아니면 None)"""
+        page = await self.client.pages.retrieve(page_id=page_id)
+        parent = page.get("parent", {})
+        if parent.get("database_id", "").replace("-", "") != self.db_map["report_requests"].replace("-", ""):
+            return None
+        if page.get("archived") or page.get("in_trash"):
+            return None
+        status = page["properties"].get("상태", {}).get("status") or {}
+        if status.get("name") != "대기중":
+            return None
+        return self._to_request(page)
+
+    def _to_request(self, page: Dict) -> ReportRequest:
+        return ReportRequest(
+            id=page["id"],
+            question=self._get_title(page, "질문"),
+            requester_name=self._get_person_name(page, "요청자"),
+            status="대기중",
+            created_at=datetime.fromisoformat(page["created_time"].replace("Z", "+00:00")),
+            updated_at=datetime.fromisoformat(page["last_edited_time"].replace("Z", "+00:00"))
+        )
     
     async def query_table(self, table_name: str, query: ReportQuery) -> List[Dict]:
         logger.info(f"📊 {table_name} 테이블 조회 중...")
@@ -176,75 +859,159 @@ class NotionManager:
             return []
         logger.debug(f"query_table: resolved '{table_name}' -> db_id '{db_id}'")
         
-        # 필터 생성
-        notion_filter = self._build_filter(query)
-        
-        # 페이지네이션 처리: Notion이 결과를 여러 페이지로 반환할 수 있음
-        all_results = []
-        start_cursor = None
-        while True:
-            response = await self.client.databases.query(
-                database_id=db_id,
-                filter=notion_filter if notion_filter else None,
-                start_cursor=start_cursor
-            )
-            results = response.get("results", [])
-            all_results.extend(results)
+        # 필터 계획: 스키마상 Notion이 정확히 처리하는 조건만 서버로, 나머지는 로컬 술어로
+        schema = await self._get_schema(db_id)
+        plan = self._plan_filter(query, schema)
+        notion_filter = plan.server
 
-            if not response.get("has_more"):
-                break
-            start_cursor = response.get("next_cursor")
+        if self.mirror:
+            # 로컬 미러를 증분 동기화한 뒤 같은 필터를 로컬에서 평가
+            await self._register_rollups()
+            await self.mirror.sync(db_id)
+            all_results = [
+                page for page in await self.mirror.pages(db_id)
+                if self._match_filter(page, notion_filter)
+            ]
+        else:
+            # 디코딩할 컬럼과 로컬 술어가 읽는 속성만 응답에 포함 (filter_properties, 속성 ID 기준)
+            property_ids = self._filter_property_ids(db_id, [*query.columns, *plan.local_properties])
+            extra = {"filter_properties": property_ids} if property_ids else {}
 
-        # 데이터 파싱
-        data = []
-        for page in all_results:
-            row = {}
-            for col in query.columns:
-                row[col] = self._extract_property(page, col)
-            data.append(row)
-        
-        # 날짜 필터 추가 적용 (Notion API 필터가 완벽하지 않을 수 있으므로)
-        if query.date_range and isinstance(query.date_range, dict) and query.date_range.get("property"):
-            date_prop = query.date_range.get("property")
-            start_val = query.date_range.get("start")
-            end_val = query.date_range.get("end")
-            
-            if start_val or end_val:
-                filtered_data = []
-                for row in data:
-                    date_str = row.get(date_prop, "")
-                    if not date_str:
-                        continue
-                    
-                    try:
-                        # 날짜 문자열 파싱 (ISO 형식 또는 YYYY-MM-DD)
-                        if "T" in date_str:
-                            row_date = datetime.fromisoformat(date_str.split("T")[0])
-                        else:
-                            row_date = datetime.fromisoformat(date_str)
-                        
-                        # 날짜 범위 체크
-                        if start_val:
-                            start_date = datetime.fromisoformat(start_val)
-                            if row_date < start_date:
-                                continue
-                        
-                        if end_val:
-                            end_date = datetime.fromisoformat(end_val)
-                            if row_date > end_date:
-                                continue
-                        
-                        filtered_data.append(row)
-                    except Exception as e:
-                        logger.warning(f"날짜 파싱 실패 (행 건너뜀): {date_str}, 오류: {str(e)}")
-                        continue
-                
-                logger.info(f"📅 날짜 필터 적용: {len(data)}건 → {len(filtered_data)}건 (범위: {start_val} ~ {end_val})")
-                data = filtered_data
+            # 페이지네이션 처리: Notion이 결과를 여러 페이지로 반환할 수 있음
+            all_results = []
+            start_cursor = None
+            while True:
+                response = await self.client.databases.query(
+                    database_id=db_id,
+                    filter=notion_filter if notion_filter else None,
+                    start_cursor=start_cursor,
+                    **extra
+                )
+                results = response.get("results", [])
+                all_results.extend(results)
+
+                if not response.get("has_more"):
+                    break
+                start_cursor = response.get("next_cursor")
+
+        # 서버에서 처리할 수 없는 조건만 파싱 전에 한 번 적용 (서버가 거른 조건은 다시 검사하지 않음)
+        if plan.local:
+            page_count = len(all_results)
+            all_results = [page for page in all_results if plan.matches(page)]
+            logger.info(f"🔎 로컬 필터 적용: {page_count}건 → {len(all_results)}건 ({', '.join(plan.local_labels)})")
+
+        # 데이터 파싱 (요청 컬럼이 모두 레코드 필드면 슬롯 레코드(dict 행보다 메모리가 적음), 날짜는 date로 한 번만 파싱)
+        record_type = self.RECORD_TYPES.get(table_name.lower())
+        if record_type and not set(query.columns) <= set(record_type.__dataclass_fields__):
+            record_type = None
+        extractors = self._get_extractors(db_id, schema, query.columns, record_type, all_results)
+        data = self._parse_pages(all_results, extractors, record_type)
 
         logger.info(f"✅ {len(data)}건 조회 완료 (pages: {len(all_results)})")
         return data
-    
+
+    RECORD_TYPES = {"class": Class, "discharge": DISCHARGE}
+
+    async def _get_schema(self, db_id: str) -> Optional[Dict[str, str]]:
+        """DB 속성명 → 타입 (NOTION_SCHEMA_TTL 동안 캐시, 조회 실패 시 None)"""
+        cached = self._schemas.get(db_id)
+        if cached and time.monotonic() - cached[0] < config.NOTION_SCHEMA_TTL:
+            return cached[1]
+        try:
+            response = await self.client.databases.retrieve(database_id=db_id)
+        except Exception as e:
+            logger.warning(f"⚠️ 스키마 조회 실패, 페이지 속성 타입 사용: {db_id} ({e})")
+            return None
+        properties = response.get("properties", {})
+        schema = {name: prop.get("type", "") for name, prop in properties.items()}
+        self._property_ids[db_id] = {name: prop["id"] for name, prop in properties.items() if prop.get("id")}
+        self._schemas[db_id] = (time.monotonic(), schema)
+        logger.debug(f"_get_schema: {db_id} 속성 {len(schema)}개")
+        return schema
+
+    def _filter_property_ids(self, db_id: str, names: List[str]) -> Optional[List[str]]:
+        """filter_properties로 보낼 속성 ID 목록 (스키마를 모르거나 해당 속성이 없으면 None → 전체 속성 수신)"""
+        ids = self._property_ids.get(db_id)
+        if not ids:
+            return None
+        return [ids[name] for name in dict.fromkeys(names) if name in ids] or None
+
+    def _get_extractors(self, db_id: str, schema: Optional[Dict[str, str]], columns: List[str],
+                        record_type: Optional[type], pages: List[Dict]) -> List[Tuple]:
+        """컬럼별 추출기 목록 (스키마가 갱신될 때만 다시 컴파일)"""
+        page_schema = {name: p.get("type", "") for name, p in pages[0]["properties"].items()} if pages else {}
+        if schema is None:
+            # 스키마를 못 받으면 첫 페이지의 속성 타입으로 대신 (캐시하지 않음)
+            return self._compile_extractors(page_schema, columns, record_type)
+        if any(col in page_schema and page_schema[col] != schema.get(col) for col in columns):
+            # 스키마 캐시 이후 속성 타입이 바뀜 (한 조회의 페이지는 타입이 같으므로 첫 페이지만 확인)
+            logger.info(f"🔄 속성 타입 변경 감지, 스키마 다시 조회 예정: {db_id}")
+            self._schemas.pop(db_id, None)
+            return self._compile_extractors(page_schema, columns, record_type)
+        key = (db_id, tuple(columns), record_type)
+        cached = self._extractors.get(key)
+        if cached is None or cached[0] is not schema:
+            cached = self._extractors[key] = (schema, self._compile_extractors(schema, columns, record_type))
+        return cached[1]
+
+    @staticmethod
+    def _compile_extractors(schema: Dict[str, str], columns: List[str],
+                            record_type: Optional[type] = None) -> List[Tuple]:
+        """컬럼마다 (컬럼명, 속성 타입, 추출 함수, 변환 함수)를 미리 묶어둔다
+
+        추출 함수에는 변환(레코드의 날짜 필드 → date)까지 합쳐 둔다. record_type이 있으면 id 다음
+        레코드 필드 순서대로 만들고 요청하지 않은 필드는 컬럼명 None (레코드를 위치 인자로 바로 생성).
+        """
+        fields = record_type.__dataclass_fields__ if record_type else {}
+        if record_type:
+            assert next(iter(fields)) == "id", "레코드의 첫 필드는 id여야 함"
+        requested = set(columns)
+        extractors = []
+        for col in ([name for name in fields if name != "id"] if record_type else columns):
+            if col not in requested:
+                extractors.append((None, "", None, None))
+                continue
+            prop_type = schema.get(col, "")
+            extract = PROPERTY_EXTRACTORS.get(prop_type, _prop_empty)
+            convert = to_date if col in fields and fields[col].type == Optional[date] else None
+            if convert is not None:
+                extract = _prop_date_value if extract is _prop_date else (lambda p, e=extract: to_date(e(p)))
+            extractors.append((col, prop_type, extract, convert))
+        return extractors
+
+    def _parse_pages(self, pages: List[Dict], extractors: List[Tuple],
+                     record_type: Optional[type] = None) -> List:
+        """페이지 목록 → 행 목록 (record_type이 있으면 슬롯 레코드, 없으면 dict)
+
+        타입 확인은 _get_extractors에서 조회마다 한 번만 하고, 여기서는 컴파일된 추출기를 그대로 호출한다.
+        """
+        steps = [(col, extract) for col, _, extract, _ in extractors]
+        data = []
+        append = data.append
+        for page in pages:
+            props = page["properties"]
+            try:
+                if record_type:
+                    append(record_type(page.get("id"), *[extract(props[col]) if col else None
+                                                         for col, extract in steps]))
+                else:
+                    append({col: extract(props[col]) for col, extract in steps})
+            except (KeyError, IndexError, TypeError, AttributeError):
+                # 속성이 빠졌거나 모양이 다른 페이지만 셀마다 타입을 보고 추출
+                append(self._parse_page_slow(page, extractors, record_type))
+        return data
+
+    def _parse_page_slow(self, page: Dict, extractors: List[Tuple], record_type: Optional[type]):
+        values = []
+        for col, _, _, convert in extractors:
+            if col is None:
+                values.append(None)
+                continue
+            value = self._extract_property(page, col)
+            values.append(convert(value) if convert else value)
+        if record_type:
+            return record_type(page.get("id"), *values)
+        return {col: value for (col, _, _, _), value in zip(extractors, values)}
 
     async def query_multiple_tables(self, queries: List[ReportQuery]) -> Dict[str, List[Dict]]:
         # allow single ReportQuery or list of them
@@ -260,131 +1027,366 @@ class NotionManager:
 
         logger.info(f"🔗 멀티 테이블 조회: {', '.join(table_names)}")
 
-        # 각 테이블별로 데이터 조회
-        all_data = {}
-        for query in queries:
-            table_name = query.target_table
-            # clone query per-table so we can inject a sensible default date property
-            q_clone = copy.deepcopy(query)
-
-            # If AI provided a date_range but omitted the property name, set per-table defaults
-            if q_clone.date_range and isinstance(q_clone.date_range, dict) and not q_clone.date_range.get("property"):
-                default_prop = None
-                if str(table_name).lower() == "class":
-                    default_prop = "start_date"
-                elif str(table_name).lower() == "discharge":
-                    default_prop = "discharge_date"
+        async def fetch(query: ReportQuery) -> List[Dict]:
+            async with self._query_semaphore:
+                return await asyncio.wait_for(
+                    self.query_table(query.target_table, self._table_query(query)),
+                    timeout=config.NOTION_TABLE_TIMEOUT
+                )
 
-                if default_prop:
-                    q_clone.date_range["property"] = default_prop
-                    logger.debug(f"query_multiple_tables: set default date property '{default_prop}' for table '{table_name}'")
+        # 각 테이블을 동시에 조회 (동시성 제한 + 테이블별 타임아웃)
+        outcomes = await asyncio.gather(*(fetch(q) for q in queries), return_exceptions=True)
 
-            data = await self.query_table(table_name, q_clone)
-            all_data[table_name] = data
+        all_data = MultiTableResult()
+        for query, outcome in zip(queries, outcomes):
+            table_name = query.target_table
+            if isinstance(outcome, BaseException):
+                if isinstance(outcome, asyncio.TimeoutError):
+                    error = TableQueryError(table_name, "timeout", f"{config.NOTION_TABLE_TIMEOUT}초 내 응답 없음")
+                else:
+                    error = TableQueryError(table_name, "error", str(outcome) or type(outcome).__name__)
+                logger.error(f"❌ {table_name} 테이블 조회 실패 ({error.error_type}): {error.message}")
+                all_data.errors[table_name] = error
+                all_data[table_name] = []
+            else:
+                all_data[table_name] = outcome
 
         # If only one table requested, return its data under its table name
         return all_data
     
-    def _join_tables(self, all_data: Dict[str, List[Dict]], join_key: str) -> List[Dict]:
-        logger.info(f"🔗 조인 키: {join_key}")
-        
+    def _table_query(self, query: ReportQuery) -> ReportQuery:
+        """테이블별 쿼리 복제본 (날짜 범위에 속성명이 없으면 테이블 기본 날짜 속성을 넣음)"""
+        table_name = query.target_table
+        # clone query per-table so we can inject a sensible default date property
+        q_clone = copy.deepcopy(query)
+
+        # If AI provided a date_range but omitted the property name, set per-table defaults
+        if q_clone.date_range and isinstance(q_clone.date_range, dict) and not q_clone.date_range.get("property"):
+            default_prop = None
+            if str(table_name).lower() == "class":
+                default_prop = "start_date"
+            elif str(table_name).lower() == "discharge":
+                default_prop = "discharge_date"
+
+            if default_prop:
+                q_clone.date_range["property"] = default_prop
+                logger.debug(f"_table_query: set default date property '{default_prop}' for table '{table_name}'")
+        return q_clone
+
+    async def monthly_counts(self, query: ReportQuery) -> Optional[Dict[Tuple[int, int], int]]:
+        """쿼리 조건에 맞는 (년, 월) → 페이지 수를 미러 롤업에서 계산
+
+        필터가 롤업 차원 밖이거나 날짜 범위가 월 단위로 떨어지지 않아 정확히 답할 수 없으면 None
+        (호출 측은 조회한 행으로 직접 센다).
+        """
+        table_name = str(query.target_table).lower()
+        date_property = self.ROLLUP_DATE_PROPERTIES.get(table_name)
+        db_id = self.db_map.get(table_name)
+        if not (self.mirror and config.MIRROR_ROLLUP_ENABLED and date_property and db_id):
+            return None
+        q = self._table_query(query)
+        if any(key not in self.ROLLUP_DIMENSIONS for key in q.filters or {}):
+            return None
+
+        # 날짜 범위는 월 첫날 ~ 월 마지막 날로 떨어질 때만 월 구간으로 바꿔 적용
+        lower, upper = None, None
+        if q.date_range and isinstance(q.date_range, dict) and (q.date_range.get("start") or q.date_range.get("end")):
+            if q.date_range.get("property") != date_property:
+                return None
+            start, end = to_date(q.date_range.get("start")), to_date(q.date_range.get("end"))
+            if (q.date_range.get("start") and (start is None or start.day != 1)) or \
+                    (q.date_range.get("end") and (end is None or (end + timedelta(days=1)).day != 1)):
+                return None
+            lower = start.year * 12 + start.month - 1 if start else None
+            upper = end.year * 12 + end.month - 1 if end else None
+
+        await self._register_rollups()
+        await self.mirror.sync(db_id)
+        # 차원 값 조합마다 쿼리 필터를 한 번만 평가
+        schema = await self._get_schema(db_id)
+        matched: Dict[str, bool] = {}
+        counts: Dict[Tuple[int, int], int] = {}
+        for year, month, dims, count in await self.mirror.rollup(db_id):
+            ym = year * 12 + month - 1
+            if (lower is not None and ym < lower) or (upper is not None and ym > upper):
+                continue
+            ok = matched.get(dims)
+            if ok is None:
+                ok = matched[dims] = self._match_dimensions(json.loads(dims), q.filters or {}, schema)
+            if ok:
+                counts[(year, month)] = counts.get((year, month), 0) + count
+        logger.info(f"📈 월별 롤업 조회: {table_name} {len(counts)}개월 (차원 조합 {len(matched)}개)")
+        return counts
+
+    def _dimension_value(self, p: Dict):
+        """롤업 차원에 저장할 속성 값 (multi_select/people/relation은 항목 목록, number는 숫자, 나머지는 비교용 문자열)"""
+        prop_type = p.get("type", "")
+        if prop_type in ("multi_select", "people", "relation"):
+            return PROPERTY_EXTRACTORS[prop_type](p)
+        if prop_type == "number":
+            return p.get("number")
+        return self._property_text(p)
+
+    def _match_dimensions(self, dims: Dict, filters: Dict, schema: Optional[Dict[str, str]]) -> bool:
+        """롤업 차원 값이 필터를 만족하는지 (_plan_filter가 만드는 Notion 필터/로컬 술어와 같은 판정)"""
+        for key, value in filters.items():
+            dim = dims.get(key)
+            values = dim if isinstance(dim, list) else ["" if dim is None else str(dim)]
+            text = ", ".join(values)
+            ptype = None if schema is None else schema.get(key, "")
+            if isinstance(value, str):
+                ok = value.casefold() in text.casefold()
+            elif isinstance(value, (int, float)):
+                ok = dim == value if ptype is None or ptype == "number" else str(value) in values
+            elif isinstance(value, list) and value:
+                if ptype is None or ptype == "select":
+                    ok = text == value[0]
+                elif ptype == "multi_select":
+                    ok = value[0] in values
+                else:
+                    ok = str(value[0]) in values
+            else:
+                ok = True
+            if not ok:
+                return False
+        return True
+
+    JOIN_TYPES = ("left", "inner", "anti")
+
+    def _join_tables(self, all_data: Dict[str, List[Dict]], join_key: Union[str, Tuple[str, ...], List[str]],
+                     how: str = "left") -> List[Dict]:
+        """첫 번째 테이블을 기준으로 나머지 테이블을 조인 키로 붙인다.
+
+        join_key는 컬럼 하나("student_name") 또는 복합 키(("student_name", "parent_phone_number")).
+        how: left(기준 행 모두 유지), inner(모든 테이블에 매칭되는 행만), anti(어느 테이블에도 매칭 안 되는 행만)
+        다른 테이블은 조인 키 해시 인덱스를 한 번만 만들어 조회하므로 전체가 O(n + m).
+        """
+        if how not in self.JOIN_TYPES:
+            raise ValueError(f"지원하지 않는 조인 방식: {how} (사용 가능: {', '.join(self.JOIN_TYPES)})")
+        keys = (join_key,) if isinstance(join_key, str) else tuple(join_key)
+        logger.info(f"🔗 조인 키: {' + '.join(keys)} ({how})")
+
+        if not all_data:
+            return []
+
         # 첫 번째 테이블을 기준으로
-        base_table = list(all_data.keys())[0]
+        base_table = next(iter(all_data))
+        others = [(table_name, rows) for table_name, rows in all_data.items() if table_name != base_table]
+
+        # 다른 테이블별 조인 키 인덱스 (한 번만 생성)
+        indexes = {}
+        for table_name, rows in others:
+            index = {}
+            for row in rows:
+                value = self._join_value(row, keys)
+                if value is not None:
+                    index.setdefault(value, []).append(row)
+            indexes[table_name] = index
+
+        # 컬럼명 충돌 방지용 접두어 컬럼명 (테이블/컬럼별로 한 번만 생성)
+        prefixed = {table_name: {} for table_name, _ in others}
+
         result = []
-        
         for base_row in all_data[base_table]:
-            joined_row = base_row.copy()
-            join_value = base_row.get(join_key)
-            
-            if not join_value:
-                result.append(joined_row)
-                continue
-            
-            # 다른 테이블에서 매칭되는 데이터 찾기
-            for table_name, table_data in all_data.items():
-                if table_name == base_table:
-                    continue
-                
-                # 해당 테이블에서 조인 키 값이 일치하는 행 찾기
-                matching_rows = [
-                    row for row in table_data 
-                    if row.get(join_key) == join_value
-                ]
-                
-                # 매칭된 데이터 병합 (컬럼명 충돌 방지)
-                for match in matching_rows:
-                    for key, value in match.items():
-                        if key != join_key:  # 조인 키는 중복 제거
-                            new_key = f"{table_name}_{key}"
+            join_value = self._join_value(base_row, keys)
+            matched_tables = 0
+            joined_row = None
+
+            if join_value is not None:
+                for table_name, _ in others:
+                    matches = indexes[table_name].get(join_value)
+                    if not matches:
+                        continue
+                    matched_tables += 1
+                    if how == "anti":
+                        break
+                    if joined_row is None:
+                        joined_row = dict(base_row.items())
+                    names = prefixed[table_name]
+                    # 매칭된 데이터 병합 (조인 키는 중복 제거, 여러 건이면 마지막 행 값)
+                    for match in matches:
+                        for key, value in match.items():
+                            if key in keys:
+                                continue
+                            new_key = names.get(key)
+                            if new_key is None:
+                                new_key = names[key] = f"{table_name}_{key}"
                             joined_row[new_key] = value
-            
-            result.append(joined_row)
-        
+
+            if how == "inner" and matched_tables < len(others):
+                continue
+            if how == "anti" and matched_tables:
+                continue
+            result.append(joined_row if joined_row is not None else dict(base_row.items()))
+
         logger.info(f"✅ 조인 완료: {len(result)}건")
         return result
 
+    @staticmethod
+    def _join_value(row: Dict, keys: Tuple[str, ...]):
+        """조인 키 값 (해시 가능한 형태, 키 일부라도 비어 있으면 None)"""
+        values = []
+        for key in keys:
+            value = row.get(key)
+            if not value:
+                return None
+            if isinstance(value, list):
+                value = tuple(value)
+            values.append(value)
+        return values[0] if len(values) == 1 else tuple(values)
+
+
 
+    # Notion rich_text 필터(contains)를 정확히 처리하는 속성 타입
+    TEXT_FILTER_TYPES = ("title", "rich_text", "url", "email", "phone_number")
 
-    def _build_filter(self, query: ReportQuery) -> Optional[Dict]:
+    def _plan_filter(self, query: ReportQuery, schema: Optional[Dict[str, str]] = None) -> FilterPlan:
+        """조건마다 Notion 필터로 보낼지, 로컬 술어로 거를지 결정
+
+        속성 타입에 맞는 Notion 필터가 있으면 서버로 보내고 (결과를 다시 검사하지 않음),
+        그렇지 않은 조건(people, formula 날짜 등)은 비교 값을 미리 준비한 로컬 술어로 만든다.
+        스키마를 모르면(None) 기존처럼 모든 조건을 서버로 보낸다.
+        """
+        plan = FilterPlan()
         conditions = []
-        
+
+        def prop_type(key: str) -> Optional[str]:
+            return None if schema is None else schema.get(key, "")
+
         # 일반 필터 처리
-        if query.filters:
-            for key, value in query.filters.items():
-                if isinstance(value, str):
-                    conditions.append({
-                        "property": key,
-                        "rich_text": {"contains": value}
-                    })
-                elif isinstance(value, (int, float)):
-                    conditions.append({
-                        "property": key,
-                        "number": {"equals": value}
-                    })
-                elif isinstance(value, list):
-                    conditions.append({
-                        "property": key,
-                        "select": {"equals": value[0]}
-                    })
+        for key, value in (query.filters or {}).items():
+            ptype = prop_type(key)
+            if isinstance(value, str):
+                if ptype is None or ptype in self.TEXT_FILTER_TYPES:
+                    conditions.append({"property": key, "rich_text": {"contains": value}})
+                else:
+                    plan.add_local(key, f"{key}~{value}", self._contains_predicate(key, value))
+            elif isinstance(value, (int, float)):
+                if ptype is None or ptype == "number":
+                    conditions.append({"property": key, "number": {"equals": value}})
+                else:
+                    plan.add_local(key, f"{key}={value}", self._equals_predicate(key, str(value)))
+            elif isinstance(value, list) and value:
+                if ptype is None or ptype == "select":
+                    conditions.append({"property": key, "select": {"equals": value[0]}})
+                elif ptype == "multi_select":
+                    conditions.append({"property": key, "multi_select": {"contains": value[0]}})
+                else:
+                    plan.add_local(key, f"{key}={value[0]}", self._equals_predicate(key, str(value[0])))
         
         # 날짜 범위: AI가 날짜 속성명을 명시한 경우에만 사용
         if query.date_range and isinstance(query.date_range, dict) and query.date_range.get("property"):
             date_prop = query.date_range.get("property")
             start_val = query.date_range.get("start")
             end_val = query.date_range.get("end")
-            
-            # 시작일과 종료일을 별도의 조건으로 분리
-            if start_val:
-                start_cond = {
-                    "property": date_prop,
-                    "date": {
-                        "on_or_after": start_val
-                    }
-                }
-                conditions.append(start_cond)
-                logger.info(f"📅 날짜 필터 생성 (시작): {date_prop} >= {start_val}")
-            
-            if end_val:
-                end_cond = {
-                    "property": date_prop,
-                    "date": {
-                        "on_or_before": end_val
-                    }
-                }
-                conditions.append(end_cond)
-                logger.info(f"📅 날짜 필터 생성 (종료): {date_prop} <= {end_val}")
-        else:
+            ptype = prop_type(date_prop)
+
+            if ptype is None or ptype == "date":
+                # 시작일과 종료일을 별도의 조건으로 분리
+                if start_val:
+                    conditions.append({"property": date_prop, "date": {"on_or_after": start_val}})
+                    logger.info(f"📅 날짜 필터 생성 (시작): {date_prop} >= {start_val}")
+                if end_val:
+                    conditions.append({"property": date_prop, "date": {"on_or_before": end_val}})
+                    logger.info(f"📅 날짜 필터 생성 (종료): {date_prop} <= {end_val}")
+            elif start_val or end_val:
+                plan.add_local(date_prop, f"{date_prop}:{start_val or ''}~{end_val or ''}",
+                               self._date_range_predicate(date_prop, to_date(start_val), to_date(end_val)))
+        elif query.date_range and isinstance(query.date_range, dict):
             # date_range가 존재하지만 property가 누락된 경우 필터 추가를 건너뜁니다.
-            if query.date_range and isinstance(query.date_range, dict) and not query.date_range.get("property"):
-                logger.debug("_build_filter: date_range provided without 'property' — skipping date filter")
-        
-        # 조건이 하나도 없으면 None 반환
-        if len(conditions) == 0:
-            return None
-        elif len(conditions) > 1:
-            return {"and": conditions}
-        else:
-            return conditions[0]
+            logger.debug("_plan_filter: date_range provided without 'property' — skipping date filter")
+        
+        # 조건이 하나도 없으면 None
+        if len(conditions) > 1:
+            plan.server = {"and": conditions}
+        elif conditions:
+            plan.server = conditions[0]
+        return plan
+
+    def _contains_predicate(self, prop: str, value: str) -> Callable[[Dict], bool]:
+        needle = value.casefold()
+        text = self._property_text
+        return lambda page: needle in text(page["properties"].get(prop, {})).casefold()
+
+    def _equals_predicate(self, prop: str, value: str) -> Callable[[Dict], bool]:
+        values = self._property_values
+        return lambda page: value in values(page["properties"].get(prop, {}))
+
+    def _date_range_predicate(self, prop: str, start: Optional[date], end: Optional[date]) -> Callable[[Dict], bool]:
+        date_of = self._property_date
+
+        def predicate(page: Dict) -> bool:
+            value = to_date(date_of(page["properties"].get(prop, {})))
+            if value is None:
+                return False
+            return (start is None or value >= start) and (end is None or value <= end)
+        return predicate
+
+    def _match_filter(self, page: Dict, notion_filter: Optional[Dict]) -> bool:
+        """_plan_filter가 만든 Notion 필터를 미러의 페이지에 로컬로 적용"""
+        if not notion_filter:
+            return True
+        if "and" in notion_filter:
+            return all(self._match_filter(page, cond) for cond in notion_filter["and"])
+        if "or" in notion_filter:
+            return any(self._match_filter(page, cond) for cond in notion_filter["or"])
+
+        p = page["properties"].get(notion_filter.get("property"), {})
+        if "rich_text" in notion_filter:
+            needle = str(notion_filter["rich_text"].get("contains", "")).casefold()
+            return needle in self._property_text(p).casefold()
+        if "number" in notion_filter:
+            return p.get("number") == notion_filter["number"].get("equals")
+        if "select" in notion_filter:
+            return self._property_text(p) == notion_filter["select"].get("equals")
+        if "multi_select" in notion_filter:
+            return notion_filter["multi_select"].get("contains") in self._property_values(p)
+        if "date" in notion_filter:
+            value = (p.get("date") or {}).get("start") if p.get("type") == "date" else None
+            if not value:
+                return False
+            value = value[:10]
+            cond = notion_filter["date"]
+            if cond.get("on_or_after") and value < cond["on_or_after"][:10]:
+                return False
+            if cond.get("on_or_before") and value > cond["on_or_before"][:10]:
+                return False
+            return True
+        # 알 수 없는 조건은 Notion과 달리 거르지 않고 통과시킴
+        return True
+
+    def _property_text(self, p: Dict) -> str:
+        """속성 값을 비교용 문자열로 변환 (타입별 표현 차이 흡수)"""
+        prop_type = p.get("type", "")
+        if prop_type in ("title", "rich_text"):
+            return "".join(t.get("plain_text") or t.get("text", {}).get("content", "") for t in p.get(prop_type) or [])
+        if prop_type == "select":
+            return p["select"]["name"] if p.get("select") else ""
+        if prop_type == "multi_select":
+            return ", ".join(v["name"] for v in p.get("multi_select", []))
+        if prop_type == "people":
+            return ", ".join(v.get("name", "") for v in p.get("people", []))
+        if prop_type == "number":
+            return "" if p.get("number") is None else str(p["number"])
+        if prop_type in ("phone_number", "email", "url"):
+            return p.get(prop_type) or ""
+        return ""
+
+    def _property_values(self, p: Dict) -> List[str]:
+        """값 목록 (multi_select/people/relation은 항목별, 나머지는 비교용 문자열 하나)"""
+        prop_type = p.get("type", "")
+        if prop_type in ("multi_select", "people", "relation"):
+            return PROPERTY_EXTRACTORS[prop_type](p)
+        return [self._property_text(p)]
+
+    def _property_date(self, p: Dict) -> Optional[str]:
+        """날짜 성격 속성의 시작 값 (date, 생성/수정 시각, 날짜 formula/rollup)"""
+        prop_type = p.get("type", "")
+        if prop_type in ("created_time", "last_edited_time"):
+            return p.get(prop_type)
+        if prop_type in ("formula", "rollup"):
+            p = p.get(prop_type) or {}
+        return (p.get("date") or {}).get("start")
     
     async def update_request_status(self, request_id: str, status: str,
                                     error: str = None):
@@ -416,53 +1418,305 @@ class NotionManager:
     
     def _extract_property(self, page: Dict, prop: str):
         p = page["properties"].get(prop, {})
-        prop_type = p.get("type", "")
-        
-        if prop_type == "title":
-            return p["title"][0]["text"]["content"] if p.get("title") else ""
-        elif prop_type == "rich_text":
-            return p["rich_text"][0]["text"]["content"] if p.get("rich_text") else ""
-        elif prop_type == "number":
-            return p.get("number", 0)
-        elif prop_type == "select":
-            return p["select"]["name"] if p.get("select") else ""
-        elif prop_type == "date":
-            return p["date"]["start"] if p.get("date") else ""
-        elif prop_type == "phone_number":
-            return p.get("phone_number", "")
-        return ""
+        return PROPERTY_EXTRACTORS.get(p.get("type", ""), _prop_empty)(p)
     
     def _get_select(self, page: Dict, prop: str):
         p = page["properties"].get(prop, {})
         return p["select"]["name"] if p.get("select") else ""
 
-    def _get_multi_select(self, page: Dict, prop: str):
-        p = page["properties"].get(prop, {})
-        return [v["name"] for v in p.get("multi_select", [])]
+    def _get_multi_select(self, page: Dict, prop: str):
+        p = page["properties"].get(prop, {})
+        return [v["name"] for v in p.get("multi_select", [])]
+
+    def _get_number(self, page: Dict, prop: str):
+        return page["properties"].get(prop, {}).get("number")
+
+    def _get_date(self, page: Dict, prop: str):
+        p = page["properties"].get(prop, {})
+        return p["date"]["start"] if p.get("date") else None
+    
+    def _get_rich_text_value(self, page: Dict, prop: str) -> str:
+        p = page["properties"].get(prop, {})
+        if p.get("rich_text"):
+            return p["rich_text"][0]["plain_text"].strip()
+        return ""
+
+
+
+
+####
+
+class OllamaHTTPPool:
+    """모든 워커가 공유하는 Ollama용 장수명 httpx 클라이언트 (keep-alive 커넥션 풀)"""
+
+    def __init__(self, max_connections: int = None, max_keepalive: int = None,
+                 keepalive_expiry: float = None, http2: bool = None):
+        self.max_connections = max_connections or config.OLLAMA_MAX_CONNECTIONS
+        self.max_keepalive = max_keepalive or config.OLLAMA_MAX_KEEPALIVE
+        self.keepalive_expiry = config.OLLAMA_KEEPALIVE_EXPIRY if keepalive_expiry is None else keepalive_expiry
+        self.http2 = config.OLLAMA_HTTP2 if http2 is None else http2
+
+        self._client: Optional[httpx.AsyncClient] = None
+        # httpx 풀 내부 대기는 관찰할 수 없으므로 같은 크기의 세마포어로 대기 시간을 측정
+        self._slots = asyncio.Semaphore(self.max_connections)
+        self._active = 0
+        self._waiting = 0
+        self._total_requests = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("⚠️ h2 패키지가 없어 HTTP/1.1로 연결합니다 (pip install httpx[http2])")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=httpx.Timeout(config.OLLAMA_TIMEOUT),
+                http2=http2
+            )
+        return self._client
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        waited = time.perf_counter() - started
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        self._total_requests += 1
+        self._active += 1
+        try:
+            return await self._get_client().post(url, **kwargs)
+        finally:
+            self._active -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        open_connections = None
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        if pool is not None:
+            open_connections = len(getattr(pool, "connections", []))
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "active": self._active,
+            "waiting": self._waiting,
+            "open_connections": open_connections,
+            "total_requests": self._total_requests,
+            "avg_wait_ms": round(self._total_wait / self._total_requests * 1000, 2) if self._total_requests else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2)
+        }
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("🔌 Ollama HTTP 클라이언트 종료")
+        self._client = None
+
+ollama_pool = OllamaHTTPPool()
+
+
+class AnalysisCache:
+    """analyze_question 결과 캐시 (정확 일치 + 선택적 유사 질문 매칭, TTL/LRU, 디스크 저장)
+
+    날짜 범위는 저장하지 않는다. "이번 달" 같은 상대 표현은 적중 시점에 다시 계산해야 하기 때문.
+    model에는 모델명과 분석 모드(split/combined)를 함께 넘겨 모드가 바뀌면 다른 항목으로 본다.
+    """
+
+    # 유사 질문이라도 묻는 테이블 키워드는 같아야 함 ("입소"/"퇴소"는 한 글자 차이라 바이그램 점수가 높다)
+    TABLE_KEYWORDS = (("입퇴소",), ("입소", "재원"), ("퇴소", "퇴원"))
+
+    def __init__(self, path: Path = None, ttl: float = None, max_entries: int = None,
+                 similarity: float = None):
+        self.path = Path(path or config.ANALYSIS_CACHE_PATH)
+        self.ttl = config.ANALYSIS_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or config.ANALYSIS_CACHE_MAX_ENTRIES
+        self.similarity = config.ANALYSIS_CACHE_SIMILARITY if similarity is None else similarity
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._write_lock = threading.Lock()
+        # 저장할 스냅샷 번호 / 마지막으로 파일에 쓴 번호 (늦게 끝난 백그라운드 저장이 새 내용을 덮지 않도록)
+        self._generation = 0
+        self._written_generation = 0
+        self._load()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        text = unicodedata.normalize("NFKC", question).lower()
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    @classmethod
+    def _table_keywords(cls, text: str) -> Tuple[bool, ...]:
+        return tuple(any(keyword in text for keyword in group) for group in cls.TABLE_KEYWORDS)
+
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        text = text.replace(" ", "")
+        return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+    def get(self, question: str, model: str) -> Optional[Union[ReportQuery, List[ReportQuery]]]:
+        key = self.normalize(question)
+        now = time.time()
+        entry = self.entries.get(key)
+
+        if entry is None and self.similarity > 0:
+            entry = self._find_similar(key, model, now)
+
+        if entry is None or entry["model"] != model or now - entry["created_at"] > self.ttl:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(entry["key"])
+        self.hits += 1
+        # 호출자가 date_range/filters를 고쳐도 캐시 항목은 그대로 두도록 깊은 복사본으로
+        queries = [ReportQuery(**copy.deepcopy(q)) for q in entry["queries"]]
+        return queries if entry["is_list"] else queries[0]
+
+    def _find_similar(self, key: str, model: str, now: float) -> Optional[Dict]:
+        grams = self._bigrams(key)
+        tables = self._table_keywords(key)
+        best, best_score = None, 0.0
+        for entry in self.entries.values():
+            if entry["model"] != model or now - entry["created_at"] > self.ttl:
+                continue
+            if self._table_keywords(entry["key"]) != tables:
+                continue
+            other = self._bigrams(entry["key"])
+            score = len(grams & other) / len(grams | other)
+            if score < self.similarity or score <= best_score:
+                continue
+            # 필터 값(선생님 이름 등)이 새 질문에 그대로 없으면 다른 질문으로 본다
+            values = [str(v) for q in entry["queries"] for v in (q.get("filters") or {}).values()]
+            if all(self.normalize(v) in key for v in values):
+                best, best_score = entry, score
+        if best is not None:
+            logger.debug(f"유사 질문 캐시 매칭 ({best_score:.2f}): {best['key']}")
+        return best
+
+    def put(self, question: str, result: Union[ReportQuery, List[ReportQuery]], model: str):
+        key = self.normalize(question)
+        queries = result if isinstance(result, list) else [result]
+        stored = []
+        for q in queries:
+            d = asdict(q)
+            d["date_range"] = None
+            stored.append(d)
+
+        self.entries[key] = {
+            "key": key,
+            "model": model,
+            "created_at": time.time(),
+            "is_list": isinstance(result, list),
+            "queries": stored
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self._schedule_save()
 
-    def _get_number(self, page: Dict, prop: str):
-        return page["properties"].get(prop, {}).get("number")
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
 
-    def _get_date(self, page: Dict, prop: str):
-        p = page["properties"].get(prop, {})
-        return p["date"]["start"] if p.get("date") else None
-    
-    def _get_rich_text_value(self, page: Dict, prop: str) -> str:
-        p = page["properties"].get(prop, {})
-        if p.get("rich_text"):
-            return p["rich_text"][0]["plain_text"].strip()
-        return ""
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            for entry in data:
+                if now - entry["created_at"] <= self.ttl:
+                    self.entries[entry["key"]] = entry
+            logger.info(f"🗂️ 분석 캐시 로드: {len(self.entries)}건")
+        except Exception as e:
+            logger.warning(f"⚠️ 분석 캐시 로드 실패, 빈 캐시로 시작: {str(e)}")
+            self.entries.clear()
 
+    def _schedule_save(self):
+        """추가가 몰려도 ANALYSIS_CACHE_SAVE_DELAY마다 한 번만, 이벤트 루프 밖(스레드)에서 저장"""
+        self._dirty = True
+        if self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 이벤트 루프 밖(스크립트 등)에서는 바로 저장
+            self.flush()
+            return
+        self._save_handle = loop.call_later(config.ANALYSIS_CACHE_SAVE_DELAY, self._save_in_background)
 
+    def _save_in_background(self):
+        self._save_handle = None
+        if not self._dirty:
+            return
+        self._dirty = False
+        # 항목 dict는 만든 뒤 바뀌지 않으므로 목록만 복사해서 넘긴다
+        self._generation += 1
+        snapshot = list(self.entries.values())
+        asyncio.get_running_loop().run_in_executor(None, self._write, snapshot, self._generation)
 
+    def flush(self):
+        """예약된 저장을 취소하고 바뀐 내용이 있으면 지금 저장 (서버 종료 시)"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._dirty:
+            self._dirty = False
+            self._generation += 1
+            self._write(list(self.entries.values()), self._generation)
+
+    def _write(self, entries: List[Dict], generation: int):
+        with self._write_lock:
+            if generation < self._written_generation:
+                # 이미 더 새로운 스냅샷이 저장됨 (flush 이후에 실행된 백그라운드 저장)
+                return
+            self._written_generation = generation
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+                with tmp_path.open("w", encoding="utf-8") as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.warning(f"⚠️ 분석 캐시 저장 실패: {str(e)}")
 
-####
 
 class OllamaAnalyzer:
-    def __init__(self):
+    def __init__(self, http_pool: Optional[OllamaHTTPPool] = None):
         self.url = f"{config.OLLAMA_URL}/api/generate"
         self.model = config.OLLAMA_ENTITY_MODEL
+        self.http = http_pool or ollama_pool
+        self.cache = AnalysisCache() if config.ANALYSIS_CACHE_ENABLED else None
     
+    @property
+    def cache_tag(self) -> str:
+        """분석 캐시 구분값 (모델명 + 분석 모드, 모드가 바뀌면 결과가 달라지므로)"""
+        return f"{self.model}/{config.ANALYZE_MODE}"
+
+    def _parse_date_range_safe(self, question: str) -> Optional[Dict[str, str]]:
+        """_parse_date_range와 같지만 "2025년 13월"처럼 잘못된 날짜 표현이면 None"""
+        try:
+            return self._parse_date_range(question)
+        except Exception as e:
+            logger.error(f"❌ 날짜 범위 파싱 실패: {str(e)}")
+            return None
+
     def _parse_date_range(self, question: str) -> Optional[Dict[str, str]]:
         """질문에서 날짜 범위를 파싱하여 반환"""
         question_lower = question.lower()
@@ -619,22 +1873,20 @@ class OllamaAnalyzer:
     
     async def _call_ollama(self, prompt: str) -> str:
         """Ollama API 호출 헬퍼 메서드"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    self.url,
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": False
-                    },
-                    timeout=30.0
-                )
-                result = response.json()
-                return result.get("response", "").strip()
-            except Exception as e:
-                logger.error(f"❌ Ollama API 호출 실패: {str(e)}")
-                raise
+        try:
+            response = await self.http.post(
+                self.url,
+                json={
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": False
+                }
+            )
+            result = response.json()
+            return result.get("response", "").strip()
+        except Exception as e:
+            logger.error(f"❌ Ollama API 호출 실패: {str(e)}")
+            raise
     
     def _parse_json_response(self, generated_text: str) -> Optional[Union[dict, list, str]]:
         """AI 응답에서 JSON 추출"""
@@ -683,144 +1935,121 @@ class OllamaAnalyzer:
         return query_data
     
     async def _extract_filters(self, question: str) -> Dict[str, Any]:
-        """1단계: 필터 값 추출"""
+        """1단계: 필터 값 추출 (호출 실패나 JSON이 없는 응답은 예외 → 기본값을 쓰고 캐시하지 않음)"""
         logger.info("🔍 1단계: 필터 추출 중...")
         
         prompt = f"""{FILTER_SELECT_PROMPT}
 질문: {question}
 """
         
-        try:
-            response = await self._call_ollama(prompt)
-            filters = self._parse_json_response(response)
-            
-            if isinstance(filters, dict):
-                logger.info(f"✅ 필터 추출 완료: {list(filters.keys())}")
-                return filters
-            else:
-                logger.warning("⚠️ 필터 추출 실패, 빈 필터 반환")
-                return {}
-        except Exception as e:
-            logger.error(f"❌ 필터 추출 실패: {str(e)}")
-            return {}
+        response = await self._call_ollama(prompt)
+        filters = self._parse_json_response(response)
+        
+        if isinstance(filters, dict):
+            logger.info(f"✅ 필터 추출 완료: {list(filters.keys())}")
+            return filters
+        raise ValueError(f"필터 JSON을 찾을 수 없음 (응답: {response[:100]})")
     
     async def _select_tables(self, question: str) -> Union[str, List[str]]:
-        """2단계: 테이블 유형 선택"""
+        """2단계: 테이블 유형 선택 (호출 실패나 알아볼 수 없는 응답은 예외 → 질문 기반 추론, 캐시하지 않음)"""
         logger.info("📋 2단계: 테이블 선택 중...")
         
         prompt = TABLE_SELECT_PROMPT.replace("{question}", question)
         
-        try:
-            response = await self._call_ollama(prompt)
-            response = response.strip()
-            logger.debug(f"테이블 선택 응답: {response}")
-            
-            # 응답에서 JSON 추출 시도
-            table_data = self._parse_json_response(response)
-            if isinstance(table_data, list):
-                # 리스트 형식
+        response = await self._call_ollama(prompt)
+        response = response.strip()
+        logger.debug(f"테이블 선택 응답: {response}")
+        
+        # 응답에서 JSON 추출 시도
+        table_data = self._parse_json_response(response)
+        if isinstance(table_data, list):
+            # 리스트 형식
+            logger.info(f"✅ 테이블 선택 완료: {table_data}")
+            return table_data
+        elif isinstance(table_data, str):
+            # 문자열 형식
+            if table_data in ["class", "discharge"]:
                 logger.info(f"✅ 테이블 선택 완료: {table_data}")
                 return table_data
-            elif isinstance(table_data, str):
-                # 문자열 형식
-                if table_data in ["class", "discharge"]:
-                    logger.info(f"✅ 테이블 선택 완료: {table_data}")
-                    return table_data
-            
-            # 직접 문자열 매칭
-            response_lower = response.lower()
-            
-            # "class", "discharge" 단일 테이블
-            if response_lower == "class" or (response_lower.startswith("class") and "discharge" not in response_lower):
-                logger.info("✅ 테이블 선택 완료: class")
-                return "class"
-            elif response_lower == "discharge" or (response_lower.startswith("discharge") and "class" not in response_lower):
-                logger.info("✅ 테이블 선택 완료: discharge")
-                return "discharge"
-            
-            # "class"와 "discharge" 둘 다 포함된 경우
-            if "class" in response_lower and "discharge" in response_lower:
-                logger.info("✅ 테이블 선택 완료: [class, discharge]")
-                return ["class", "discharge"]
-            
-            # 리스트 형식 문자열 파싱 시도
-            if "[" in response and "]" in response:
-                # "[class, discharge]" 형식 추출
-                list_match = re.search(r'\[([^\]]+)\]', response)
-                if list_match:
-                    items = [item.strip().strip('"\'') for item in list_match.group(1).split(",")]
-                    valid_items = [item for item in items if item in ["class", "discharge"]]
-                    if len(valid_items) == 2:
-                        logger.info("✅ 테이블 선택 완료: [class, discharge]")
-                        return ["class", "discharge"]
-                    elif len(valid_items) == 1:
-                        logger.info(f"✅ 테이블 선택 완료: {valid_items[0]}")
-                        return valid_items[0]
-            
-            # 질문 내용 기반 추론
-            question_lower = question.lower()
-            if any(keyword in question_lower for keyword in ["입퇴소", "입소.*퇴소", "퇴소.*입소"]):
-                logger.info("✅ 질문 기반 추론: [class, discharge]")
-                return ["class", "discharge"]
-            elif any(keyword in question_lower for keyword in ["퇴소", "퇴원", "사유", "증감"]):
-                logger.info("✅ 질문 기반 추론: discharge")
-                return "discharge"
-            elif any(keyword in question_lower for keyword in ["입소", "재원", "현재 학생", "담당 학생"]):
-                logger.info("✅ 질문 기반 추론: class")
-                return "class"
-            
-            # 기본값: class
-            logger.warning(f"⚠️ 테이블 선택 실패 (응답: {response[:100]}), 기본값 'class' 반환")
+        
+        # 직접 문자열 매칭
+        response_lower = response.lower()
+        
+        # "class", "discharge" 단일 테이블
+        if response_lower == "class" or (response_lower.startswith("class") and "discharge" not in response_lower):
+            logger.info("✅ 테이블 선택 완료: class")
             return "class"
-        except Exception as e:
-            logger.error(f"❌ 테이블 선택 실패: {str(e)}")
-            # 예외 발생 시 질문 기반 추론
-            question_lower = question.lower()
-            if any(keyword in question_lower for keyword in ["입퇴소"]):
-                return ["class", "discharge"]
-            elif any(keyword in question_lower for keyword in ["퇴소", "퇴원"]):
-                return "discharge"
+        elif response_lower == "discharge" or (response_lower.startswith("discharge") and "class" not in response_lower):
+            logger.info("✅ 테이블 선택 완료: discharge")
+            return "discharge"
+        
+        # "class"와 "discharge" 둘 다 포함된 경우
+        if "class" in response_lower and "discharge" in response_lower:
+            logger.info("✅ 테이블 선택 완료: [class, discharge]")
+            return ["class", "discharge"]
+        
+        # 리스트 형식 문자열 파싱 시도
+        if "[" in response and "]" in response:
+            # "[class, discharge]" 형식 추출
+            list_match = re.search(r'\[([^\]]+)\]', response)
+            if list_match:
+                items = [item.strip().strip('"\'') for item in list_match.group(1).split(",")]
+                valid_items = [item for item in items if item in ["class", "discharge"]]
+                if len(valid_items) == 2:
+                    logger.info("✅ 테이블 선택 완료: [class, discharge]")
+                    return ["class", "discharge"]
+                elif len(valid_items) == 1:
+                    logger.info(f"✅ 테이블 선택 완료: {valid_items[0]}")
+                    return valid_items[0]
+        
+        # 질문 내용 기반 추론
+        question_lower = question.lower()
+        if any(keyword in question_lower for keyword in ["입퇴소", "입소.*퇴소", "퇴소.*입소"]):
+            logger.info("✅ 질문 기반 추론: [class, discharge]")
+            return ["class", "discharge"]
+        elif any(keyword in question_lower for keyword in ["퇴소", "퇴원", "사유", "증감"]):
+            logger.info("✅ 질문 기반 추론: discharge")
+            return "discharge"
+        elif any(keyword in question_lower for keyword in ["입소", "재원", "현재 학생", "담당 학생"]):
+            logger.info("✅ 질문 기반 추론: class")
             return "class"
+        
+        raise ValueError(f"응답에서 테이블을 찾을 수 없음 (응답: {response[:100]})")
+
+    def _infer_tables_from_question(self, question: str) -> Union[str, List[str]]:
+        """LLM 응답을 쓸 수 없을 때 질문 키워드로 테이블 추론"""
+        question_lower = question.lower()
+        if any(keyword in question_lower for keyword in ["입퇴소"]):
+            return ["class", "discharge"]
+        elif any(keyword in question_lower for keyword in ["퇴소", "퇴원"]):
+            return "discharge"
+        return "class"
     
+    # 기본 컬럼 (항상 포함) + 테이블별 기본 컬럼
+    BASE_COLUMNS = ("student_name", "start_date", "grade", "class_name")
+    TABLE_COLUMNS = {
+        "class": ("parent_phone_number",),
+        "discharge": ("discharge_date", "discharging_reason", "parent_phone_number"),
+    }
+    # 질문에서 명시적으로 언급된 컬럼 확인용 키워드
+    COLUMN_KEYWORDS = {
+        "student_name": ["학생명", "학생", "이름"],
+        "teacher_name": ["선생님", "담당", "원장"],
+        "class_name": ["반", "수업", "과목"],
+        "grade": ["학년"],
+        "school_name": ["학교"],
+        "start_date": ["입소일", "입소일자", "시작일"],
+        "discharge_date": ["퇴소일", "퇴소일자", "퇴원일"],
+        "discharging_reason": ["사유", "퇴원사유", "퇴소사유"],
+        "parent_phone_number": ["전화", "연락처", "학부모"]
+    }
+
     def _extract_columns_from_question(self, question: str, table_type: str) -> List[str]:
-        """질문에서 필요한 컬럼 추출"""
+        """질문에서 필요한 컬럼 추출 (언급된 컬럼 → 기본 컬럼 → 테이블별 기본 컬럼 순, 중복 없음)"""
         question_lower = question.lower()
-        columns = []
-        
-        # 기본 컬럼 (항상 포함)
-        base_columns = ["student_name", "start_date", "grade", "class_name"]
-        
-        # 테이블별 기본 컬럼
-        if table_type == "class":
-            base_columns.extend(["student_name", "start_date", "grade", "class_name", "parent_phone_number"])
-        elif table_type == "discharge":
-            base_columns.extend(["student_name", "grade", "class_name", "discharge_date", "start_date", "discharging_reason", "parent_phone_number"])
-        
-        # 질문에서 명시적으로 언급된 컬럼 확인
-        column_keywords = {
-            "student_name": ["학생명", "학생", "이름"],
-            "teacher_name": ["선생님", "담당", "원장"],
-            "class_name": ["반", "수업", "과목"],
-            "grade": ["학년"],
-            "school_name": ["학교"],
-            "start_date": ["입소일", "입소일자", "시작일"],
-            "discharge_date": ["퇴소일", "퇴소일자", "퇴원일"],
-            "discharging_reason": ["사유", "퇴원사유", "퇴소사유"],
-            "parent_phone_number": ["전화", "연락처", "학부모"]
-        }
-        
-        # 질문에서 언급된 컬럼 추가
-        for col, keywords in column_keywords.items():
-            if any(keyword in question_lower for keyword in keywords):
-                if col not in columns:
-                    columns.append(col)
-        
-        # 기본 컬럼 추가 (중복 제거)
-        for col in base_columns:
-            if col not in columns:
-                columns.append(col)
-        
-        return columns
+        mentioned = [col for col, keywords in self.COLUMN_KEYWORDS.items()
+                     if any(keyword in question_lower for keyword in keywords)]
+        return list(dict.fromkeys([*mentioned, *self.BASE_COLUMNS, *self.TABLE_COLUMNS.get(table_type, ())]))
     
     def _determine_sort_by(self, question: str, table_type: str) -> Optional[str]:
         """정렬 기준 결정"""
@@ -889,16 +2118,125 @@ class OllamaAnalyzer:
             logger.info("✅ JSON 쿼리 생성 완료")
             return query_obj
     
+    async def _run_analysis_stages(self, question: str) -> Tuple[Dict[str, Any], Union[str, List[str]], Optional[Dict[str, str]], bool]:
+        """설정된 모드로 (필터, 테이블 유형, 날짜 범위, 기본값 사용 여부)를 구함
+
+        ANALYZE_DEADLINE은 분석 전체 마감이므로 통합 → 2회 호출 전환 시에는 남은 시간만 넘긴다.
+        """
+        if config.ANALYZE_MODE == "combined":
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + config.ANALYZE_DEADLINE
+            combined = await self._analyze_combined(question, config.ANALYZE_DEADLINE)
+            if combined is not None:
+                return combined
+            logger.warning("⚠️ 통합 프롬프트 결과를 쓸 수 없어 2회 호출 방식으로 전환")
+            return await self._run_split_stages(question, max(0.0, deadline - loop.time()))
+        return await self._run_split_stages(question, config.ANALYZE_DEADLINE)
+
+    async def _analyze_combined(self, question: str, timeout: float) -> Optional[Tuple[Dict[str, Any], Union[str, List[str]], Optional[Dict[str, str]], bool]]:
+        """통합 프롬프트 1회 호출로 필터/테이블/날짜 표현을 함께 추출 (실패 시 None)"""
+        logger.info("🔍 통합 프롬프트 분석 중...")
+
+        prompt = COMBINED_SELECT_PROMPT.replace("{question}", question)
+
+        try:
+            response = await asyncio.wait_for(self._call_ollama(prompt), timeout=timeout)
+        except Exception as e:
+            logger.error(f"❌ 통합 프롬프트 호출 실패: {str(e) or type(e).__name__}")
+            return None
+
+        data = self._parse_json_response(response)
+        if not isinstance(data, dict):
+            logger.debug(f"통합 프롬프트 응답: {response}")
+            return None
+
+        filters = data.get("filters") or {}
+        if not isinstance(filters, dict):
+            return None
+
+        tables = data.get("tables")
+        if isinstance(tables, str):
+            tables = [tables]
+        if not isinstance(tables, list):
+            return None
+        tables = [t for t in ("class", "discharge") if t in [str(v).strip().lower() for v in tables]]
+        if not tables:
+            return None
+        table_type = tables if len(tables) == 2 else tables[0]
+
+        # 날짜는 질문 원문을 우선 파싱하고, 안 되면 모델이 뽑은 기간 표현으로 재시도
+        parsed_date_range = self._parse_date_range_safe(question)
+        date_intent = data.get("date_intent")
+        if parsed_date_range is None and isinstance(date_intent, str) and date_intent.strip():
+            parsed_date_range = self._parse_date_range_safe(date_intent)
+
+        logger.info(f"✅ 통합 분석 완료: 필터 {list(filters.keys())}, 테이블 {table_type}")
+        return filters, table_type, parsed_date_range, False
+
+    async def _run_split_stages(self, question: str, timeout: float) -> Tuple[Dict[str, Any], Union[str, List[str]], Optional[Dict[str, str]], bool]:
+        """필터 추출과 테이블 선택을 공통 마감 시간(timeout초) 안에서 동시에 실행
+
+        마감 시간 안에 끝나지 않은 단계는 취소하고 단계별 기본값을 사용한다.
+        날짜 범위 파싱은 정규식 몇 개라 스레드로 넘기지 않고 바로 실행한다.
+        """
+        filters_task = asyncio.create_task(self._extract_filters(question))
+        tables_task = asyncio.create_task(self._select_tables(question))
+        tasks = [filters_task, tables_task]
+        parsed_date_range = self._parse_date_range_safe(question)
+
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        degraded = False
+
+        def outcome(task, stage: str, fallback):
+            nonlocal degraded
+            if task not in done:
+                logger.warning(f"⚠️ {stage} 마감 시간({timeout:.1f}초) 초과, 기본값 사용")
+                degraded = True
+                return fallback()
+            if task.exception() is not None:
+                logger.error(f"❌ {stage} 실패: {str(task.exception())}")
+                degraded = True
+                return fallback()
+            return task.result()
+
+        filters = outcome(filters_task, "필터 추출", dict)
+        table_type = outcome(tables_task, "테이블 선택", lambda: self._infer_tables_from_question(question))
+        return filters, table_type, parsed_date_range, degraded
+
+    def _date_range_for_table(self, parsed_date_range: Optional[Dict[str, str]],
+                              target_table: Optional[str]) -> Optional[Dict[str, str]]:
+        """테이블 타입에 따라 날짜 속성을 붙인 날짜 범위"""
+        if not parsed_date_range:
+            return None
+        date_range_with_property = parsed_date_range.copy()
+        if target_table == "class":
+            date_range_with_property["property"] = "start_date"
+        elif target_table == "discharge":
+            date_range_with_property["property"] = "discharge_date"
+        return date_range_with_property
+
     async def analyze_question(self, question: str) -> Union[ReportQuery, List[ReportQuery]]:
         """자연어 질문을 구조화된 쿼리로 변환 (3단계 프로세스)"""
         logger.info(f"🤖 AI 분석 시작: {question[:50]}...")
+
+        if self.cache:
+            cached = self.cache.get(question, self.cache_tag)
+            if cached is not None:
+                # 상대 날짜("이번 달" 등)는 캐시 시점이 아니라 지금 기준으로 다시 계산
+                parsed_date_range = self._parse_date_range_safe(question)
+                for q in (cached if isinstance(cached, list) else [cached]):
+                    q.date_range = self._date_range_for_table(parsed_date_range, q.target_table)
+                logger.info("⚡ 분석 캐시 적중")
+                return cached
         
         try:
-            # 1단계: 필터 추출
-            filters = await self._extract_filters(question)
-            
-            # 2단계: 테이블 선택
-            table_type = await self._select_tables(question)
+            # 1~2단계 + 날짜 범위 계산은 서로 의존하지 않으므로 동시에 실행
+            filters, table_type, parsed_date_range, degraded = await self._run_analysis_stages(question)
             
             # 3단계: JSON 쿼리 생성 (로직 처리, await 불필요)
             query_data = self._generate_json_query(question, filters, table_type)
@@ -906,9 +2244,6 @@ class OllamaAnalyzer:
             if not query_data or not isinstance(query_data, (dict, list)):
                 logger.error("AI output (for debugging): %s", query_data)
                 raise ValueError("JSON not found or invalid in model output")
-
-            # 날짜 범위를 로직으로 계산
-            parsed_date_range = self._parse_date_range(question)
             
             # If model returned a list of query objects, convert to list of ReportQuery
             if isinstance(query_data, list):
@@ -918,21 +2253,12 @@ class OllamaAnalyzer:
                         continue
                     target_table = item.get("target_table") or (item.get("target_tables", [None])[0] if isinstance(item.get("target_tables"), list) else item.get("target_tables"))
                     
-                    # 테이블 타입에 따라 날짜 속성 설정
-                    date_range_with_property = None
-                    if parsed_date_range:
-                        date_range_with_property = parsed_date_range.copy()
-                        if target_table == "class":
-                            date_range_with_property["property"] = "start_date"
-                        elif target_table == "discharge":
-                            date_range_with_property["property"] = "discharge_date"
-                    
                     q = ReportQuery(
                         target_table=target_table,
                         filters=item.get("filters", {}),
                         columns=item.get("columns", []),
                         aggregations=item.get("aggregations"),
-                        date_range=date_range_with_property
+                        date_range=self._date_range_for_table(parsed_date_range, target_table)
                     )
                     queries.append(q)
                 logger.info(f"✅ 쿼리 생성 완료: {', '.join([str(q.target_table) for q in queries])} 테이블")
@@ -940,6 +2266,8 @@ class OllamaAnalyzer:
                     for q in queries:
                         if q.date_range:
                             logger.info(f"📅 {q.target_table} 테이블 날짜 범위 ({q.date_range.get('property')}): {q.date_range['start']} ~ {q.date_range['end']}")
+                if self.cache and not degraded:
+                    self.cache.put(question, queries, self.cache_tag)
                 return queries
 
             # Normalize target table(s) for single-object response
@@ -951,21 +2279,12 @@ class OllamaAnalyzer:
                 elif isinstance(tts, str):
                     target_table = tts
 
-            # 테이블 타입에 따라 날짜 속성 설정
-            date_range_with_property = None
-            if parsed_date_range:
-                date_range_with_property = parsed_date_range.copy()
-                if target_table == "class":
-                    date_range_with_property["property"] = "start_date"
-                elif target_table == "discharge":
-                    date_range_with_property["property"] = "discharge_date"
-
             query = ReportQuery(
                 target_table=target_table,
                 filters=query_data.get("filters", {}),
                 columns=query_data.get("columns", []),
                 aggregations=query_data.get("aggregations"),
-                date_range=date_range_with_property
+                date_range=self._date_range_for_table(parsed_date_range, target_table)
             )
 
             logger.info(f"✅ 쿼리 생성 완료: {query.target_table} 테이블")
@@ -973,6 +2292,8 @@ class OllamaAnalyzer:
                 if query.date_range:
                     logger.info(f"📅 날짜 범위 ({query.date_range.get('property')}): {query.date_range['start']} ~ {query.date_range['end']}")
             print(query)
+            if self.cache and not degraded:
+                self.cache.put(question, query, self.cache_tag)
             return query
                 
         except Exception as e:
@@ -990,25 +2311,395 @@ class OllamaAnalyzer:
 
 ####
 
+def _solid_fill(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+class ReportStyles:
+    """보고서 셀 스타일 레지스트리
+
+    Font/Fill/Alignment 정의는 프로세스당 한 번만 만들고, 워크북에서 스타일이 처음 쓰일 때
+    한 번 해석한 스타일 인덱스를 이름별로 기억해 두었다가 다음 셀부터는 그대로 복사한다
+    (셀마다 스타일 객체를 새로 만들거나 해시하지 않음). NamedStyle로 등록하지 않으므로
+    styles.xml에는 셀마다 스타일을 지정하던 때와 같은 항목만 들어간다.
+    STRIPED에 있는 스타일은 줄무늬 배경이 더해진 "<이름>_stripe" 변형을 쓸 수 있다.
+    """
+
+    _WHITE_BOLD = dict(bold=True, color="FFFFFF")
+    _CENTER = Alignment(horizontal="center")
+    _MIDDLE = Alignment(horizontal="center", vertical="center")
+    _LEFT = Alignment(horizontal="left")
+
+    SPECS: Dict[str, Dict[str, Any]] = {
+        # 시트 제목
+        "title_blue": dict(font=Font(size=16, **_WHITE_BOLD), fill=_solid_fill("366092"), alignment=_MIDDLE),
+        "title_purple": dict(font=Font(size=16, **_WHITE_BOLD), fill=_solid_fill("7030A0"), alignment=_MIDDLE),
+        "title_orange": dict(font=Font(size=16, **_WHITE_BOLD), fill=_solid_fill("C55A11"), alignment=_MIDDLE),
+        "title_detail": dict(font=Font(size=14, **_WHITE_BOLD), fill=_solid_fill("366092"), alignment=_CENTER),
+        # 표 헤더 / 섹션 제목
+        "header": dict(font=Font(**_WHITE_BOLD), fill=_solid_fill("4472C4"), alignment=_CENTER),
+        "section_month": dict(font=Font(size=11, **_WHITE_BOLD), fill=_solid_fill("4472C4"), alignment=_MIDDLE),
+        "section_subject": dict(font=Font(size=11, **_WHITE_BOLD), fill=_solid_fill("7030A0"), alignment=_MIDDLE),
+        "section_discharged": dict(font=Font(size=12, **_WHITE_BOLD), fill=_solid_fill("FF0000"), alignment=_LEFT),
+        "section_enrolled": dict(font=Font(size=12, **_WHITE_BOLD), fill=_solid_fill("00B050"), alignment=_LEFT),
+        "average": dict(font=Font(size=11, **_WHITE_BOLD), fill=_solid_fill("C55A11"), alignment=_MIDDLE),
+        "rank_header_9": dict(font=Font(size=9, **_WHITE_BOLD), fill=_solid_fill("70AD47"), alignment=_MIDDLE),
+        "rank_header_10": dict(font=Font(size=10, **_WHITE_BOLD), fill=_solid_fill("70AD47"), alignment=_MIDDLE),
+        # 데이터 셀
+        "plain": dict(font=DEFAULT_FONT),
+        "net_up": dict(font=Font(color="00B050", bold=True)),
+        "net_down": dict(font=Font(color="FF0000", bold=True)),
+        "rank_cell_9": dict(font=Font(size=9), alignment=_MIDDLE),
+        "rank_cell_10": dict(font=Font(size=10), alignment=_MIDDLE),
+        "detail": dict(font=DEFAULT_FONT, alignment=_LEFT),
+        "status_discharged": dict(font=Font(color="FF0000", bold=True), alignment=_LEFT),
+        "status_enrolled": dict(font=Font(color="00B050", bold=True), alignment=_LEFT),
+    }
+    STRIPED = ("plain", "net_up", "net_down", "rank_cell_9", "rank_cell_10",
+               "detail", "status_discharged", "status_enrolled")
+    STRIPE_FILL = _solid_fill("F2F2F2")
+
+    @classmethod
+    def apply(cls, cell, name: str) -> None:
+        """셀에 보고서 스타일 적용 (워크북마다 스타일별로 첫 셀에서만 Font/Fill/Alignment를 해석)"""
+        wb = cell.parent.parent
+        resolved = wb.__dict__.setdefault("_report_styles", {})
+        style = resolved.get(name)
+        if style is not None:
+            cell._style = copy.copy(style)
+            return
+        base = name[:-len("_stripe")] if name.endswith("_stripe") else name
+        spec = cls.SPECS[base]
+        if base != name:
+            spec = {**spec, "fill": cls.STRIPE_FILL}
+        for attr, value in spec.items():
+            setattr(cell, attr, value)
+        resolved[name] = copy.copy(cell._style)
+
+    @staticmethod
+    def striped(name: str, row: int) -> str:
+        """짝수 행이면 줄무늬 변형 스타일 이름"""
+        return f"{name}_stripe" if row % 2 == 0 else name
+
+
+class _BufferedSheet:
+    """write-only 시트 앞에 두는 작은 버퍼 (일반 시트의 cell/merge_cells API 흉내)
+
+    요약/추이 시트처럼 크기가 제한된 시트는 기존 시트 생성 코드를 그대로 쓰고,
+    모든 셀이 채워진 뒤 flush()로 행 순서대로 write-only 시트에 내보낸다.
+    """
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._cells: Dict[Tuple[int, int], Any] = {}
+        self.column_dimensions = ws.column_dimensions
+        self.row_dimensions = ws.row_dimensions
+
+    @property
+    def title(self) -> str:
+        return self._ws.title
+
+    def cell(self, row: int, column: int):
+        cell = self._cells.get((row, column))
+        if cell is None:
+            cell = self._cells[(row, column)] = WriteOnlyCell(self._ws)
+        return cell
+
+    def __getitem__(self, coordinate: str):
+        return self.cell(*coordinate_to_tuple(coordinate))
+
+    def __setitem__(self, coordinate: str, value):
+        self[coordinate].value = value
+
+    def merge_cells(self, range_string: str):
+        self._ws.merged_cells.add(range_string)
+
+    def add_chart(self, chart, anchor=None):
+        self._ws.add_chart(chart, anchor)
+
+    def flush(self):
+        if not self._cells:
+            return
+        max_row = max(row for row, _ in self._cells)
+        max_col = max(col for _, col in self._cells)
+        for row in range(1, max_row + 1):
+            self._ws.append([self._cells.get((row, col)) for col in range(1, max_col + 1)])
+        self._cells.clear()
+
+
+class ReportAggregator:
+    """보고서 집계 백엔드 (pandas)
+
+    query_results를 타입이 정해진 DataFrame으로 한 번만 적재하고 (날짜는 datetime64,
+    학년은 정수, 반은 category), 월별 건수 / 과목별 건수 / 퇴소 사유 순위 / 재원기간 통계를
+    group-by 연산으로 계산한다. 값 하나를 해석하는 정규화(사유, 반 목록)만 행 단위로 처리한다.
+    """
+
+    ENROLLMENT_DATE_KEYS = ("start_date", "start", "입소일", "startDate")
+    DISCHARGE_DATE_KEYS = ("discharge_date", "discharge", "퇴소일", "dischargeDate")
+
+    def __init__(self, query_results: Dict):
+        normalized = {k.lower(): v for k, v in query_results.items()} if isinstance(query_results, dict) else {}
+        self.class_rows: List[Dict] = list(normalized.get("class") or [])
+        self.discharge_rows: List[Dict] = list(normalized.get("discharge") or [])
+        self.enrollments = self._frame(self.class_rows, self.ENROLLMENT_DATE_KEYS, joined_class=False)
+        self.discharges = self._frame(self.discharge_rows, self.DISCHARGE_DATE_KEYS, joined_class=True)
+        self._exploded: Dict[str, pd.DataFrame] = {}
+
+    @staticmethod
+    def _parse_dates(values: pd.Series) -> pd.Series:
+        """날짜 값(date 또는 ISO 날짜 문자열) → datetime64 (해석할 수 없으면 NaT)
+
+        같은 날짜가 반복되는 경우가 대부분이라 고유값만 변환한 뒤 위치로 펼친다.
+        """
+        dated = values[values.map(type).isin((str, date, datetime))]
+        uniques = pd.Index(dated.unique())
+        parsed = pd.to_datetime(pd.Index([to_date(value) for value in uniques], dtype=object))
+        return pd.Series(parsed.take(uniques.get_indexer(dated)), index=dated.index).reindex(values.index)
+
+    def _frame(self, rows: List[Dict], date_keys: Tuple[str, ...], joined_class: bool) -> pd.DataFrame:
+        def column(key: str) -> pd.Series:
+            return pd.Series([row.get(key) for row in rows], dtype=object)
+
+        frame = pd.DataFrame(index=pd.RangeIndex(len(rows)))
+
+        # 상세 명단과 같은 원본 날짜 (재원기간 계산/정렬용)
+        start_raw = column("start_date")
+        frame["start_date"] = self._parse_dates(start_raw)
+
+        # 월 분류용 날짜: 대체 키 중 처음으로 값이 있는 것 (Notion 형식의 중첩 dict 지원)
+        # 대부분의 행은 첫 번째 키에 날짜가 있으므로 나머지 행만 하나씩 확인
+        month_raw = column(date_keys[0])
+        irregular = ~month_raw.map(type).isin((str, date, datetime)) | month_raw.eq("")
+        for i in irregular[irregular].index:
+            row = rows[i]
+            value = next((row[key] for key in date_keys if row.get(key)), None)
+            if isinstance(value, dict):
+                value = self._unwrap_date(value, date_keys[0])
+            month_raw[i] = str(value) if value else None
+        frame["month_date"] = self._parse_dates(month_raw)
+        frame["ym"] = frame["month_date"].dt.year * 12 + frame["month_date"].dt.month - 1
+
+        if joined_class:
+            end_raw = column("discharge_date")
+            frame["discharge_date"] = self._parse_dates(end_raw)
+            frame["has_discharge_date"] = frame["discharge_date"].notna()
+            frame["reason"] = column("discharging_reason").map(self._reason_label)
+            # 상세 명단에서의 순서 (퇴소일자 → 입소일자 → 맨 뒤 기준 안정 정렬), 사유 동률 정렬에 사용
+            sort_key = frame["discharge_date"].fillna(frame["start_date"])
+            frame["order"] = pd.Series(range(len(rows)), index=sort_key.sort_values(kind="stable", na_position="last").index)
+
+        frame["grade"] = pd.to_numeric(pd.Series([row.get("grade") for row in rows]), errors="coerce").astype("Int64")
+
+        # 반 값은 종류가 적으므로 고유한 값마다 한 번만 분해
+        memo: Dict[Any, List] = {}
+
+        def subjects(value):
+            key = (list, tuple(value)) if isinstance(value, list) else value
+            result = memo.get(key)
+            if result is None:
+                result = memo[key] = self._subject_list(value, joined_class)
+            return result
+
+        frame["subjects"] = column("class_name").map(subjects)
+        return frame
+
+    @staticmethod
+    def _unwrap_date(value: Dict, default_key: str):
+        value = value.get("date") or value.get("start") or value.get(default_key)
+        if isinstance(value, dict):
+            value = value.get("start")
+        return value
+
+    @staticmethod
+    def _reason_label(value) -> str:
+        if not value:
+            return "기타"
+        if isinstance(value, str):
+            return value.strip() or "기타"
+        return str(value)
+
+    @staticmethod
+    def _subject_list(value, joined: bool) -> List:
+        """반 값을 과목 목록으로 (퇴소 행의 반은 상세 명단에서 ", "로 합쳐진 문자열)"""
+        if joined and isinstance(value, list):
+            value = ", ".join(value)
+        if isinstance(value, list):
+            return value
+        if isinstance(value, str) and "," in value:
+            return [s.strip() for s in value.split(",")]
+        return [value] if value else ["기타"]
+
+    def _by_subject(self, name: str) -> pd.DataFrame:
+        """과목 하나당 한 행으로 펼친 프레임 (name: enrollments / discharges, 프레임당 한 번만 계산)"""
+        if name not in self._exploded:
+            frame = getattr(self, name)
+            columns = ["subjects", "reason", "has_discharge_date", "order"] if name == "discharges" else ["subjects"]
+            exploded = frame[columns].explode("subjects").dropna(subset=["subjects"])
+            self._exploded[name] = exploded.assign(subjects=exploded["subjects"].astype("category"))
+        return self._exploded[name]
+
+    def monthly_counts(self) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        """(년, 월) → (입소 수, 퇴소 수)"""
+        counts = pd.concat({
+            "enrollments": self.enrollments["ym"].value_counts(),
+            "discharges": self.discharges["ym"].value_counts(),
+        }, axis=1).fillna(0).astype(int)
+        return {(int(ym) // 12, int(ym) % 12 + 1): (int(row.enrollments), int(row.discharges))
+                for ym, row in counts.iterrows()}
+
+    def rows_in_month(self, kind: str, year: int, month: int) -> List[Dict]:
+        """해당 월의 원본 행 (kind: enrollments / discharges)"""
+        frame, rows = ((self.enrollments, self.class_rows) if kind == "enrollments"
+                       else (self.discharges, self.discharge_rows))
+        positions = frame.index[frame["ym"].eq(year * 12 + month - 1)]
+        return [rows[i] for i in positions]
+
+    def subject_counts(self) -> List[Dict]:
+        """과목별 입소(재원중)/퇴소 인원 (과목명 순)"""
+        counts = pd.concat({
+            "enrollments": self._by_subject("enrollments").groupby("subjects", observed=True).size(),
+            "discharges": self._by_subject("discharges").groupby("subjects", observed=True).size(),
+        }, axis=1).fillna(0).astype(int)
+        return [
+            {"subject": subject,
+             "enrollments": int(counts.at[subject, "enrollments"]),
+             "discharges": int(counts.at[subject, "discharges"]),
+             "net_change": int(counts.at[subject, "enrollments"] - counts.at[subject, "discharges"])}
+            for subject in sorted(counts.index)
+        ]
+
+    @staticmethod
+    def _rank_reasons(frame: pd.DataFrame, by: List[str]) -> Dict[Tuple, List[Tuple[str, int]]]:
+        """그룹별 퇴소 사유 순위 (건수 내림차순, 동률은 상세 명단에서 먼저 나온 사유 순 — Counter.most_common과 동일)"""
+        if frame.empty:
+            return {}
+        ranked = (frame.groupby([*by, "reason"], observed=True)["order"]
+                  .agg(["size", "min"])
+                  .sort_values(["size", "min"], ascending=[False, True]))
+        result: Dict[Tuple, List[Tuple[str, int]]] = {}
+        for key, count in zip(ranked.index, ranked["size"]):
+            *group, reason = key if isinstance(key, tuple) else (key,)
+            result.setdefault(tuple(group), []).append((reason, int(count)))
+        return result
+
+    def reason_rankings(self) -> Dict[str, List]:
+        """월별 / 과목별 / 전체 퇴소 사유 순위 (퇴소일자가 있는 퇴소 학생 기준)"""
+        dated = self.discharges[self.discharges["has_discharge_date"]]
+
+        by_month = dated[dated["discharge_date"].notna()]
+        by_month = by_month.assign(year=by_month["discharge_date"].dt.year, month=by_month["discharge_date"].dt.month)
+        monthly = self._rank_reasons(by_month, ["year", "month"])
+
+        by_subject = self._by_subject("discharges")
+        subjects = self._rank_reasons(by_subject[by_subject["has_discharge_date"]], ["subjects"])
+
+        overall = self._rank_reasons(dated, [])
+
+        return {
+            "monthly": [{"year": int(year), "month": int(month), "reasons": monthly[(year, month)]}
+                        for year, month in sorted(monthly)],
+            "by_subject": [{"subject": subject, "reasons": subjects[(subject,)]}
+                           for (subject,) in sorted(subjects)],
+            "overall": overall.get((), []),
+        }
+
+    def tenure_stats(self) -> Dict[str, Any]:
+        """퇴소 학생 재원기간 통계 (일 단위, 0일 이하 제외)"""
+        days = (self.discharges["discharge_date"] - self.discharges["start_date"]).dt.days if not self.discharges.empty else pd.Series(dtype=float)
+        days = days[days > 0]
+        if days.empty:
+            return {"count": 0, "average_days": 0.0, "median_days": 0.0, "min_days": 0, "max_days": 0,
+                    "average_label": self.format_tenure(0)}
+        average = float(days.mean())
+        return {
+            "count": int(days.size),
+            "average_days": average,
+            "median_days": float(days.median()),
+            "min_days": int(days.min()),
+            "max_days": int(days.max()),
+            "average_label": self.format_tenure(average),
+        }
+
+    def tenure_days(self, name: str) -> List[Optional[int]]:
+        """행별 재원 일수 (enrollments: 오늘까지, discharges: 퇴소일까지, 날짜가 없으면 None)"""
+        frame = getattr(self, name)
+        end = frame["discharge_date"] if name == "discharges" else pd.Timestamp(datetime.now())
+        days = (end - frame["start_date"]).dt.days
+        return [None if pd.isna(d) else int(d) for d in days]
+
+    @staticmethod
+    def format_tenure(days: Optional[float], always_show_days: bool = False) -> str:
+        """재원 일수 표시 문자열 ("3개월 12일"), 30일을 한 달로 계산"""
+        if days is None or days != days:
+            return "-"
+        days = int(days)
+        if days < 30:
+            return f"{days}일"
+        months, remaining = divmod(days, 30)
+        if remaining > 0 or always_show_days:
+            return f"{months}개월 {remaining}일"
+        return f"{months}개월"
+
+    def summary(self) -> Dict[str, Any]:
+        """시트 생성에 쓰이는 집계 묶음 (report_data["aggregates"])"""
+        rankings = self.reason_rankings()
+        return {
+            "subject_counts": self.subject_counts(),
+            "monthly_reasons": rankings["monthly"],
+            "subject_reasons": rankings["by_subject"],
+            "overall_reasons": rankings["overall"],
+            "tenure": self.tenure_stats(),
+        }
+
+
 class EnhancedDischargeReportGenerator:
     """차트 포함 월별 입퇴소 현황 생성기"""
+
+    # 시트별로 집계/표시에 쓰이는 원본 행 컬럼 (테이블 → 컬럼)
+    SHEET_COLUMNS = {
+        "월별 추이": {"class": ("start_date",), "discharge": ("discharge_date",)},
+        # 퇴소 사유 순위 (동률은 상세 명단 순서: 퇴소일자 → 입소일자), 평균 재원기간
+        "월별 요약": {"discharge": ("discharge_date", "start_date", "discharging_reason")},
+        "과목별 입퇴소 추이": {"class": ("class_name",), "discharge": ("class_name",)},
+        "과목별 퇴소 사유 순위 요약": {"discharge": ("class_name", "discharge_date", "start_date", "discharging_reason")},
+        "학생 상세": {
+            "class": ("student_name", "grade", "class_name", "start_date", "parent_phone_number"),
+            "discharge": ("student_name", "grade", "class_name", "start_date", "discharge_date",
+                          "discharging_reason", "parent_phone_number"),
+        },
+    }
     
     def __init__(self, notion_manager):
         self.notion = notion_manager
+
+    @classmethod
+    def required_columns(cls, table_name: str) -> List[str]:
+        """보고서의 모든 시트를 만드는 데 필요한 테이블 컬럼 (시트 순서대로, 중복 없음)"""
+        table = str(table_name).lower()
+        return list(dict.fromkeys(col for tables in cls.SHEET_COLUMNS.values() for col in tables.get(table, ())))
     
     async def generate_monthly_report(self, query_results,
                                       teacher_name: str,
                                       year: Optional[int] = None,
-                                      month: Optional[int] = None
+                                      month: Optional[int] = None,
+                                      trend_months: Optional[int] = None,
+                                      fiscal_year: bool = False,
+                                      monthly_counts: Optional[Dict[Tuple[int, int], Tuple[int, int]]] = None
                                       ) -> Dict:
         """
-        월별 입퇴소 현황 + 12개월 추이 데이터 생성
+        월별 입퇴소 현황 + N개월(또는 회계연도) 추이 데이터 생성
+
+        monthly_counts((년, 월) → (입소 수, 퇴소 수))를 주면 (미러 롤업) 해당 월/추이 건수는
+        그것을 쓰고, 조회한 행은 상세 명단과 행 단위 집계에만 쓴다. 이때 호출 측은 보고서 월의
+        행만 조회하므로 상세 명단과 사유/재원기간 집계도 그 달 기준이 된다.
         
         Returns:
             {
                 "current_month": {...},     # 해당 월 상세
-                "yearly_trend": {...},       # 12개월 추이
-                "detailed_list": [...]       # 학생별 상세 명단
+                "yearly_trend": {...},       # N개월 추이
+                "detailed_list": [...],      # 학생별 상세 명단
+                "aggregates": {...}          # 시트용 집계 (과목별 건수, 퇴소 사유 순위, 재원기간 통계)
             }
         """
         # 년월이 제공되지 않으면 현재 날짜 사용
@@ -1019,19 +2710,26 @@ class EnhancedDischargeReportGenerator:
         
         logger.info(f"📊 {teacher_name} {year}년 {month}월 입퇴소 현황 생성")
         
+        # 0. 입소/퇴소 행을 DataFrame으로 한 번만 적재 (날짜 파싱/집계는 여기서)
+        aggregator = ReportAggregator(query_results)
+        if monthly_counts is None:
+            monthly_counts = aggregator.monthly_counts()
+
         # 1. 해당 월 데이터
         current_data = await self._get_current_month_data(
-            query_results, year, month
+            aggregator, monthly_counts, year, month
         )
         
-        # 2. 12개월 추이 데이터 (과거 11개월 + 현재월)
+        # 2. 추이 데이터 (기본: 과거 11개월 + 현재월)
         yearly_trend = await self._get_yearly_trend(
-            query_results, teacher_name, year, month
+            monthly_counts, teacher_name, year, month,
+            months=trend_months or config.TREND_MONTHS,
+            fiscal_year=fiscal_year
         )
         
         # 3. 학생별 상세 명단 (입소일, 퇴소일 포함)
         detailed_list = await self._get_detailed_student_list(
-            query_results
+            aggregator
         )
         
         return {
@@ -1040,119 +2738,124 @@ class EnhancedDischargeReportGenerator:
             "month": month,
             "current_month": current_data,
             "yearly_trend": yearly_trend,
-            "detailed_list": detailed_list
+            "detailed_list": detailed_list,
+            "aggregates": aggregator.summary()
         }
 
-    async def _get_current_month_data(self, query_results,
+    async def _get_current_month_data(self, aggregator: "ReportAggregator",
+                                     monthly_counts: Dict[Tuple[int, int], Tuple[int, int]],
                                      year: int, 
                                      month: int) -> Dict:
-        """해당 월 입퇴소 데이터"""
+        """해당 월 입퇴소 데이터 (건수는 월별 집계, 명단은 조회한 행)"""
+        enrollment_count, discharge_count = monthly_counts.get((year, month), (0, 0))
 
         # 입소 데이터 (class 테이블)
-        enrollments = await self.year_month_enrollment(
-            query_results, year, month
-        )
+        enrollments = aggregator.rows_in_month("enrollments", year, month)
         
         # 퇴소 데이터 (discharge 테이블)
-        discharges = await self.year_month_discharge(
-            query_results, year, month
-        )
+        discharges = aggregator.rows_in_month("discharges", year, month)
         
         return {
-            "enrollments": len(enrollments),
-            "discharges": len(discharges),
-            "net_change": len(enrollments) - len(discharges),
+            "enrollments": enrollment_count,
+            "discharges": discharge_count,
+            "net_change": enrollment_count - discharge_count,
             "enrollment_list": enrollments,
             "discharge_list": discharges
         }
        
-    async def _get_yearly_trend(self, query_results,
+    TREND_SPANS = (3, 6, 12, 24, 36)
+
+    async def _get_yearly_trend(self, monthly_counts: Dict[Tuple[int, int], Tuple[int, int]],
                                 teacher_name: str, 
                                 year: int, 
-                                month: int) -> Dict:
-        """12개월 추이 데이터"""
+                                month: int,
+                                months: int = 12,
+                                fiscal_year: bool = False) -> Dict:
+        """월별 추이 데이터 (실제 달력 월 단위, 기준월에서 거슬러 올라감)"""
+        if fiscal_year:
+            window = self._fiscal_year_window(year, month)
+            start_year = window[0][0]
+            window_label = f"{start_year}회계연도"
+        else:
+            if months not in self.TREND_SPANS:
+                months = min(self.TREND_SPANS, key=lambda span: abs(span - months))
+            window = self._month_window(year, month, months)
+            window_label = f"{months}개월"
+
         trend_data = []
-        
-        # 과거 11개월 + 현재월 = 12개월
-        for i in range(11, -1, -1):
-            # i개월 전 계산
-            target_date = datetime(year, month, 1) - timedelta(days=i*30)
-            target_year = target_date.year
-            target_month = target_date.month
-            
-            start_date, end_date = self._get_month_range(
-                target_year, target_month
-            )
-            
-            # 해당 월 입퇴소 수
-            enrollments = await self.year_month_enrollment(
-                query_results, target_year, target_month
-            )
-            discharges = await self.year_month_discharge(
-                query_results, target_year, target_month
-            )
+        for target_year, target_month in window:
+            # 해당 월 입퇴소 수 (월별 group-by 결과 조회만, 행 재순회 없음)
+            enrollments, discharges = monthly_counts.get((target_year, target_month), (0, 0))
 
             # debug 로그: 각 월별 조회 결과 수 확인
-            logger.debug(f"[Trend] {target_year}-{target_month:02d} enrollments={len(enrollments)} discharges={len(discharges)}")
+            logger.debug(f"[Trend] {target_year}-{target_month:02d} enrollments={enrollments} discharges={discharges}")
             
             trend_data.append({
                 "year": target_year,
                 "month": target_month,
                 "month_label": f"{target_year}년 {target_month}월",
-                "enrollments": len(enrollments),
-                "discharges": len(discharges),
-                "net_change": len(enrollments) - len(discharges)
+                "enrollments": enrollments,
+                "discharges": discharges,
+                "net_change": enrollments - discharges
             })
         
-        return {"monthly_data": trend_data}
+        return {"monthly_data": trend_data, "span_months": len(window), "window_label": window_label}
+
+    def _month_window(self, year: int, month: int, months: int) -> List[Tuple[int, int]]:
+        """(year, month)로 끝나는 연속된 달력 월 목록 (오래된 순)"""
+        end_index = year * 12 + (month - 1)
+        return [(i // 12, i % 12 + 1) for i in range(end_index - months + 1, end_index + 1)]
+
+    def _fiscal_year_window(self, year: int, month: int) -> List[Tuple[int, int]]:
+        """(year, month)가 속한 회계연도의 12개월"""
+        start_month = config.FISCAL_YEAR_START_MONTH
+        start_year = year if month >= start_month else year - 1
+        start_index = start_year * 12 + (start_month - 1)
+        return [(i // 12, i % 12 + 1) for i in range(start_index, start_index + 12)]
     
-    async def _get_detailed_student_list(self, query_results
-                                        ) -> List[Dict]:
-        """학생별 상세 명단 (입소일, 퇴소일 포함)"""       
+    async def _get_detailed_student_list(self, aggregator: "ReportAggregator"
+                                        ) -> List[DetailRow]:
+        """학생별 상세 명단 (입소일, 퇴소일 포함)
+
+        날짜는 date, 재원기간은 일수(int, 계산 불가면 None)로 담고, 한글 헤더와 표시 문자열은 시트 생성 시 만든다.
+        """       
         detailed_list = []
         
         # 1. 입소 학생 (class 테이블 - 퇴소일 없음)
-        enrollments = query_results.get("class", [])
-
-        for student in enrollments:
-            # enrollments now use internal English keys; map to output Korean keys
-            start_val = student.get("start_date")
-            detailed_list.append({
-                "학생명": student.get("student_name"),
-                "학년": f"{student.get('grade')}학년" if isinstance(student.get('grade'), int) else student.get('grade'),
-                "반": student.get("class_name"),
-                "입소일자": start_val,
-                "퇴소일자": None,
-                "재원상태": "재원중",
-                "재원기간": self._calculate_days_from(start_val),
-                "퇴원사유": None,
-                "학부모전화": student.get("parent_phone_number")
-            })
+        enrollments = aggregator.class_rows
+        tenure_days = aggregator.tenure_days("enrollments")
+
+        for student, days in zip(enrollments, tenure_days):
+            detailed_list.append(DetailRow(
+                student_name=student.get("student_name"),
+                grade=student.get("grade"),
+                class_name=student.get("class_name"),
+                start_date=to_date(student.get("start_date")),
+                status="enrolled",
+                tenure_days=days,
+                parent_phone_number=student.get("parent_phone_number")
+            ))
         
         # 2. 퇴소 학생 (discharge 테이블 - 입소일 + 퇴소일 있음)
-        discharges = query_results.get("discharge", [])
-
-        for student in discharges:
-            start_val = student.get("start_date")
-            end_val = student.get("discharge_date")
-            detailed_list.append({
-                "학생명": student.get("student_name"),
-                "학년": f"{student.get('grade')}학년" if isinstance(student.get('grade'), int) else student.get('grade'),
-                "반": ", ".join(student.get("class_name", [])) if isinstance(student.get("class_name"), list) else student.get("class_name", ""),
-                "입소일자": start_val,
-                "퇴소일자": end_val,
-                "재원상태": "퇴원",
-                "재원기간": self._calculate_duration(
-                    start_val, 
-                    end_val
-                ),
-                "퇴원사유": student.get("discharging_reason"),
-                "학부모전화": student.get("parent_phone_number")
-        })
+        discharges = aggregator.discharge_rows
+        tenure_days = aggregator.tenure_days("discharges")
+
+        for student, days in zip(discharges, tenure_days):
+            detailed_list.append(DetailRow(
+                student_name=student.get("student_name"),
+                grade=student.get("grade"),
+                class_name=student.get("class_name", ""),
+                start_date=to_date(student.get("start_date")),
+                discharge_date=to_date(student.get("discharge_date")),
+                status="discharged",
+                tenure_days=days,
+                discharging_reason=student.get("discharging_reason"),
+                parent_phone_number=student.get("parent_phone_number")
+            ))
         
         # 퇴소일자 기준 정렬 (퇴소일자가 없으면 입소일자 사용)
         detailed_list.sort(
-            key=lambda x: x.get("퇴소일자") or x.get("입소일자") or "9999-99-99"
+            key=lambda x: x.discharge_date or x.start_date or date.max
         )
         
         return detailed_list
@@ -1161,61 +2864,11 @@ class EnhancedDischargeReportGenerator:
             
     async def year_month_enrollment(self, query_results: Dict, year: int, month: int) -> List[Dict]:
         """Compatibility wrapper for requested name `year_month_enrollment`."""
-        # Normalize keys and pull class list
-        if isinstance(query_results, dict):
-            normalized = {k.lower(): v for k, v in query_results.items()}
-        else:
-            return []
-
-        class_list = normalized.get("class", [])
-        start_range, end_range = self._get_month_range(year, month)
-
-        filtered: List[Dict] = []
-        for item in class_list:
-            # possible date keys
-            val = item.get("start_date") or item.get("start") or item.get("입소일") or item.get("startDate")
-            # support nested Notion-like dicts
-            if isinstance(val, dict):
-                val = val.get("date") or val.get("start") or val.get("start_date")
-                if isinstance(val, dict):
-                    val = val.get("start")
-            if not val:
-                continue
-            try:
-                d = datetime.fromisoformat(str(val).split("T")[0])
-            except Exception:
-                continue
-            if start_range.date() <= d.date() <= end_range.date():
-                filtered.append(item)
-        return filtered
+        return ReportAggregator(query_results).rows_in_month("enrollments", year, month)
 
     async def year_month_discharge(self, query_results: Dict, year: int, month: int) -> List[Dict]:
         """Compatibility wrapper for requested name `year_month_discharge`."""
-        # Normalize keys and pull discharge list
-        if isinstance(query_results, dict):
-            normalized = {k.lower(): v for k, v in query_results.items()}
-        else:
-            return []
-
-        discharge_list = normalized.get("discharge", [])
-        start_range, end_range = self._get_month_range(year, month)
-
-        filtered: List[Dict] = []
-        for item in discharge_list:
-            val = item.get("discharge_date") or item.get("discharge") or item.get("퇴소일") or item.get("dischargeDate")
-            if isinstance(val, dict):
-                val = val.get("date") or val.get("start") or val.get("discharge_date")
-                if isinstance(val, dict):
-                    val = val.get("start")
-            if not val:
-                continue
-            try:
-                d = datetime.fromisoformat(str(val).split("T")[0])
-            except Exception:
-                continue
-            if start_range.date() <= d.date() <= end_range.date():
-                filtered.append(item)
-        return filtered
+        return ReportAggregator(query_results).rows_in_month("discharges", year, month)
 
     
     def _get_month_range(self, year: int, month: int) -> Tuple[datetime, datetime]:
@@ -1227,67 +2880,48 @@ class EnhancedDischargeReportGenerator:
             end_date = datetime(year, month + 1, 1) - timedelta(days=1)
         return start_date, end_date
     
-    def _calculate_duration(self, start_str: str, end_str: str) -> str:
-        """재원 기간 계산"""
-        try:
-            start = datetime.fromisoformat(start_str.split("T")[0])
-            end = datetime.fromisoformat(end_str.split("T")[0])
-            days = (end - start).days
-            
-            if days < 30:
-                return f"{days}일"
-            else:
-                months = days // 30
-                remaining = days % 30
-                if remaining > 0:
-                    return f"{months}개월 {remaining}일"
-                return f"{months}개월"
-        except:
-            return "-"
-        
-    def _calculate_days_from(self, start_str: str) -> str:
-        """입소일부터 현재까지"""
-        try:
-            start = datetime.fromisoformat(start_str.split("T")[0])
-            days = (datetime.now() - start).days
-            
-            if days < 30:
-                return f"{days}일"
-            else:
-                months = days // 30
-                remaining = days % 30
-                return f"{months}개월 {remaining}일"
-        except:
-            return "-"
-        
-    
     def create_excel_with_chart(self, report_data: Dict, 
                                 filename: str) -> Path:
         """차트 포함 Excel 생성"""
         logger.info("📊 차트 포함 Excel 생성 중...")
         
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active)
+        # 상세 명단이 크면 write-only 모드로 행을 바로 흘려보내 메모리를 일정하게 유지
+        streaming = len(report_data.get("detailed_list", [])) >= config.EXCEL_STREAMING_ROWS
+        if streaming:
+            logger.info(f"📊 write-only 모드로 생성 (상세 {len(report_data['detailed_list'])}행)")
+            wb = openpyxl.Workbook(write_only=True)
+        else:
+            wb = openpyxl.Workbook()
+            wb.remove(wb.active)
+
+        def create_sheet(title):
+            ws = wb.create_sheet(title)
+            return _BufferedSheet(ws) if streaming else ws
         
-        # ===== 시트 1: 12개월 추이 (차트 포함) =====
-        ws_trend = wb.create_sheet("월별 추이")
+        # ===== 시트 1: 월별 추이 (차트 포함) =====
+        ws_trend = create_sheet("월별 추이")
         self._create_trend_sheet_with_chart(ws_trend, report_data)
 
         # ===== 시트 2: 월별 요약 =====
-        ws_summary = wb.create_sheet("월별 요약")
+        ws_summary = create_sheet("월별 요약")
         self._create_summary_sheet(ws_summary, report_data)
         
         # ===== 시트 3: 과목별 입퇴소 추이 시트 + 차트 =====
-        ws_class_trend = wb.create_sheet("과목별 입퇴소 추이")
+        ws_class_trend = create_sheet("과목별 입퇴소 추이")
         self._create_class_trend_sheet_with_chart(ws_class_trend, report_data)
 
         # ===== 시트 4: 과목별 퇴소 사유 순위 요약 시트 =====
-        ws_class_summary = wb.create_sheet("과목별 퇴소 사유 순위 요약")
+        ws_class_summary = create_sheet("과목별 퇴소 사유 순위 요약")
         self._create_class_summary_sheet(ws_class_summary, report_data)
         
         # ===== 시트 5: 학생별 상세 명단 =====
         ws_detail = wb.create_sheet("학생 상세")
-        self._create_detail_sheet(ws_detail, report_data)
+        if streaming:
+            self._stream_detail_sheet(ws_detail, report_data)
+            for ws in (ws_trend, ws_summary, ws_class_trend, ws_class_summary):
+                ws.flush()
+        else:
+            self._create_detail_sheet(ws_detail, report_data)
 
         
         
@@ -1299,16 +2933,14 @@ class EnhancedDischargeReportGenerator:
         return output_path
     
     def _create_trend_sheet_with_chart(self, ws, report_data: Dict):
-        """12개월 추이 시트 + 차트"""
+        """월별 추이 시트 + 차트"""
         trend_data = report_data["yearly_trend"]["monthly_data"]
         
         # 제목
         ws.merge_cells('A1:G1')
         title = ws['A1']
-        title.value = f"📈 {report_data['teacher_name']} - 12개월 입퇴소 추이"
-        title.font = Font(size=16, bold=True, color="FFFFFF")
-        title.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        title.alignment = Alignment(horizontal="center", vertical="center")
+        title.value = f"📈 {report_data['teacher_name']} - {report_data['yearly_trend'].get('window_label', '12개월')} 입퇴소 추이"
+        ReportStyles.apply(title, "title_blue")
         ws.row_dimensions[1].height = 30
         
         # 헤더
@@ -1317,9 +2949,7 @@ class EnhancedDischargeReportGenerator:
         for col, header in enumerate(headers, 1):
             cell = ws.cell(row=header_row, column=col)
             cell.value = header
-            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.font = Font(color="FFFFFF", bold=True)
-            cell.alignment = Alignment(horizontal="center")
+            ReportStyles.apply(cell, "header")
         
         # 데이터
         for row_idx, data in enumerate(trend_data, header_row + 1):
@@ -1328,19 +2958,17 @@ class EnhancedDischargeReportGenerator:
             ws.cell(row=row_idx, column=3).value = data['discharges']
             ws.cell(row=row_idx, column=4).value = data['net_change']
             
-            # 순증감 색상
-            net_cell = ws.cell(row=row_idx, column=4)
+            # 순증감 색상 + 스트라이프
             if data['net_change'] > 0:
-                net_cell.font = Font(color="00B050", bold=True)
+                net_style = "net_up"
             elif data['net_change'] < 0:
-                net_cell.font = Font(color="FF0000", bold=True)
-            
-            # 스트라이프
-            if row_idx % 2 == 0:
-                for col in range(1, 5):
-                    ws.cell(row=row_idx, column=col).fill = PatternFill(
-                        start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                    )
+                net_style = "net_down"
+            else:
+                net_style = "plain"
+            row_style = ReportStyles.striped("plain", row_idx)
+            for col in range(1, 4):
+                ReportStyles.apply(ws.cell(row=row_idx, column=col), row_style)
+            ReportStyles.apply(ws.cell(row=row_idx, column=4), ReportStyles.striped(net_style, row_idx))
         
         # 열 너비
         ws.column_dimensions['A'].width = 12
@@ -1403,49 +3031,14 @@ class EnhancedDischargeReportGenerator:
     
     def _create_class_trend_sheet_with_chart(self, ws, report_data: Dict):
         """과목별 입퇴소 추이 시트 + 차트"""
-        detailed_list = report_data.get("detailed_list", [])
-        
-        # 과목별 입소/퇴소 집계
-        subject_enrollments = Counter()
-        subject_discharges = Counter()
-        
-        for student in detailed_list:
-            subject = student.get("반", "기타")
-            # 반이 리스트인 경우 처리
-            if isinstance(subject, list):
-                subjects = subject
-            elif isinstance(subject, str) and "," in subject:
-                subjects = [s.strip() for s in subject.split(",")]
-            else:
-                subjects = [subject] if subject else ["기타"]
-            
-            for subj in subjects:
-                if student.get("재원상태") == "재원중":
-                    subject_enrollments[subj] += 1
-                elif student.get("재원상태") == "퇴원":
-                    subject_discharges[subj] += 1
-        
-        # 모든 과목 수집 및 정렬
-        all_subjects = set(subject_enrollments.keys()) | set(subject_discharges.keys())
-        subject_data = []
-        for subject in sorted(all_subjects):
-            enrollments = subject_enrollments.get(subject, 0)
-            discharges = subject_discharges.get(subject, 0)
-            net_change = enrollments - discharges
-            subject_data.append({
-                "subject": subject,
-                "enrollments": enrollments,
-                "discharges": discharges,
-                "net_change": net_change
-            })
+        # 과목별 입소/퇴소 집계 (ReportAggregator에서 계산됨)
+        subject_data = report_data["aggregates"]["subject_counts"]
         
         # 제목
         ws.merge_cells('A1:G1')
         title = ws['A1']
         title.value = f"📚 {report_data['teacher_name']} - 과목별 입퇴소 추이"
-        title.font = Font(size=16, bold=True, color="FFFFFF")
-        title.fill = PatternFill(start_color="7030A0", end_color="7030A0", fill_type="solid")
-        title.alignment = Alignment(horizontal="center", vertical="center")
+        ReportStyles.apply(title, "title_purple")
         ws.row_dimensions[1].height = 30
         
         # 헤더
@@ -1454,9 +3047,7 @@ class EnhancedDischargeReportGenerator:
         for col, header in enumerate(headers, 1):
             cell = ws.cell(row=header_row, column=col)
             cell.value = header
-            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.font = Font(color="FFFFFF", bold=True)
-            cell.alignment = Alignment(horizontal="center")
+            ReportStyles.apply(cell, "header")
         
         # 데이터
         for row_idx, data in enumerate(subject_data, header_row + 1):
@@ -1465,19 +3056,17 @@ class EnhancedDischargeReportGenerator:
             ws.cell(row=row_idx, column=3).value = data['discharges']
             ws.cell(row=row_idx, column=4).value = data['net_change']
             
-            # 순증감 색상
-            net_cell = ws.cell(row=row_idx, column=4)
+            # 순증감 색상 + 스트라이프
             if data['net_change'] > 0:
-                net_cell.font = Font(color="00B050", bold=True)
+                net_style = "net_up"
             elif data['net_change'] < 0:
-                net_cell.font = Font(color="FF0000", bold=True)
-            
-            # 스트라이프
-            if row_idx % 2 == 0:
-                for col in range(1, 5):
-                    ws.cell(row=row_idx, column=col).fill = PatternFill(
-                        start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                    )
+                net_style = "net_down"
+            else:
+                net_style = "plain"
+            row_style = ReportStyles.striped("plain", row_idx)
+            for col in range(1, 4):
+                ReportStyles.apply(ws.cell(row=row_idx, column=col), row_style)
+            ReportStyles.apply(ws.cell(row=row_idx, column=4), ReportStyles.striped(net_style, row_idx))
         
         # 열 너비
         ws.column_dimensions['A'].width = 20  # 과목명은 더 넓게
@@ -1544,74 +3133,19 @@ class EnhancedDischargeReportGenerator:
         
         # 제목
         ws.merge_cells('A1:G1')
-        title = ws['A1']
-        title.value = f"📊 월별 퇴소 사유 순위 요약"
-        title.font = Font(size=16, bold=True, color="FFFFFF")
-        title.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        title.alignment = Alignment(horizontal="center", vertical="center")
-        ws.row_dimensions[1].height = 30
-        
-        # detailed_list에서 퇴원한 학생들만 필터링
-        detailed_list = report_data.get("detailed_list", [])
-        discharged_students = [
-            student for student in detailed_list 
-            if student.get("재원상태") == "퇴원" and student.get("퇴소일자")
-        ]
-        
-        if not discharged_students:
-            ws.cell(row=3, column=1).value = "퇴소 데이터가 없습니다."
-            return
-        
-        # 퇴소일자를 기준으로 월별로 그룹화
-        monthly_discharges = {}
-        for student in discharged_students:
-            discharge_date_str = student.get("퇴소일자")
-            if not discharge_date_str:
-                continue
-            
-            try:
-                # 날짜 문자열 파싱 (ISO 형식 또는 다른 형식 지원)
-                if "T" in discharge_date_str:
-                    discharge_date = datetime.fromisoformat(discharge_date_str.split("T")[0])
-                else:
-                    discharge_date = datetime.fromisoformat(discharge_date_str)
-                
-                year_month = (discharge_date.year, discharge_date.month)
-                if year_month not in monthly_discharges:
-                    monthly_discharges[year_month] = []
-                
-                monthly_discharges[year_month].append(student)
-            except Exception:
-                continue
+        title = ws['A1']
+        title.value = f"📊 월별 퇴소 사유 순위 요약"
+        ReportStyles.apply(title, "title_blue")
+        ws.row_dimensions[1].height = 30
         
-        # 월별로 정렬 (년도, 월 순서)
-        sorted_months = sorted(monthly_discharges.keys())
+        # 퇴소일자가 있는 퇴원 학생 기준 집계 (ReportAggregator에서 계산됨)
+        aggregates = report_data["aggregates"]
+        if not aggregates["overall_reasons"]:
+            ws.cell(row=3, column=1).value = "퇴소 데이터가 없습니다."
+            return
         
-        # 각 월별 데이터를 먼저 준비
-        monthly_data = []
-        for year, month in sorted_months:
-            students = monthly_discharges[(year, month)]
-            
-            # 퇴소 사유 집계
-            reasons = []
-            for student in students:
-                r = student.get('퇴원사유') or student.get('퇴소사유') or student.get('discharging_reason')
-                if not r:
-                    r = '기타'
-                if isinstance(r, str):
-                    r = r.strip() or '기타'
-                else:
-                    r = str(r)
-                reasons.append(r)
-            
-            counts = Counter(reasons)
-            sorted_reasons = counts.most_common()
-            
-            monthly_data.append({
-                'year': year,
-                'month': month,
-                'reasons': sorted_reasons
-            })
+        # 월별 퇴소 사유 순위 (년도, 월 순서)
+        monthly_data = aggregates["monthly_reasons"]
         
         # 3행 4열 그리드로 배치
         # 각 월별 박스는 4열 너비 (A~D, E~H, I~L, M~P)
@@ -1641,9 +3175,7 @@ class EnhancedDischargeReportGenerator:
             ws.merge_cells(f'{get_column_letter(start_col)}{start_row}:{get_column_letter(end_col)}{start_row}')
             sec_title = ws[f'{get_column_letter(start_col)}{start_row}']
             sec_title.value = f"📅 {year}년 {month}월"
-            sec_title.font = Font(size=11, bold=True, color="FFFFFF")
-            sec_title.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            sec_title.alignment = Alignment(horizontal="center", vertical="center")
+            ReportStyles.apply(sec_title, "section_month")
             
             current_row = start_row + 1
             
@@ -1654,9 +3186,7 @@ class EnhancedDischargeReportGenerator:
                     col = start_col + col_offset
                     cell = ws.cell(row=current_row, column=col)
                     cell.value = header
-                    cell.fill = PatternFill(start_color="70AD47", end_color="70AD47", fill_type="solid")
-                    cell.font = Font(color="FFFFFF", bold=True, size=9)
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
+                    ReportStyles.apply(cell, "rank_header_9")
                 
                 current_row += 1
                 
@@ -1666,23 +3196,15 @@ class EnhancedDischargeReportGenerator:
                     ws.cell(row=current_row, column=start_col + 1).value = reason[:15] if len(reason) > 15 else reason  # 사유는 최대 15자
                     ws.cell(row=current_row, column=start_col + 2).value = f"{cnt}건"
                     
-                    # 스트라이프 스타일
-                    if current_row % 2 == 0:
-                        for c in range(start_col, start_col + 3):
-                            ws.cell(row=current_row, column=c).fill = PatternFill(
-                                start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                            )
-                    
-                    # 작은 폰트
+                    # 작은 폰트 + 스트라이프
+                    row_style = ReportStyles.striped("rank_cell_9", current_row)
                     for c in range(start_col, start_col + 3):
-                        ws.cell(row=current_row, column=c).font = Font(size=9)
-                        ws.cell(row=current_row, column=c).alignment = Alignment(horizontal="center", vertical="center")
+                        ReportStyles.apply(ws.cell(row=current_row, column=c), row_style)
                     
                     current_row += 1
             else:
                 ws.cell(row=current_row, column=start_col).value = "데이터 없음"
-                ws.cell(row=current_row, column=start_col).font = Font(size=9)
-                ws.cell(row=current_row, column=start_col).alignment = Alignment(horizontal="center", vertical="center")
+                ReportStyles.apply(ws.cell(row=current_row, column=start_col), "rank_cell_9")
         
         # 열 너비 조정 (각 월별 박스의 열)
         for col_letter in ['A', 'E', 'I', 'M']:
@@ -1696,20 +3218,8 @@ class EnhancedDischargeReportGenerator:
             ws.column_dimensions[col_letter].width = 2
         
         # ===== 전체 월 퇴소사유 요약 (오른쪽) =====
-        # 전체 퇴소사유 집계
-        all_reasons = []
-        for student in discharged_students:
-            r = student.get('퇴원사유') or student.get('퇴소사유') or student.get('discharging_reason')
-            if not r:
-                r = '기타'
-            if isinstance(r, str):
-                r = r.strip() or '기타'
-            else:
-                r = str(r)
-            all_reasons.append(r)
-        
-        all_counts = Counter(all_reasons)
-        all_sorted_reasons = all_counts.most_common()
+        # 전체 퇴소사유 순위
+        all_sorted_reasons = aggregates["overall_reasons"]
         
         # 전체 요약 섹션 시작 위치 (R열부터, 한 칸 더 띄움)
         summary_start_col = 18  # R열 (Q열에서 한 칸 오른쪽)
@@ -1719,9 +3229,7 @@ class EnhancedDischargeReportGenerator:
         ws.merge_cells(f'{get_column_letter(summary_start_col)}{summary_start_row}:{get_column_letter(summary_start_col + 2)}{summary_start_row + 1}')
         summary_title = ws[f'{get_column_letter(summary_start_col)}{summary_start_row}']
         summary_title.value = "📊 전체 월 퇴소사유 요약"
-        summary_title.font = Font(size=16, bold=True, color="FFFFFF")
-        summary_title.fill = PatternFill(start_color="C55A11", end_color="C55A11", fill_type="solid")  # 주황색 계열로 변경
-        summary_title.alignment = Alignment(horizontal="center", vertical="center")
+        ReportStyles.apply(summary_title, "title_orange")
         ws.row_dimensions[summary_start_row].height = 40  # 제목 행 높이 증가
         ws.row_dimensions[summary_start_row + 1].height = 40  # 제목 행 높이 증가
         
@@ -1734,9 +3242,7 @@ class EnhancedDischargeReportGenerator:
                 col = summary_start_col + col_offset
                 cell = ws.cell(row=current_summary_row, column=col)
                 cell.value = header
-                cell.fill = PatternFill(start_color="70AD47", end_color="70AD47", fill_type="solid")
-                cell.font = Font(color="FFFFFF", bold=True, size=10)
-                cell.alignment = Alignment(horizontal="center", vertical="center")
+                ReportStyles.apply(cell, "rank_header_10")
             
             current_summary_row += 1
             
@@ -1746,23 +3252,15 @@ class EnhancedDischargeReportGenerator:
                 ws.cell(row=current_summary_row, column=summary_start_col + 1).value = reason
                 ws.cell(row=current_summary_row, column=summary_start_col + 2).value = f"{cnt}건"
                 
-                # 스트라이프 스타일
-                if current_summary_row % 2 == 0:
-                    for c in range(summary_start_col, summary_start_col + 3):
-                        ws.cell(row=current_summary_row, column=c).fill = PatternFill(
-                            start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                        )
-                
-                # 폰트 및 정렬
+                # 폰트 및 정렬 + 스트라이프
+                row_style = ReportStyles.striped("rank_cell_10", current_summary_row)
                 for c in range(summary_start_col, summary_start_col + 3):
-                    ws.cell(row=current_summary_row, column=c).font = Font(size=10)
-                    ws.cell(row=current_summary_row, column=c).alignment = Alignment(horizontal="center", vertical="center")
+                    ReportStyles.apply(ws.cell(row=current_summary_row, column=c), row_style)
                 
                 current_summary_row += 1
         else:
             ws.cell(row=current_summary_row, column=summary_start_col).value = "데이터 없음"
-            ws.cell(row=current_summary_row, column=summary_start_col).font = Font(size=10)
-            ws.cell(row=current_summary_row, column=summary_start_col).alignment = Alignment(horizontal="center", vertical="center")
+            ReportStyles.apply(ws.cell(row=current_summary_row, column=summary_start_col), "rank_cell_10")
         
         # 전체 요약 열 너비 조정 (R, S, T열)
         ws.column_dimensions['R'].width = 6   # 순위
@@ -1776,66 +3274,17 @@ class EnhancedDischargeReportGenerator:
         ws.merge_cells('A1:G1')
         title = ws['A1']
         title.value = f"📊 과목별 퇴소 사유 순위 요약"
-        title.font = Font(size=16, bold=True, color="FFFFFF")
-        title.fill = PatternFill(start_color="7030A0", end_color="7030A0", fill_type="solid")
-        title.alignment = Alignment(horizontal="center", vertical="center")
+        ReportStyles.apply(title, "title_purple")
         ws.row_dimensions[1].height = 30
         
-        # detailed_list에서 퇴원한 학생들만 필터링
-        detailed_list = report_data.get("detailed_list", [])
-        discharged_students = [
-            student for student in detailed_list 
-            if student.get("재원상태") == "퇴원" and student.get("퇴소일자")
-        ]
-        
-        if not discharged_students:
+        # 퇴소일자가 있는 퇴원 학생 기준 집계 (ReportAggregator에서 계산됨)
+        aggregates = report_data["aggregates"]
+        if not aggregates["overall_reasons"]:
             ws.cell(row=3, column=1).value = "퇴소 데이터가 없습니다."
             return
         
-        # 과목별로 그룹화
-        subject_discharges = {}
-        for student in discharged_students:
-            subject = student.get("반", "기타")
-            # 반이 리스트인 경우 처리
-            if isinstance(subject, list):
-                subjects = subject
-            elif isinstance(subject, str) and "," in subject:
-                subjects = [s.strip() for s in subject.split(",")]
-            else:
-                subjects = [subject] if subject else ["기타"]
-            
-            for subj in subjects:
-                if subj not in subject_discharges:
-                    subject_discharges[subj] = []
-                subject_discharges[subj].append(student)
-        
-        # 과목별로 정렬
-        sorted_subjects = sorted(subject_discharges.keys())
-        
-        # 각 과목별 데이터를 먼저 준비
-        subject_data = []
-        for subject in sorted_subjects:
-            students = subject_discharges[subject]
-            
-            # 퇴소 사유 집계
-            reasons = []
-            for student in students:
-                r = student.get('퇴원사유') or student.get('퇴소사유') or student.get('discharging_reason')
-                if not r:
-                    r = '기타'
-                if isinstance(r, str):
-                    r = r.strip() or '기타'
-                else:
-                    r = str(r)
-                reasons.append(r)
-            
-            counts = Counter(reasons)
-            sorted_reasons = counts.most_common()
-            
-            subject_data.append({
-                'subject': subject,
-                'reasons': sorted_reasons
-            })
+        # 과목별 퇴소 사유 순위 (과목명 순서)
+        subject_data = aggregates["subject_reasons"]
         
         # 3행 4열 그리드로 배치
         # 각 과목별 박스는 4열 너비 (A~D, E~H, I~L, M~P)
@@ -1864,9 +3313,7 @@ class EnhancedDischargeReportGenerator:
             ws.merge_cells(f'{get_column_letter(start_col)}{start_row}:{get_column_letter(end_col)}{start_row}')
             sec_title = ws[f'{get_column_letter(start_col)}{start_row}']
             sec_title.value = f"📚 {subject}"
-            sec_title.font = Font(size=11, bold=True, color="FFFFFF")
-            sec_title.fill = PatternFill(start_color="7030A0", end_color="7030A0", fill_type="solid")
-            sec_title.alignment = Alignment(horizontal="center", vertical="center")
+            ReportStyles.apply(sec_title, "section_subject")
             
             current_row = start_row + 1
             
@@ -1877,9 +3324,7 @@ class EnhancedDischargeReportGenerator:
                     col = start_col + col_offset
                     cell = ws.cell(row=current_row, column=col)
                     cell.value = header
-                    cell.fill = PatternFill(start_color="70AD47", end_color="70AD47", fill_type="solid")
-                    cell.font = Font(color="FFFFFF", bold=True, size=9)
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
+                    ReportStyles.apply(cell, "rank_header_9")
                 
                 current_row += 1
                 
@@ -1889,23 +3334,15 @@ class EnhancedDischargeReportGenerator:
                     ws.cell(row=current_row, column=start_col + 1).value = reason[:15] if len(reason) > 15 else reason  # 사유는 최대 15자
                     ws.cell(row=current_row, column=start_col + 2).value = f"{cnt}건"
                     
-                    # 스트라이프 스타일
-                    if current_row % 2 == 0:
-                        for c in range(start_col, start_col + 3):
-                            ws.cell(row=current_row, column=c).fill = PatternFill(
-                                start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                            )
-                    
-                    # 작은 폰트
+                    # 작은 폰트 + 스트라이프
+                    row_style = ReportStyles.striped("rank_cell_9", current_row)
                     for c in range(start_col, start_col + 3):
-                        ws.cell(row=current_row, column=c).font = Font(size=9)
-                        ws.cell(row=current_row, column=c).alignment = Alignment(horizontal="center", vertical="center")
+                        ReportStyles.apply(ws.cell(row=current_row, column=c), row_style)
                     
                     current_row += 1
             else:
                 ws.cell(row=current_row, column=start_col).value = "데이터 없음"
-                ws.cell(row=current_row, column=start_col).font = Font(size=9)
-                ws.cell(row=current_row, column=start_col).alignment = Alignment(horizontal="center", vertical="center")
+                ReportStyles.apply(ws.cell(row=current_row, column=start_col), "rank_cell_9")
         
         # 열 너비 조정 (각 과목별 박스의 열)
         for col_letter in ['A', 'E', 'I', 'M']:
@@ -1919,20 +3356,8 @@ class EnhancedDischargeReportGenerator:
             ws.column_dimensions[col_letter].width = 2
         
         # ===== 전체 과목 퇴소사유 요약 (오른쪽) =====
-        # 전체 퇴소사유 집계
-        all_reasons = []
-        for student in discharged_students:
-            r = student.get('퇴원사유') or student.get('퇴소사유') or student.get('discharging_reason')
-            if not r:
-                r = '기타'
-            if isinstance(r, str):
-                r = r.strip() or '기타'
-            else:
-                r = str(r)
-            all_reasons.append(r)
-        
-        all_counts = Counter(all_reasons)
-        all_sorted_reasons = all_counts.most_common()
+        # 전체 퇴소사유 순위
+        all_sorted_reasons = aggregates["overall_reasons"]
         
         # 전체 요약 섹션 시작 위치 (R열부터, 한 칸 더 띄움)
         summary_start_col = 18  # R열 (Q열에서 한 칸 오른쪽)
@@ -1942,9 +3367,7 @@ class EnhancedDischargeReportGenerator:
         ws.merge_cells(f'{get_column_letter(summary_start_col)}{summary_start_row}:{get_column_letter(summary_start_col + 2)}{summary_start_row + 1}')
         summary_title = ws[f'{get_column_letter(summary_start_col)}{summary_start_row}']
         summary_title.value = "📊 전체 과목 퇴소사유 요약"
-        summary_title.font = Font(size=16, bold=True, color="FFFFFF")
-        summary_title.fill = PatternFill(start_color="C55A11", end_color="C55A11", fill_type="solid")  # 주황색 계열로 변경
-        summary_title.alignment = Alignment(horizontal="center", vertical="center")
+        ReportStyles.apply(summary_title, "title_orange")
         ws.row_dimensions[summary_start_row].height = 40  # 제목 행 높이 증가
         ws.row_dimensions[summary_start_row + 1].height = 40  # 제목 행 높이 증가
         
@@ -1957,9 +3380,7 @@ class EnhancedDischargeReportGenerator:
                 col = summary_start_col + col_offset
                 cell = ws.cell(row=current_summary_row, column=col)
                 cell.value = header
-                cell.fill = PatternFill(start_color="70AD47", end_color="70AD47", fill_type="solid")
-                cell.font = Font(color="FFFFFF", bold=True, size=10)
-                cell.alignment = Alignment(horizontal="center", vertical="center")
+                ReportStyles.apply(cell, "rank_header_10")
             
             current_summary_row += 1
             
@@ -1969,47 +3390,72 @@ class EnhancedDischargeReportGenerator:
                 ws.cell(row=current_summary_row, column=summary_start_col + 1).value = reason
                 ws.cell(row=current_summary_row, column=summary_start_col + 2).value = f"{cnt}건"
                 
-                # 스트라이프 스타일
-                if current_summary_row % 2 == 0:
-                    for c in range(summary_start_col, summary_start_col + 3):
-                        ws.cell(row=current_summary_row, column=c).fill = PatternFill(
-                            start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"
-                        )
-                
-                # 폰트 및 정렬
+                # 폰트 및 정렬 + 스트라이프
+                row_style = ReportStyles.striped("rank_cell_10", current_summary_row)
                 for c in range(summary_start_col, summary_start_col + 3):
-                    ws.cell(row=current_summary_row, column=c).font = Font(size=10)
-                    ws.cell(row=current_summary_row, column=c).alignment = Alignment(horizontal="center", vertical="center")
+                    ReportStyles.apply(ws.cell(row=current_summary_row, column=c), row_style)
                 
                 current_summary_row += 1
         else:
             ws.cell(row=current_summary_row, column=summary_start_col).value = "데이터 없음"
-            ws.cell(row=current_summary_row, column=summary_start_col).font = Font(size=10)
-            ws.cell(row=current_summary_row, column=summary_start_col).alignment = Alignment(horizontal="center", vertical="center")
+            ReportStyles.apply(ws.cell(row=current_summary_row, column=summary_start_col), "rank_cell_10")
         
         # 전체 요약 열 너비 조정 (R, S, T열)
         ws.column_dimensions['R'].width = 6   # 순위
         ws.column_dimensions['S'].width = 25  # 사유
         ws.column_dimensions['T'].width = 10  # 건수
     
-    def _parse_duration_to_days(self, duration_str: str) -> int:
-        """재원기간 문자열을 일수로 변환"""
-        if not duration_str or duration_str == "-":
-            return 0
-        try:
-            days = 0
-            # "X개월 Y일" 형식 파싱
-            if "개월" in duration_str:
-                months = int(re.search(r'(\d+)개월', duration_str).group(1))
-                days += months * 30
-            if "일" in duration_str:
-                day_part = re.search(r'(\d+)일', duration_str)
-                if day_part:
-                    days += int(day_part.group(1))
-            return days
-        except:
+    @staticmethod
+    def _text_width(text) -> int:
+        """한글과 영문을 고려한 텍스트 너비 계산"""
+        if not text:
             return 0
-    
+        text_str = str(text)
+        width = 0
+        for char in text_str:
+            # 한글, 한자 등 전각 문자는 2로 계산
+            if ord(char) > 127:
+                width += 2
+            else:
+                width += 1
+        return width
+
+    # 상세 명단 컬럼 (DetailRow 필드, 한글 헤더) — 표시 순서
+    DETAIL_COLUMNS = (
+        ("student_name", "학생명"),
+        ("grade", "학년"),
+        ("class_name", "반"),
+        ("start_date", "입소일자"),
+        ("discharge_date", "퇴소일자"),
+        ("status", "재원상태"),
+        ("tenure_days", "재원기간"),
+        ("discharging_reason", "퇴원사유"),
+        ("parent_phone_number", "학부모전화"),
+    )
+    ENROLLED_HIDDEN_FIELDS = ("discharge_date", "discharging_reason")
+    STATUS_LABELS = {"enrolled": "재원중", "discharged": "퇴원"}
+    DETAIL_DATE_FIELDS = ("start_date", "discharge_date")
+
+    @classmethod
+    def _detail_value(cls, student: DetailRow, field: str):
+        """상세 명단 셀 표시 값"""
+        value = getattr(student, field)
+        if field == "grade" and isinstance(value, int):
+            return f"{value}학년"
+        if field == "class_name" and isinstance(value, list):
+            return ", ".join(value)
+        if field == "status":
+            return cls.STATUS_LABELS.get(value, value)
+        if field == "tenure_days":
+            # 재원중은 0일도 표시
+            return ReportAggregator.format_tenure(value, always_show_days=student.status == "enrolled")
+        if isinstance(value, date):
+            return value.isoformat()
+        if value is None and field in cls.DETAIL_DATE_FIELDS:
+            # Notion 원본에서 비어 있던 날짜 (해석할 수 없던 날짜 포함)는 빈 칸
+            return ""
+        return value if value is not None else "-"
+
     def _create_detail_sheet(self, ws, report_data: Dict):
         """학생별 상세 명단 시트 (입소/퇴소 분리)"""
         detailed = report_data["detailed_list"]
@@ -2019,172 +3465,113 @@ class EnhancedDischargeReportGenerator:
             return
         
         # 입소 학생과 퇴소 학생으로 분리
-        enrolled_students = [s for s in detailed if s.get("재원상태") == "재원중"]
-        discharged_students = [s for s in detailed if s.get("재원상태") == "퇴원"]
-        
-        # 퇴소 학생 재원기간 평균 계산
-        discharged_durations = []
-        for student in discharged_students:
-            duration_str = student.get("재원기간", "")
-            days = self._parse_duration_to_days(duration_str)
-            if days > 0:
-                discharged_durations.append(days)
-        
-        avg_duration_days = sum(discharged_durations) / len(discharged_durations) if discharged_durations else 0
-        if avg_duration_days >= 30:
-            avg_months = int(avg_duration_days // 30)
-            avg_remaining_days = int(avg_duration_days % 30)
-            if avg_remaining_days > 0:
-                avg_duration_str = f"{avg_months}개월 {avg_remaining_days}일"
-            else:
-                avg_duration_str = f"{avg_months}개월"
-        else:
-            avg_duration_str = f"{int(avg_duration_days)}일"
+        enrolled_students = [s for s in detailed if s.status == "enrolled"]
+        discharged_students = [s for s in detailed if s.status == "discharged"]
+        
+        # 퇴소 학생 재원기간 평균 (ReportAggregator에서 계산됨)
+        avg_duration_str = report_data["aggregates"]["tenure"]["average_label"]
         
         # 제목
         ws.merge_cells('A1:G1')
         title = ws['A1']
         title.value = "👥 학생별 상세 명단"
-        title.font = Font(size=14, bold=True, color="FFFFFF")
-        title.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        title.alignment = Alignment(horizontal="center")
+        ReportStyles.apply(title, "title_detail")
         ws.row_dimensions[1].height = 25
         
         current_row = 3
         
-        # 입소 학생과 퇴소 학생 데이터 준비
-        df_enrolled = pd.DataFrame(enrolled_students) if enrolled_students else pd.DataFrame()
-        df_discharged = pd.DataFrame(discharged_students) if discharged_students else pd.DataFrame()
-        
-        # 입소 학생 데이터에서 퇴소일자와 퇴원사유 컬럼 제거
-        if not df_enrolled.empty:
-            columns_to_drop = ['퇴소일자', '퇴원사유']
-            existing_columns_to_drop = [col for col in columns_to_drop if col in df_enrolled.columns]
-            if existing_columns_to_drop:
-                df_enrolled = df_enrolled.drop(columns=existing_columns_to_drop)
+        # 섹션별 컬럼 (입소 학생은 퇴소일자와 퇴원사유 제외)
+        discharged_columns = list(self.DETAIL_COLUMNS) if discharged_students else []
+        enrolled_columns = ([(f, h) for f, h in self.DETAIL_COLUMNS if f not in self.ENROLLED_HIDDEN_FIELDS]
+                            if enrolled_students else [])
         
         # 퇴소 학생 컬럼 수
-        discharged_cols = len(df_discharged.columns) if not df_discharged.empty else 0
+        discharged_cols = len(discharged_columns)
         # 입소 학생 시작 열 (퇴소 학생 컬럼 + 간격 2열)
         enrolled_start_col = discharged_cols + 3 if discharged_cols > 0 else 1
         
         # ===== 퇴소 학생 섹션 (왼쪽) =====
-        if not df_discharged.empty:
+        if discharged_students:
             # 퇴소 학생 섹션 제목
             ws.merge_cells(f'A{current_row}:{get_column_letter(discharged_cols)}{current_row}')
             section_title = ws[f'A{current_row}']
             section_title.value = "📌 퇴소 학생"
-            section_title.font = Font(size=12, bold=True, color="FFFFFF")
-            section_title.fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-            section_title.alignment = Alignment(horizontal="left")
+            ReportStyles.apply(section_title, "section_discharged")
             current_row += 1
             
             # 헤더
-            for col_num, column in enumerate(df_discharged.columns, 1):
+            for col_num, (_, header) in enumerate(discharged_columns, 1):
                 cell = ws.cell(row=current_row, column=col_num)
-                cell.value = column
-                cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-                cell.font = Font(color="FFFFFF", bold=True)
-                cell.alignment = Alignment(horizontal="center")
+                cell.value = header
+                ReportStyles.apply(cell, "header")
             
             # 재원기간 평균 표시 (G2 셀)
             avg_cell = ws['G2']
             avg_cell.value = f"평균 재원기간: {avg_duration_str}"
-            avg_cell.font = Font(size=11, bold=True, color="FFFFFF")
-            avg_cell.fill = PatternFill(start_color="C55A11", end_color="C55A11", fill_type="solid")
-            avg_cell.alignment = Alignment(horizontal="center", vertical="center")
+            ReportStyles.apply(avg_cell, "average")
             
             current_row += 1
             
             # 데이터
             discharged_data_start_row = current_row
-            for row_idx, row_data in enumerate(df_discharged.values):
-                for col_num, value in enumerate(row_data, 1):
+            # 재원상태 색상
+            column_styles = ["status_discharged" if field == "status" else "detail"
+                             for field, _ in discharged_columns]
+            for student in discharged_students:
+                for col_num, (field, _) in enumerate(discharged_columns, 1):
                     cell = ws.cell(row=current_row, column=col_num)
-                    cell.value = value if value is not None else "-"
-                    cell.alignment = Alignment(horizontal="left")
-                    
-                    # 재원상태 색상
-                    if df_discharged.columns[col_num - 1] == "재원상태":
-                        cell.font = Font(color="FF0000", bold=True)
-                    
-                    # 스트라이프
-                    if current_row % 2 == 0:
-                        cell.fill = PatternFill(start_color="F2F2F2", 
-                                               end_color="F2F2F2", fill_type="solid")
+                    cell.value = self._detail_value(student, field)
+                    ReportStyles.apply(cell, ReportStyles.striped(column_styles[col_num - 1], current_row))
                 current_row += 1
             
             discharged_data_end_row = current_row - 1
         
         # ===== 입소 학생 섹션 (오른쪽) =====
-        if not df_enrolled.empty:
+        if enrolled_students:
             # 입소 학생 섹션 제목
-            enrolled_cols = len(df_enrolled.columns)
+            enrolled_cols = len(enrolled_columns)
             ws.merge_cells(f'{get_column_letter(enrolled_start_col)}{3}:{get_column_letter(enrolled_start_col + enrolled_cols - 1)}{3}')
             section_title = ws[f'{get_column_letter(enrolled_start_col)}{3}']
             section_title.value = "📌 입소 학생 (재원중)"
-            section_title.font = Font(size=12, bold=True, color="FFFFFF")
-            section_title.fill = PatternFill(start_color="00B050", end_color="00B050", fill_type="solid")
-            section_title.alignment = Alignment(horizontal="left")
+            ReportStyles.apply(section_title, "section_enrolled")
             
             # 헤더 행 설정
             header_row = 4
             
             # 헤더
-            for col_num, column in enumerate(df_enrolled.columns, 1):
+            for col_num, (_, header) in enumerate(enrolled_columns, 1):
                 col = enrolled_start_col + col_num - 1
                 cell = ws.cell(row=header_row, column=col)
-                cell.value = column
-                cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-                cell.font = Font(color="FFFFFF", bold=True)
-                cell.alignment = Alignment(horizontal="center")
+                cell.value = header
+                ReportStyles.apply(cell, "header")
             
             # 데이터 (퇴소 학생과 같은 행에 맞춰서)
             data_start_row = header_row + 1
-            if not df_discharged.empty:
+            if discharged_students:
                 # 퇴소 학생 데이터 시작 행과 맞춤
                 data_start_row = discharged_data_start_row
             
-            for row_idx, row_data in enumerate(df_enrolled.values):
+            # 재원상태 색상
+            column_styles = ["status_enrolled" if field == "status" else "detail"
+                             for field, _ in enrolled_columns]
+            for row_idx, student in enumerate(enrolled_students):
                 data_row = data_start_row + row_idx
-                for col_num, value in enumerate(row_data, 1):
+                for col_num, (field, _) in enumerate(enrolled_columns, 1):
                     col = enrolled_start_col + col_num - 1
                     cell = ws.cell(row=data_row, column=col)
-                    cell.value = value if value is not None else "-"
-                    cell.alignment = Alignment(horizontal="left")
-                    
-                    # 재원상태 색상
-                    if df_enrolled.columns[col_num - 1] == "재원상태":
-                        cell.font = Font(color="00B050", bold=True)
-                    
-                    # 스트라이프
-                    if data_row % 2 == 0:
-                        cell.fill = PatternFill(start_color="F2F2F2", 
-                                               end_color="F2F2F2", fill_type="solid")
+                    cell.value = self._detail_value(student, field)
+                    ReportStyles.apply(cell, ReportStyles.striped(column_styles[col_num - 1], data_row))
             
             # 최종 행 업데이트
-            if not df_discharged.empty:
-                current_row = max(current_row, data_start_row + len(df_enrolled))
+            if discharged_students:
+                current_row = max(current_row, data_start_row + len(enrolled_students))
             else:
-                current_row = data_start_row + len(df_enrolled)
+                current_row = data_start_row + len(enrolled_students)
         
         # 열 너비 자동 조정 (글자에 맞춰서)
-        max_col = max(discharged_cols, enrolled_start_col + len(df_enrolled.columns) - 1) if not df_enrolled.empty else discharged_cols
-        
-        # 한글 문자를 고려한 너비 계산 함수
-        def calculate_text_width(text):
-            """한글과 영문을 고려한 텍스트 너비 계산"""
-            if not text:
-                return 0
-            text_str = str(text)
-            width = 0
-            for char in text_str:
-                # 한글, 한자 등 전각 문자는 2로 계산
-                if ord(char) > 127:
-                    width += 2
-                else:
-                    width += 1
-            return width
+        max_col = max(discharged_cols, enrolled_start_col + len(enrolled_columns) - 1) if enrolled_columns else discharged_cols
+        
+        calculate_text_width = self._text_width
         
         for col_num in range(1, max_col + 1):
             max_width = 0
@@ -2240,6 +3627,112 @@ class EnhancedDischargeReportGenerator:
             else:
                 ws.column_dimensions[column_letter].width = 10  # 기본값
 
+    def _stream_detail_sheet(self, ws, report_data: Dict):
+        """학생별 상세 명단 시트 (write-only 버전, _create_detail_sheet와 같은 배치)
+
+        write-only 시트는 열 정의가 행보다 먼저 기록되므로, 셀을 다시 훑는 대신
+        행 값을 준비하면서 열 너비를 계산해두고 그 다음 행을 순서대로 내보낸다.
+        """
+        detailed = report_data["detailed_list"]
+
+        if not detailed:
+            ws.append(["데이터가 없습니다."])
+            return
+
+        enrolled_students = [s for s in detailed if s.status == "enrolled"]
+        discharged_students = [s for s in detailed if s.status == "discharged"]
+        avg_duration_str = report_data["aggregates"]["tenure"]["average_label"]
+
+        discharged_columns = list(self.DETAIL_COLUMNS) if discharged_students else []
+        enrolled_columns = ([(f, h) for f, h in self.DETAIL_COLUMNS if f not in self.ENROLLED_HIDDEN_FIELDS]
+                            if enrolled_students else [])
+        discharged_cols = len(discharged_columns)
+        enrolled_start_col = discharged_cols + 3 if discharged_cols > 0 else 1
+        max_col = (max(discharged_cols, enrolled_start_col + len(enrolled_columns) - 1)
+                   if enrolled_columns else discharged_cols)
+        display = self._detail_value
+
+        # ===== 열 너비 (3행 이후 값 기준) =====
+        widths = [0] * (max_col + 1)
+
+        def measure(col, value):
+            width = self._text_width(value)
+            if width > widths[col]:
+                widths[col] = width
+
+        if discharged_students:
+            measure(1, "📌 퇴소 학생")
+            for col_num, (field, header) in enumerate(discharged_columns, 1):
+                measure(col_num, header)
+            for student in discharged_students:
+                for col_num, (field, _) in enumerate(discharged_columns, 1):
+                    measure(col_num, display(student, field))
+        if enrolled_students:
+            measure(enrolled_start_col, "📌 입소 학생 (재원중)")
+            for col_num, (field, header) in enumerate(enrolled_columns, enrolled_start_col):
+                measure(col_num, header)
+            for student in enrolled_students:
+                for col_num, (field, _) in enumerate(enrolled_columns, enrolled_start_col):
+                    measure(col_num, display(student, field))
+
+        avg_label = f"평균 재원기간: {avg_duration_str}" if discharged_students else None
+        for col_num in range(1, max_col + 1):
+            column_letter = get_column_letter(col_num)
+            if column_letter in ['J', 'K']:
+                ws.column_dimensions[column_letter].width = 3  # 최소 너비
+            elif column_letter == 'G':
+                ws.column_dimensions[column_letter].width = self._text_width(avg_label) + 2 if avg_label else 10
+            else:
+                ws.column_dimensions[column_letter].width = widths[col_num] + 2 if widths[col_num] > 0 else 10
+        ws.row_dimensions[1].height = 25
+
+        def styled(value, style):
+            cell = WriteOnlyCell(ws, value=value)
+            ReportStyles.apply(cell, style)
+            return cell
+
+        # 1행: 제목
+        ws.merged_cells.add("A1:G1")
+        ws.append([styled("👥 학생별 상세 명단", "title_detail")])
+
+        # 2행: 평균 재원기간 (G2)
+        row = [None] * max(max_col, 7)
+        if avg_label:
+            row[6] = styled(avg_label, "average")
+        ws.append(row)
+
+        # 3행: 섹션 제목, 4행: 헤더
+        title_row = [None] * max_col
+        header_row = [None] * max_col
+        if discharged_students:
+            ws.merged_cells.add(f"A3:{get_column_letter(discharged_cols)}3")
+            title_row[0] = styled("📌 퇴소 학생", "section_discharged")
+            for col_num, (_, header) in enumerate(discharged_columns, 1):
+                header_row[col_num - 1] = styled(header, "header")
+        if enrolled_students:
+            ws.merged_cells.add(f"{get_column_letter(enrolled_start_col)}3:"
+                                f"{get_column_letter(enrolled_start_col + len(enrolled_columns) - 1)}3")
+            title_row[enrolled_start_col - 1] = styled("📌 입소 학생 (재원중)", "section_enrolled")
+            for col_num, (_, header) in enumerate(enrolled_columns, enrolled_start_col):
+                header_row[col_num - 1] = styled(header, "header")
+        ws.append(title_row)
+        ws.append(header_row)
+
+        # 5행~: 퇴소(왼쪽)/입소(오른쪽) 학생을 같은 행에 나란히
+        sections = [(discharged_students, discharged_columns, 1, "status_discharged"),
+                    (enrolled_students, enrolled_columns, enrolled_start_col, "status_enrolled")]
+        for offset in range(max(len(discharged_students), len(enrolled_students))):
+            row_idx = 5 + offset
+            row = [None] * max_col
+            for students, columns, start_col, status_style in sections:
+                if offset >= len(students):
+                    continue
+                student = students[offset]
+                for col_num, (field, _) in enumerate(columns, start_col):
+                    style = ReportStyles.striped(status_style if field == "status" else "detail", row_idx)
+                    row[col_num - 1] = styled(display(student, field), style)
+            ws.append(row)
+
 
 ####
 
@@ -2247,6 +3740,96 @@ class EnhancedDischargeReportGenerator:
      
       
 
+def _render_excel_report(report_data: Dict, filename: str) -> str:
+    """풀 워커에서 실행되는 Excel 렌더링 진입점 (pickle 가능한 최상위 함수)
+
+    spawn 방식 워커는 app 모듈을 다시 import하므로, 모듈 로드 시 공유 자원(ledger 등)을 만들지 않아야 한다.
+    """
+    generator = EnhancedDischargeReportGenerator(None)
+    return str(generator.create_excel_with_chart(report_data, filename))
+
+
+class ExcelRenderPool:
+    """Excel 생성을 프로세스(또는 스레드) 풀로 넘겨 이벤트 루프를 막지 않도록 함"""
+
+    # 시트 생성에 쓰이는 키만 워커로 전달 (current_month의 원본 행 목록 등은 제외)
+    PAYLOAD_KEYS = ("teacher_name", "year", "month", "yearly_trend", "detailed_list", "aggregates")
+
+    def __init__(self, mode: str = None, max_workers: int = None, max_concurrency: int = None):
+        self.mode = (mode or config.EXCEL_EXECUTOR).lower()
+        self.max_workers = max_workers or config.EXCEL_MAX_WORKERS
+        self._executor = None
+        self._slots = asyncio.Semaphore(max_concurrency or config.EXCEL_MAX_CONCURRENCY)
+        self._active = 0
+        self._waiting = 0
+        self._total_renders = 0
+        self._total_seconds = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.mode == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="excel")
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            logger.info(f"🧵 Excel 렌더링 풀 생성: {self.mode} x {self.max_workers}")
+        return self._executor
+
+    def _compact_payload(self, report_data: Dict) -> Dict:
+        payload = {key: report_data[key] for key in self.PAYLOAD_KEYS if key in report_data}
+        current = report_data.get("current_month")
+        if current:
+            payload["current_month"] = {
+                key: current.get(key) for key in ("enrollments", "discharges", "net_change")
+            }
+        return payload
+
+    async def render(self, report_data: Dict, filename: str) -> Path:
+        payload = self._compact_payload(report_data)
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        self._active += 1
+        started = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            loop = asyncio.get_running_loop()
+            path = await loop.run_in_executor(executor, _render_excel_report, payload, filename)
+            return Path(path)
+        except BrokenProcessPool:
+            # 워커 프로세스가 죽으면 손상된 풀을 정리하고 다음 요청에서 새로 만든다
+            # (동시에 실패한 다른 렌더가 이미 새 풀을 만들었으면 그 풀은 건드리지 않음)
+            if self._executor is executor:
+                logger.error("❌ Excel 렌더링 프로세스 풀이 손상되어 재생성합니다")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            self._total_renders += 1
+            self._total_seconds += time.perf_counter() - started
+            self._active -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "active": self._active,
+            "waiting": self._waiting,
+            "total_renders": self._total_renders,
+            "avg_render_ms": round(self._total_seconds / self._total_renders * 1000, 2) if self._total_renders else 0.0
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+excel_pool = ExcelRenderPool()
+
+
 ####
 
 class ReportOrchestrator:
@@ -2254,13 +3837,78 @@ class ReportOrchestrator:
         self.notion = NotionManager()
         self.ai = OllamaAnalyzer()
         self.discharge_report = EnhancedDischargeReportGenerator(self.notion)
+        self.excel_pool = excel_pool
+        # 단계별 대기열/태스크 (첫 요청 때 실행 중인 이벤트 루프에서 만든다)
+        self._stage_queues: Dict[str, asyncio.Queue] = {}
+        self._stage_tasks: List[asyncio.Task] = []
+        self._stage_stats: Dict[str, Counter] = {}
         #self.pdf = PDFConverter()
         #self.security = SecurityManager()
         #self.file_manager = LocalFileManager()
     
-    async def _process_discharge_report(self, query_results: Dict, query: ReportQuery):
-        """입퇴소 보고서 (차트 포함)"""
-        
+    def _trend_window_from_question(self, question: str) -> Tuple[Optional[int], bool]:
+        """질문에서 추이 기간 (개월 수, 회계연도 여부) 결정"""
+        if not question:
+            return None, False
+        if any(keyword in question for keyword in ["회계연도", "회계 연도", "학년도"]):
+            return None, True
+        years_match = re.search(r'(\d+)\s*년\s*(간|동안|치)', question) or re.search(r'최근\s*(\d+)\s*년', question)
+        if years_match:
+            return int(years_match.group(1)) * 12, False
+        months_match = re.search(r'(\d+)\s*개월', question)
+        if months_match:
+            return int(months_match.group(1)), False
+        return None, False
+
+    def estimate_cost(self, request: ReportRequest) -> str:
+        """질문에 담긴 기간으로 처리 비용 등급 추정 (light: 한 달 이내, heavy: 1년 초과 또는 1년 넘는 추이)"""
+        question = request.question or ""
+        trend_months, fiscal = self._trend_window_from_question(question)
+        if trend_months and trend_months > 12:
+            return "heavy"
+        # 날짜가 잘못된 질문(예: 13월)도 큐에는 들어가야 하므로 해석 실패는 normal로
+        try:
+            date_range = self.ai._parse_date_range(question)
+            if not date_range:
+                return "normal"
+            span = (datetime.fromisoformat(date_range["end"]) - datetime.fromisoformat(date_range["start"])).days
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return "normal"
+        if span > 366:
+            return "heavy"
+        if span <= 31 and not trend_months and not fiscal:
+            return "light"
+        return "normal"
+
+    def _project_columns(self, query: Union[ReportQuery, List[ReportQuery]]) -> Union[ReportQuery, List[ReportQuery]]:
+        """쿼리 컬럼을 보고서 시트가 실제로 읽는 컬럼으로 교체 (알 수 없는 테이블은 그대로)"""
+        if isinstance(query, list):
+            return [self._project_columns(q) for q in query]
+        columns = self.discharge_report.required_columns(query.target_table)
+        if not columns:
+            return query
+        if columns != query.columns:
+            logger.debug(f"_project_columns: {query.target_table} {query.columns} -> {columns}")
+        return replace(query, columns=columns)
+
+    async def _rollup_counts(self, query: Union[ReportQuery, List[ReportQuery]]
+                             ) -> Optional[Dict[Tuple[int, int], Tuple[int, int]]]:
+        """(년, 월) → (입소 수, 퇴소 수)를 미러 롤업에서 (한 테이블이라도 롤업으로 답할 수 없으면 None)"""
+        counts = {}
+        try:
+            for q in (query if isinstance(query, list) else [query]):
+                table_counts = await self.notion.monthly_counts(q)
+                if table_counts is None:
+                    return None
+                counts[str(q.target_table).lower()] = table_counts
+        except Exception as e:
+            logger.warning(f"⚠️ 월별 롤업 조회 실패, 조회한 행으로 계산: {e}")
+            return None
+        enrollments, discharges = counts.get("class", {}), counts.get("discharge", {})
+        return {ym: (enrollments.get(ym, 0), discharges.get(ym, 0)) for ym in enrollments.keys() | discharges.keys()}
+
+    def _report_period(self, query: Union[ReportQuery, List[ReportQuery]]) -> Tuple[Optional[str], int, int]:
+        """보고서 대상 (선생님 이름, 년, 월)"""
         if isinstance(query, list):
             q0 = query[0]
         else:
@@ -2285,123 +3933,657 @@ class ReportOrchestrator:
                     month = date_obj.month
             except Exception as e:
                 logger.warning(f"⚠️ 날짜 범위 파싱 실패, 현재 날짜 사용: {str(e)}")
+        return teacher_name, year, month
+
+    # 파이프라인 단계: 각 단계는 job을 채워서 다음 단계로 넘긴다
+
+    async def _stage_analyze(self, job: PipelineJob):
+        # 상태 업데이트: 검토중
+        await self.notion.update_request_status(job.request.id, "검토중")
+
+        # 1. 자연어 질문 분석 -> 쿼리 생성 (보고서 시트가 쓰는 컬럼만 조회)
+        query = await self.ai.analyze_question(job.request.question)
+        job.query = self._project_columns(query)
+
+    def _month_query(self, query: Union[ReportQuery, List[ReportQuery]], year: int, month: int
+                     ) -> Union[ReportQuery, List[ReportQuery]]:
+        """보고서 월의 행만 조회하도록 테이블별 월 기준 날짜 속성으로 범위를 좁힌 쿼리"""
+        first = date(year, month, 1)
+        last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+
+        def narrow(q: ReportQuery) -> ReportQuery:
+            date_property = self.notion.ROLLUP_DATE_PROPERTIES.get(str(q.target_table).lower())
+            return replace(q, date_range={"start": first.isoformat(), "end": last.isoformat(),
+                                          "property": date_property})
+        return [narrow(q) for q in query] if isinstance(query, list) else narrow(query)
+
+    async def _stage_fetch(self, job: PipelineJob):
+        # 2. 쿼리 실행 및 데이터 수집
+        # 월별 건수는 미러 롤업에서 (답할 수 없으면 None → 조회한 행으로 계산)
+        job.monthly_counts = await self._rollup_counts(job.query)
+        fetch_query = job.query
+        if job.monthly_counts is not None:
+            # 추이/해당 월 건수는 롤업이 답하므로 전체 행 대신 상세 명단에 들어갈 보고서 월만 조회
+            _, year, month = self._report_period(job.query)
+            fetch_query = self._month_query(job.query, year, month)
+
+        query_results = await self.notion.query_multiple_tables(fetch_query)
+        errors = getattr(query_results, "errors", {})
+        if errors:
+            summary = ", ".join(f"{e.table}({e.error_type}): {e.message}" for e in errors.values())
+            if len(errors) == len(query_results):
+                raise RuntimeError(f"모든 테이블 조회 실패 - {summary}")
+            logger.warning(f"⚠️ 일부 테이블 조회 실패, 나머지 데이터로 보고서 생성: {summary}")
+        job.query_results = query_results
+
+    async def _stage_aggregate(self, job: PipelineJob):
+        # 3. 보고서 데이터 생성 (입퇴소 보고서, 차트 포함)
+        teacher_name, year, month = self._report_period(job.query)
+
+        # 추이 기간 (예: "최근 6개월", "3년간", "학년도")
+        trend_months, fiscal_year = self._trend_window_from_question(job.request.question)
 
-        # 보고서 데이터 생성
-        report_data = await self.discharge_report.generate_monthly_report(
-            query_results, teacher_name, year, month
+        job.report_data = await self.discharge_report.generate_monthly_report(
+            job.query_results, teacher_name, year, month,
+            trend_months=trend_months, fiscal_year=fiscal_year,
+            monthly_counts=job.monthly_counts
         )
-        
-        # 차트 포함 Excel 생성
+        job.query_results = None  # 원본 행은 더 쓰지 않으므로 다음 단계로 들고 가지 않음
+
+    async def _stage_render(self, job: PipelineJob):
+        # 4. 차트 포함 Excel 생성
+        teacher_name = job.report_data.get("teacher_name")
         filename = f"discharge_chart_{teacher_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        excel_path = self.discharge_report.create_excel_with_chart(
-            report_data, filename
-        )
+        job.excel_path = await self.excel_pool.render(job.report_data, filename)
+
+    async def _stage_publish(self, job: PipelineJob):
+        # 완료 상태로 업데이트
+        await self.notion.update_request_status(job.request.id, "완료됨")
+        logger.info(f"\n✅ 처리 완료! ({time.perf_counter() - job.enqueued_at:.1f}초)\n{'='*60}\n")
+
+    PIPELINE_STAGES = (
+        ("analyze", "_stage_analyze", "PIPELINE_ANALYZE_CONCURRENCY"),
+        ("fetch", "_stage_fetch", "PIPELINE_FETCH_CONCURRENCY"),
+        ("aggregate", "_stage_aggregate", "PIPELINE_AGGREGATE_CONCURRENCY"),
+        ("render", "_stage_render", "PIPELINE_RENDER_CONCURRENCY"),
+        ("publish", "_stage_publish", "PIPELINE_PUBLISH_CONCURRENCY"),
+    )
+
+    def _ensure_pipeline(self):
+        if self._stage_tasks:
+            return
+        names = [name for name, _, _ in self.PIPELINE_STAGES]
+        for name in names:
+            self._stage_queues[name] = asyncio.Queue(maxsize=max(1, config.PIPELINE_QUEUE_SIZE))
+            self._stage_stats[name] = Counter()
+        for index, (name, handler, concurrency_key) in enumerate(self.PIPELINE_STAGES):
+            next_name = names[index + 1] if index + 1 < len(names) else None
+            for _ in range(max(1, getattr(config, concurrency_key))):
+                self._stage_tasks.append(asyncio.create_task(
+                    self._run_stage(name, getattr(self, handler), next_name)
+                ))
+        logger.info(f"🏭 처리 파이프라인 시작: "
+                    + ", ".join(f"{name} x{max(1, getattr(config, key))}" for name, _, key in self.PIPELINE_STAGES))
+
+    async def _run_stage(self, name: str, handler: Callable, next_name: Optional[str]):
+        """한 단계의 작업자: 앞 대기열에서 job을 꺼내 처리하고 다음 대기열로 (가득 차 있으면 기다림)"""
+        inbox = self._stage_queues[name]
+        stats = self._stage_stats[name]
+        while True:
+            job = await inbox.get()
+            if job.future.done():
+                # 기다리던 워커가 취소된 요청은 더 진행하지 않음
+                inbox.task_done()
+                continue
+            stats["busy"] += 1
+            started = time.perf_counter()
+            try:
+                await handler(job)
+                stats["ms"] += int((time.perf_counter() - started) * 1000)
+                stats["done"] += 1
+                if next_name is None:
+                    if not job.future.done():
+                        job.future.set_result(None)
+                else:
+                    await self._stage_queues[next_name].put(job)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                stats["failed"] += 1
+                await self._fail(job, e)
+            finally:
+                stats["busy"] -= 1
+                inbox.task_done()
+
+    async def _fail(self, job: PipelineJob, error: Exception):
+        logger.error(f"❌ 처리 실패: {str(error)}")
+        try:
+            await self.notion.update_request_status(
+                job.request.id, "실패", error=str(error)
+            )
+        except Exception as e:
+            # 실패 상태도 기록하지 못하면 워커에 넘겨 재시도
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        if not job.future.done():
+            job.future.set_result(None)
 
     async def process_request(self, request: ReportRequest):
-        """보고서 요청 전체 처리"""
+        """보고서 요청 전체 처리 (단계별 파이프라인에 넣고 끝날 때까지 대기)
+
+        분석 → 조회 → 집계 → 렌더링 → 완료 기록 단계가 각자 대기열과 동시 처리 수를 가지므로
+        요청 A를 렌더링하는 동안 요청 B를 분석할 수 있다. 첫 단계 대기열이 가득 차면 여기서 기다린다.
+        """
         logger.info(f"\n{'='*60}")
         logger.info(f"🔨 처리 시작: {request.requester_name}님의 요청")
         logger.info(f"   질문: {request.question}")
         logger.info(f"{'='*60}\n")
         
-        try:
-            # 상태 업데이트: 검토중
-            await self.notion.update_request_status(request.id, "검토중")
+        self._ensure_pipeline()
+        job = PipelineJob(request=request, future=asyncio.get_running_loop().create_future())
+        await self._stage_queues[self.PIPELINE_STAGES[0][0]].put(job)
+        await job.future
 
-            # 1. 자연어 질문 분석 -> 쿼리 생성
-            query = await self.ai.analyze_question(request.question)
-            
-            # 2. 쿼리 실행 및 데이터 수집
-            query_results = await self.notion.query_multiple_tables(query)
-            
-            # 3. 보고서 생성 및 전달
-            await self._process_discharge_report(query_results, query)
+    def pipeline_stats(self) -> Dict[str, Any]:
+        stages = {}
+        for name, _, concurrency_key in self.PIPELINE_STAGES:
+            stats = self._stage_stats.get(name, Counter())
+            queue = self._stage_queues.get(name)
+            stages[name] = {
+                "concurrency": max(1, getattr(config, concurrency_key)),
+                "queued": queue.qsize() if queue else 0,
+                "busy": stats["busy"],
+                "done": stats["done"],
+                "failed": stats["failed"],
+                "avg_ms": round(stats["ms"] / stats["done"], 1) if stats["done"] else 0.0,
+            }
+        return {"queue_size": config.PIPELINE_QUEUE_SIZE, "stages": stages}
+
+    async def close(self):
+        """파이프라인 단계 태스크 종료 (처리 중인 요청은 PollingSystem.stop에서 먼저 마무리)"""
+        for task in self._stage_tasks:
+            task.cancel()
+        await asyncio.gather(*self._stage_tasks, return_exceptions=True)
+        self._stage_tasks = []
+        self._stage_queues = {}
+
+####
+
+class RequestLedger:
+    """보고서 요청 처리 기록 (SQLite + 크기 제한 LRU 캐시)
+
+    요청 ID마다 상태(queued / processing / done / failed / interrupted), 시도 횟수, 시각을 남긴다.
+    재시작 전에 큐에 있었거나 처리 중이던 요청은 interrupted가 되어 다시 처리할 수 있고,
+    끝난 요청은 Notion에서 그 이후에 다시 수정된 경우에만 다시 받는다.
+    """
+
+    PRUNE_INTERVAL = 3600  # 오래된 기록 정리 최소 간격(초)
+
+    def __init__(self, path: Path = None, cache_size: int = None, retention_days: float = None):
+        self.path = Path(path or config.LEDGER_PATH)
+        self.cache_size = cache_size or config.LEDGER_CACHE_SIZE
+        self.retention = (config.LEDGER_RETENTION_DAYS if retention_days is None else retention_days) * 86400
+
+        if str(self.path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS requests (
+                request_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                first_seen REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS requests_finished ON requests (finished_at);
+        """)
+        self._cache: "OrderedDict[str, Tuple[str, int, Optional[float]]]" = OrderedDict()  # id -> (상태, 시도 횟수, 종료 시각)
+        self._last_prune = 0.0
+        self._hits = 0
+        self._misses = 0
+
+    def recover(self) -> int:
+        """이전 프로세스에서 끝나지 못한(queued / processing) 요청을 interrupted로 바꿈
+
+        기록을 읽기만 하는 다른 프로세스가 살아 있는 상태를 덮어쓰지 않도록 생성자가 아니라
+        서버 시작 시 한 번만 호출한다.
+        """
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE requests SET state = 'interrupted', updated_at = ? WHERE state IN ('queued', 'processing')",
+                (time.time(),)
+            )
+        self._cache.clear()
+        if cur.rowcount:
+            logger.info(f"♻️ 이전 실행에서 끝나지 못한 요청 {cur.rowcount}건을 interrupted로 표시")
+        self.prune()
+        return cur.rowcount
+
+    def _get(self, request_id: str) -> Optional[Tuple[str, int, Optional[float]]]:
+        entry = self._cache.get(request_id)
+        if entry is not None:
+            self._hits += 1
+            self._cache.move_to_end(request_id)
+            return entry
+        self._misses += 1
+        row = self.conn.execute(
+            "SELECT state, attempts, finished_at FROM requests WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        if row is not None:
+            self._remember(request_id, tuple(row))
+        return tuple(row) if row else None
+
+    def _remember(self, request_id: str, entry: Tuple[str, int, Optional[float]]):
+        self._cache[request_id] = entry
+        self._cache.move_to_end(request_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _set(self, request_id: str, state: str, attempts: int, finished_at: Optional[float] = None,
+             error: Optional[str] = None):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO requests (request_id, state, attempts, first_seen, updated_at, finished_at, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (request_id) DO UPDATE SET state = excluded.state, attempts = excluded.attempts, "
+                "updated_at = excluded.updated_at, finished_at = excluded.finished_at, error = excluded.error",
+                (request_id, state, attempts, now, now, finished_at, error)
+            )
+        self._remember(request_id, (state, attempts, finished_at))
+
+    def enqueue(self, request: ReportRequest, confirmed: bool = False) -> bool:
+        """큐에 넣어도 되면 queued로 기록하고 True (이미 큐/처리 중이거나 끝난 요청이면 False)
+
+        confirmed: 끝난 뒤에 페이지를 직접 다시 조회해 대기중임을 확인한 요청
+        """
+        entry = self._get(request.id)
+        if entry is not None:
+            state, attempts, finished_at = entry
+            if state in ("queued", "processing"):
+                return False
+            if state in ("done", "failed"):
+                # 끝난 뒤에 Notion에서 다시 수정된(다시 요청된) 경우만
+                # last_edited_time은 분 단위로 잘리므로 완료와 같은 분이면 다시 조회해 확인된 경우만 받음
+                if finished_at is None:
+                    return False
+                edited = request.updated_at.timestamp()
+                if edited < finished_at - finished_at % 60 or (edited <= finished_at and not confirmed):
+                    return False
+                attempts = 0
+        else:
+            attempts = 0
+        self._set(request.id, "queued", attempts)
+        return True
+
+    def finished_same_minute(self, request: ReportRequest) -> bool:
+        """끝난 요청인데 수정 시각이 완료와 같은 분이라 다시 요청됐는지 시각만으로는 알 수 없는지"""
+        entry = self._get(request.id)
+        if entry is None or entry[0] not in ("done", "failed") or entry[2] is None:
+            return False
+        finished_at = entry[2]
+        return finished_at - finished_at % 60 <= request.updated_at.timestamp() <= finished_at
 
-            # 완료 상태로 업데이트
-            await self.notion.update_request_status(request.id, "완료됨")
-            logger.info(f"\n✅ 처리 완료!\n{'='*60}\n")
+    def release(self, request_id: str):
+        """queued로 기록했지만 큐에 넣지 못한 요청을 interrupted로 되돌림 (시도 횟수 유지)"""
+        entry = self._get(request_id)
+        if entry is not None and entry[0] == "queued":
+            self._set(request_id, "interrupted", entry[1])
+
+    def is_active(self, request_id: str) -> bool:
+        """큐에 있거나 처리 중인 요청인지"""
+        entry = self._get(request_id)
+        return entry is not None and entry[0] in ("queued", "processing")
+
+    def start(self, request_id: str) -> Optional[int]:
+        """queued 요청을 processing으로 바꾸고 이번 시도 번호를 반환 (큐에 없던 요청이면 None)"""
+        entry = self._get(request_id)
+        if entry is None or entry[0] != "queued":
+            return None
+        attempt = entry[1] + 1
+        self._set(request_id, "processing", attempt)
+        return attempt
+
+    def retry(self, request_id: str):
+        """실패한 요청을 다시 큐에 넣을 때 (시도 횟수 유지)"""
+        entry = self._get(request_id)
+        self._set(request_id, "queued", entry[1] if entry else 0)
+
+    def finish(self, request_id: str, state: str, error: Optional[str] = None):
+        entry = self._get(request_id)
+        self._set(request_id, state, entry[1] if entry else 1, finished_at=time.time(), error=error)
+
+    def prune(self):
+        """보관 기간이 지난 끝난 요청 기록 삭제 (PRUNE_INTERVAL마다 한 번)"""
+        now = time.time()
+        if now - self._last_prune < self.PRUNE_INTERVAL:
             return
-        except Exception as e:
-            logger.error(f"❌ 처리 실패: {str(e)}")
-            await self.notion.update_request_status(
-                request.id, "실패", error=str(e)
+        self._last_prune = now
+        with self.conn:
+            cur = self.conn.execute(
+                "DELETE FROM requests WHERE finished_at IS NOT NULL AND finished_at < ?", (now - self.retention,)
             )
+        if cur.rowcount:
+            self._cache.clear()
+            logger.info(f"🧹 요청 기록 정리: {cur.rowcount}건 삭제")
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM requests GROUP BY state").fetchall())
+        return {
+            "states": counts,
+            "cached": len(self._cache),
+            "cache_size": self.cache_size,
+            "hit_rate": round(self._hits / (self._hits + self._misses), 3) if self._hits + self._misses else 0.0
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+class FairScheduler:
+    """요청자별 공정 큐 (가중 공정 큐잉) + 비용 등급 우선순위
+
+    요청마다 가상 종료 시각 = max(현재 가상 시각, 같은 요청자의 마지막 종료 시각) + 등급 비용을 매기고
+    가장 작은 것부터 꺼낸다. 한 요청자가 무거운 요청을 몰아 넣어도 다른 요청자의 요청이 사이사이 끼어들고,
+    같은 조건이면 한 달짜리 질문이 여러 해 내보내기보다 먼저 나간다.
+    asyncio.Queue와 같은 put / get / qsize / task_done을 제공한다.
+    """
+
+    WAIT_SAMPLES = 200  # 등급별로 기억할 최근 대기 시간 수
+
+    def __init__(self, classify: Callable[[ReportRequest], str], weights: Dict[str, float] = None):
+        self.classify = classify
+        self.weights = weights or config.SCHED_COST_WEIGHTS
+        self._heap: List[Tuple[float, int, str, float, ReportRequest]] = []
+        self._seq = 0
+        self._vtime = 0.0
+        self._finish: Dict[str, float] = {}  # 요청자 → 마지막 가상 종료 시각
+        self._ready = asyncio.Event()
+        self._delayed: Dict[str, asyncio.TimerHandle] = {}
+        self._in_flight = 0
+        self._depth = Counter()
+        self._waits = {cost_class: deque(maxlen=self.WAIT_SAMPLES) for cost_class in self.weights}
+
+    async def put(self, request: ReportRequest):
+        self.put_nowait(request)
+
+    def put_nowait(self, request: ReportRequest):
+        cost_class = self.classify(request)
+        if cost_class not in self.weights:
+            cost_class = "normal"
+        flow = request.requester_name or ""
+        finish = max(self._vtime, self._finish.get(flow, 0.0)) + self.weights[cost_class]
+        self._finish[flow] = finish
+        self._seq += 1
+        heapq.heappush(self._heap, (finish, self._seq, cost_class, time.monotonic(), request))
+        self._depth[cost_class] += 1
+        self._ready.set()
+
+    def put_later(self, request: ReportRequest, delay: float):
+        """delay초 뒤에 다시 큐에 넣기 (재시도 백오프)"""
+        loop = asyncio.get_running_loop()
+        self._delayed[request.id] = loop.call_later(delay, self._release, request)
+
+    def _release(self, request: ReportRequest):
+        self._delayed.pop(request.id, None)
+        self.put_nowait(request)
+
+    async def get(self) -> ReportRequest:
+        while not self._heap:
+            self._ready.clear()
+            await self._ready.wait()
+        finish, _, cost_class, enqueued_at, request = heapq.heappop(self._heap)
+        self._vtime = max(self._vtime, finish - self.weights[cost_class])
+        self._depth[cost_class] -= 1
+        self._waits[cost_class].append(time.monotonic() - enqueued_at)
+        self._in_flight += 1
+        if len(self._finish) > 256:
+            # 가상 시각보다 뒤처진 요청자는 기록이 없어도 결과가 같으므로 정리
+            self._finish = {flow: f for flow, f in self._finish.items() if f > self._vtime}
+        return request
+
+    def task_done(self):
+        self._in_flight = max(0, self._in_flight - 1)
+
+    def qsize(self) -> int:
+        return len(self._heap)
+
+    def oldest_wait(self) -> float:
+        """가장 오래 기다린 요청의 대기 시간(초)"""
+        if not self._heap:
+            return 0.0
+        return time.monotonic() - min(enqueued_at for _, _, _, enqueued_at, _ in self._heap)
+
+    def cancel_delayed(self):
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        oldest = {}
+        for _, _, cost_class, enqueued_at, _ in self._heap:
+            oldest[cost_class] = max(oldest.get(cost_class, 0.0), now - enqueued_at)
+        classes = {}
+        for cost_class, waits in self._waits.items():
+            ordered = sorted(waits)
+            classes[cost_class] = {
+                "depth": self._depth[cost_class],
+                "oldest_wait": round(oldest.get(cost_class, 0.0), 2),
+                "wait_p50": round(ordered[len(ordered) // 2], 2) if ordered else None,
+                "wait_max": round(ordered[-1], 2) if ordered else None,
+                "dequeued": len(ordered),
+            }
+        return {
+            "queued": len(self._heap),
+            "delayed_retries": len(self._delayed),
+            "in_flight": self._in_flight,
+            "requesters": len({request.requester_name for *_, request in self._heap}),
+            "classes": classes,
+        }
 
-####
 
 class PollingSystem:
     def __init__(self):
         self.orchestrator = ReportOrchestrator()
         self.is_running = False
-        self.queue = asyncio.Queue()
-        self.processed_ids = set()  # 처리 중이거나 완료된 요청 ID 추적
-        self.worker_tasks = []  # 여러 워커 태스크 저장
+        self.queue = FairScheduler(self.orchestrator.estimate_cost)  # 요청자별 공정 큐 + 비용 등급 우선순위
+        self.ledger = RequestLedger()  # 요청별 처리 상태 (중복 처리 방지, 재시작 후에도 유지)
+        # 워커 풀: 큐 깊이와 대기 시간에 따라 min_workers ~ max_workers 사이에서 조정
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.min_workers = config.WORKER_MIN
+        self.max_workers = config.WORKER_MAX
+        self.busy_workers = 0
+        self._worker_seq = 0
+        self.scale_stats = Counter()
+        self.autoscale_task = None
+        self.warm_task = None
         self.polling_task = None
+        # 웹훅 이벤트 수집: 이벤트 ID로 중복 제거 후 바뀐 페이지 ID만 ingest 큐로
+        self.seen_events: "OrderedDict[str, None]" = OrderedDict()
+        self.ingest_queue: asyncio.Queue = asyncio.Queue()
+        self.ingest_pending: set = set()  # ingest 큐에 있는 페이지 ID (연속 이벤트 병합)
+        self.ingest_task = None
+        self.activity = asyncio.Event()  # 폴링 대기를 깨우는 신호
+        self.poll_interval = config.POLL_MIN_INTERVAL
+        self.max_interval = config.POLL_MAX_INTERVAL
+        self.event_stats = Counter()
     
-    async def _worker(self):
-        """큐에서 요청을 하나씩 꺼내서 처리하는 워커"""
-        logger.info("👷 워커 시작")
-        while self.is_running:
-            request = None
-            try:
-                # 큐에서 요청 가져오기 (타임아웃 1초)
-                try:
-                    request = await asyncio.wait_for(self.queue.get(), timeout=1.0)
-                except asyncio.TimeoutError:
-                    continue
-                
-                if request is None:
-                    continue
-                
-                # 이미 처리 중이거나 완료된 요청은 건너뛰기
-                if request.id in self.processed_ids:
-                    logger.debug(f"⏭️ 이미 처리된 요청 건너뛰기: {request.id}")
-                    self.queue.task_done()
-                    continue
-                
-                logger.info(f"📝 큐에서 요청 가져옴: {request.id} (큐 크기: {self.queue.qsize()})")
-                
-                # 처리 시도
+    async def _worker(self, worker_id: int):
+        """큐에서 요청을 하나씩 꺼내서 처리하는 워커 (오래 놀면 최소 수를 넘는 만큼 스스로 종료)"""
+        logger.info(f"👷 워커 {worker_id} 시작 (워커 수: {len(self.workers)})")
+        idle_since = time.monotonic()
+        try:
+            while self.is_running:
+                request = None
                 try:
-                    # 처리 시작 시 processed_ids에 추가 (중복 처리 방지)
-                    self.processed_ids.add(request.id)
-                    await self.orchestrator.process_request(request)
-                    logger.info(f"✅ 요청 처리 완료: {request.id}")
+                    # 큐에서 요청 가져오기 (타임아웃 1초)
+                    try:
+                        request = await asyncio.wait_for(self.queue.get(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        if (time.monotonic() - idle_since >= config.WORKER_IDLE_TIMEOUT
+                                and len(self.workers) > self.min_workers):
+                            self.scale_stats["scale_down"] += 1
+                            logger.info(f"💤 유휴 워커 {worker_id} 종료 (남은 워커: {len(self.workers) - 1})")
+                            break
+                        continue
+                    
+                    if request is None:
+                        continue
+                    
+                    self.busy_workers += 1
+                    try:
+                        await self._process(request)
+                    finally:
+                        self.busy_workers -= 1
+                        idle_since = time.monotonic()
+                        
                 except Exception as e:
-                    logger.error(f"❌ 요청 처리 실패: {request.id}, 오류: {str(e)}")
-                    # 처리 실패 시 processed_ids에서 제거하여 재시도 가능하도록
-                    self.processed_ids.discard(request.id)
+                    logger.error(f"❌ 워커 에러: {str(e)}")
                     import traceback
                     logger.error(f"상세 오류:\n{traceback.format_exc()}")
-                    # 실패한 요청을 다시 큐에 넣어 재시도 (무한 루프 방지를 위해 최대 3회)
-                    retry_count = getattr(request, '_retry_count', 0)
-                    if retry_count < 3:
-                        request._retry_count = retry_count + 1
-                        await self.queue.put(request)
-                        logger.info(f"🔄 요청 재시도 큐에 추가: {request.id} (재시도 {retry_count + 1}/3)")
-                finally:
-                    # 큐 작업 완료 표시 (성공/실패 관계없이)
-                    self.queue.task_done()
-                    
+                    await asyncio.sleep(1)
+        finally:
+            self.workers.pop(worker_id, None)
+
+    async def _process(self, request: ReportRequest):
+        """요청 하나 처리 (ledger 기록, 실패 시 백오프 재시도)"""
+        try:
+            # 처리 시작 기록 (큐에 중복으로 들어간 요청은 건너뛰기)
+            attempt = self.ledger.start(request.id)
+            if attempt is None:
+                logger.debug(f"⏭️ 이미 처리된 요청 건너뛰기: {request.id}")
+                return
+            
+            logger.info(f"📝 큐에서 요청 가져옴: {request.id} (큐 크기: {self.queue.qsize()}, 시도 {attempt})")
+            
+            # 처리 시도
+            try:
+                await self.orchestrator.process_request(request)
+                self.ledger.finish(request.id, "done")
+                logger.info(f"✅ 요청 처리 완료: {request.id}")
             except Exception as e:
-                logger.error(f"❌ 워커 에러: {str(e)}")
+                logger.error(f"❌ 요청 처리 실패: {request.id}, 오류: {str(e)}")
                 import traceback
                 logger.error(f"상세 오류:\n{traceback.format_exc()}")
-                if request:
-                    self.queue.task_done()
-                await asyncio.sleep(1)
-    
-    async def _polling(self, interval: int = 30):
-        """주기적으로 새로운 요청을 큐에 추가하는 폴링 태스크"""
+                # 실패한 요청은 지수 백오프 뒤 다시 큐에 넣어 재시도 (무한 루프 방지를 위해 최대 MAX_REQUEST_RETRIES회)
+                if attempt <= config.MAX_REQUEST_RETRIES:
+                    self.ledger.retry(request.id)
+                    delay = min(config.RETRY_BACKOFF_BASE * 2 ** (attempt - 1), config.RETRY_BACKOFF_MAX)
+                    self.queue.put_later(request, delay)
+                    logger.info(f"🔄 요청 재시도 예약: {request.id} ({delay:.0f}초 후, 재시도 {attempt}/{config.MAX_REQUEST_RETRIES})")
+                else:
+                    self.ledger.finish(request.id, "failed", error=str(e))
+        finally:
+            # 큐 작업 완료 표시 (성공/실패 관계없이)
+            self.queue.task_done()
+
+    def _spawn_worker(self):
+        self._worker_seq += 1
+        worker_id = self._worker_seq
+        self.workers[worker_id] = asyncio.create_task(self._worker(worker_id))
+
+    async def _autoscale(self):
+        """큐 깊이와 대기 시간을 보고 워커 추가 (줄이는 건 유휴 워커가 스스로)"""
+        while self.is_running:
+            await asyncio.sleep(config.WORKER_SCALE_INTERVAL)
+            depth = self.queue.qsize()
+            idle = len(self.workers) - self.busy_workers
+            if not self.is_running or depth == 0 or idle > 0 or len(self.workers) >= self.max_workers:
+                continue
+            oldest_wait = self.queue.oldest_wait()
+            if depth >= len(self.workers) or oldest_wait >= config.WORKER_SCALE_UP_WAIT:
+                self._spawn_worker()
+                self.scale_stats["scale_up"] += 1
+                logger.info(f"📈 워커 추가: {len(self.workers)}개 (큐 크기: {depth}, 최장 대기: {oldest_wait:.1f}초)")
+
+    async def _enqueue(self, req: ReportRequest, source: str, confirmed: bool = False) -> bool:
+        # 완료와 같은 분에 수정된 대기중 요청은 조회 인덱스가 늦은 것일 수 있으므로 페이지를 직접 다시 확인
+        if not confirmed and self.ledger.finished_same_minute(req):
+            req = await self.orchestrator.notion.get_request(req.id)
+            if req is None:
+                return False
+            confirmed = True
+        # 큐에 넣을 때 ledger에 queued로 기록되어 중복 추가 방지
+        if not self.ledger.enqueue(req, confirmed):
+            return False
+        try:
+            await self.queue.put(req)
+        except Exception as e:
+            # 큐에 못 넣었으면 queued 기록을 되돌려 다음 수집 때 다시 넣을 수 있게 (나머지 요청은 계속)
+            self.ledger.release(req.id)
+            logger.error(f"❌ 요청 큐 추가 실패: {req.id}, 오류: {str(e)}")
+            return False
+        logger.info(f"📥 {source} 요청 큐에 추가: {req.id} (큐 크기: {self.queue.qsize()})")
+        return True
+
+    def handle_webhook_event(self, event: Dict) -> bool:
+        """웹훅 이벤트 하나를 받아 바뀐 페이지 ID를 ingest 큐에 넣음 (새로 넣었으면 True)"""
+        event_id = event.get("id")
+        if event_id:
+            if event_id in self.seen_events:
+                self.seen_events.move_to_end(event_id)
+                self.event_stats["duplicate"] += 1
+                return False
+            self.seen_events[event_id] = None
+            while len(self.seen_events) > config.WEBHOOK_EVENT_CACHE:
+                self.seen_events.popitem(last=False)
+
+        entity = event.get("entity") or {}
+        page_id = entity.get("id")
+        if entity.get("type") != "page" or not page_id:
+            # 페이지를 특정할 수 없는 이벤트(DB 스키마 변경 등)는 폴링을 앞당기기만
+            self.event_stats["wake"] += 1
+            self.wake()
+            return False
+        if not self.orchestrator.notion.is_request_event(event):
+            # 다른 DB 페이지나 이 서비스가 직접 바꾼 상태는 페이지를 조회하지 않고 무시
+            self.event_stats["ignored"] += 1
+            return False
+        if page_id in self.ingest_pending or self.ledger.is_active(page_id):
+            self.event_stats["coalesced"] += 1
+            return False
+
+        self.ingest_pending.add(page_id)
+        self.ingest_queue.put_nowait(page_id)
+        self.event_stats["accepted"] += 1
+        return True
+
+    def wake(self):
+        """다음 폴링을 바로 실행하고 간격을 최소로 되돌림"""
+        self.poll_interval = config.POLL_MIN_INTERVAL
+        self.activity.set()
+
+    async def _ingest(self):
+        """웹훅으로 들어온 페이지 ID를 하나씩 조회해 대기중 요청이면 처리 큐에 추가"""
+        await self.orchestrator.notion.load_bot_user()
+        while self.is_running:
+            page_id = await self.ingest_queue.get()
+            self.ingest_pending.discard(page_id)
+            try:
+                req = await self.orchestrator.notion.get_request(page_id)
+                if req is not None and await self._enqueue(req, "웹훅", confirmed=True):
+                    self.poll_interval = config.POLL_MIN_INTERVAL
+            except Exception as e:
+                logger.error(f"❌ 웹훅 페이지 조회 실패: {page_id}, 오류: {str(e)}")
+                self.wake()  # 놓친 요청은 폴링이 바로 다시 확인
+            finally:
+                self.ingest_queue.task_done()
+
+    async def _polling(self):
+        """웹훅을 놓친 경우를 위한 적응형 폴링 (활동 직후엔 짧게, 한가하면 최대 간격까지 두 배씩)"""
         logger.info("🔍 폴링 시작")
         
         # 초기화: 대기중인 모든 요청을 큐에 추가
         try:
-            initial_requests = await self.orchestrator.notion.get_pending_requests()
+            initial_requests = await self.orchestrator.notion.get_pending_requests(full=True)
             for req in initial_requests:
-                if req.id not in self.processed_ids:
-                    await self.queue.put(req)
-                    logger.info(f"📥 초기 요청 큐에 추가: {req.id} (큐 크기: {self.queue.qsize()})")
+                await self._enqueue(req, "초기")
             logger.info(f"✅ 초기 {len(initial_requests)}개 요청 큐에 추가 완료")
         except Exception as e:
             logger.error(f"❌ 초기 요청 로드 실패: {str(e)}")
@@ -2409,62 +4591,105 @@ class PollingSystem:
         # 주기적으로 새로운 요청 확인
         while self.is_running:
             try:
-                await asyncio.sleep(interval)
+                interval = self.poll_interval
+                try:
+                    await asyncio.wait_for(self.activity.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.activity.clear()
                 
                 if not self.is_running:
                     break
                 
                 requests = await self.orchestrator.notion.get_pending_requests()
+                self.ledger.prune()
                 
-                # 새로운 요청만 큐에 추가 (processed_ids에 추가하지 않음 - 워커에서 처리할 때 추가)
+                # 새로운 요청만 큐에 추가
                 new_count = 0
                 for req in requests:
-                    if req.id not in self.processed_ids:
-                        await self.queue.put(req)
+                    if await self._enqueue(req, "폴링"):
                         new_count += 1
-                        logger.info(f"📥 새 요청 큐에 추가: {req.id} (큐 크기: {self.queue.qsize()})")
                 
                 if new_count == 0:
-                    logger.info(f"💤 새 요청 없음 (큐 크기: {self.queue.qsize()}) ({datetime.now().strftime('%H:%M:%S')})")
+                    self.poll_interval = min(self.poll_interval * 2, self.max_interval)
+                    logger.info(f"💤 새 요청 없음 (큐 크기: {self.queue.qsize()}, 다음 폴링 {self.poll_interval:.0f}초 후) ({datetime.now().strftime('%H:%M:%S')})")
                 else:
+                    self.poll_interval = config.POLL_MIN_INTERVAL
                     logger.info(f"📥 {new_count}개 새 요청 큐에 추가됨 (큐 크기: {self.queue.qsize()})")
                 
             except Exception as e:
                 logger.error(f"❌ 폴링 에러: {str(e)}")
+                self.poll_interval = min(self.poll_interval * 2, self.max_interval)
     
-    async def start(self, interval: int = 30, num_workers: int = 1):
+    async def start(self, interval: Optional[float] = None, num_workers: Optional[int] = None):
+        """interval을 주면 폴링 최대 간격, num_workers를 주면 최소 워커 수로 사용 (기본 POLL_MAX_INTERVAL, WORKER_MIN)"""
         self.is_running = True
+        self.max_interval = interval or config.POLL_MAX_INTERVAL
+        self.poll_interval = config.POLL_MIN_INTERVAL
+        self.min_workers = max(1, num_workers or config.WORKER_MIN)
+        self.max_workers = max(self.min_workers, config.WORKER_MAX)
         logger.info("🚀 학원 보고서 시스템 시작")
-        logger.info(f"⏰ 폴링 간격: {interval}초")
-        logger.info(f"👷 워커 수: {num_workers}개")
+        logger.info(f"⏰ 폴링 간격: {config.POLL_MIN_INTERVAL:.0f}~{self.max_interval:.0f}초 (웹훅 우선)")
+        logger.info(f"👷 워커 수: {self.min_workers}~{self.max_workers}개")
         logger.info("-" * 60)
         
-        # 워커 태스크 시작 (큐에서 요청 처리)
-        self.worker_tasks = []
-        for i in range(num_workers):
-            task = asyncio.create_task(self._worker())
-            self.worker_tasks.append(task)
-            logger.info(f"👷 워커 {i+1} 시작")
+        # 최소 워커 시작 (큐에서 요청 처리), 이후 autoscale 태스크가 필요할 때 추가
+        for _ in range(self.min_workers):
+            self._spawn_worker()
+        self.autoscale_task = asyncio.create_task(self._autoscale())
         
-        # 폴링 태스크 시작 (새 요청을 큐에 추가)
-        self.polling_task = asyncio.create_task(self._polling(interval))
+        # 미러 사전 동기화는 조회 제한 시간과 무관하게 백그라운드에서
+        self.warm_task = asyncio.create_task(self.orchestrator.notion.warm_mirror())
+        
+        # 웹훅 ingest 태스크와 폴링 태스크 시작 (새 요청을 큐에 추가)
+        self.ingest_task = asyncio.create_task(self._ingest())
+        self.polling_task = asyncio.create_task(self._polling())
         
         # 모든 태스크가 완료될 때까지 대기
         try:
-            await asyncio.gather(*self.worker_tasks, self.polling_task)
+            await asyncio.gather(self.autoscale_task, self.ingest_task, self.polling_task)
         except asyncio.CancelledError:
             pass
+
+    def worker_stats(self) -> Dict:
+        return {
+            "workers": len(self.workers),
+            "busy": self.busy_workers,
+            "min": self.min_workers,
+            "max": self.max_workers,
+            **self.scale_stats,
+        }
+
+    def ingest_stats(self) -> Dict:
+        return {
+            "events": dict(self.event_stats),
+            "ingest_pending": self.ingest_queue.qsize(),
+            "poll_interval": self.poll_interval,
+        }
     
-    def stop(self):
+    async def stop(self, timeout: Optional[float] = None):
+        """새 요청 수집을 멈추고 처리 중인 요청이 끝날 때까지 기다린 뒤 종료
+
+        큐에 남은 요청은 ledger에 queued로 남아 재시작 후 다시 처리된다.
+        """
         self.is_running = False
         logger.info("⏹️ 시스템 중지 중...")
         
-        # 모든 워커 태스크 취소
-        for task in self.worker_tasks:
+        # 수집/조정 태스크 취소, 예약된 재시도 취소
+        for task in (self.ingest_task, self.polling_task, self.autoscale_task, self.warm_task):
             if task:
                 task.cancel()
-        if self.polling_task:
-            self.polling_task.cancel()
+        self.queue.cancel_delayed()
+        
+        # 워커는 지금 처리 중인 요청만 끝내고 스스로 종료 (제한 시간을 넘기면 취소)
+        workers = list(self.workers.values())
+        if workers:
+            logger.info(f"⏳ 처리 중인 요청 마무리 대기: 워커 {len(workers)}개 (처리 중 {self.busy_workers}건)")
+            done, pending = await asyncio.wait(workers, timeout=config.WORKER_DRAIN_TIMEOUT if timeout is None else timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"⚠️ 제한 시간 내 끝나지 않은 워커 {len(pending)}개 취소")
         
         logger.info(f"⏹️ 시스템 중지 완료 (큐에 남은 요청: {self.queue.qsize()}개)")
 
@@ -2472,12 +4697,30 @@ class PollingSystem:
 ####
 
 app = FastAPI(title="학원 보고서 시스템")
-polling = PollingSystem()
+# 서버 시작 시 생성: Excel 렌더링 프로세스(spawn)처럼 app을 import만 하는 곳에서
+# ledger/미러/분석 캐시/Notion 클라이언트가 만들어지지 않도록 모듈 로드 시에는 만들지 않는다
+polling: Optional[PollingSystem] = None
 
 @app.on_event("startup")
 async def startup():
     """서버 시작 시 폴링 시작"""
-    asyncio.create_task(polling.start(interval=30))
+    global polling
+    polling = PollingSystem()
+    polling.ledger.recover()
+    asyncio.create_task(polling.start())
+
+@app.on_event("shutdown")
+async def shutdown():
+    """서버 종료 시 폴링 중지 및 공유 자원 정리"""
+    await polling.stop()
+    await polling.orchestrator.close()
+    await ollama_pool.close()
+    excel_pool.shutdown()
+    if polling.orchestrator.ai.cache:
+        polling.orchestrator.ai.cache.flush()
+    if polling.orchestrator.notion.mirror:
+        polling.orchestrator.notion.mirror.close()
+    polling.ledger.close()
 
 @app.get("/")
 async def root():
@@ -2491,6 +4734,20 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    """운영 지표 (풀 크기 조정용)"""
+    return {
+        "ollama_pool": ollama_pool.stats(),
+        "excel_pool": excel_pool.stats(),
+        "analysis_cache": polling.orchestrator.ai.cache.stats() if polling.orchestrator.ai.cache else None,
+        "request_ledger": polling.ledger.stats(),
+        "ingest": polling.ingest_stats(),
+        "scheduler": polling.queue.stats(),
+        "workers": polling.worker_stats(),
+        "pipeline": polling.orchestrator.pipeline_stats()
+    }
+
 @app.get("/download/{date}/{filename}")
 async def download_file(date: str, filename: str):
     """파일 다운로드 엔드포인트"""
@@ -2507,18 +4764,44 @@ async def download_file(date: str, filename: str):
         media_type='application/octet-stream'
     )
 
+def _verify_webhook_signature(body: bytes, signature: Optional[str]) -> bool:
+    if not config.NOTION_WEBHOOK_SECRET:
+        return True
+    expected = "sha256=" + hmac.new(config.NOTION_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return bool(signature) and hmac.compare_digest(expected, signature)
+
 @app.post("/webhook/notion")
-async def webhook():
-    """Notion 웹훅 (실시간 처리용) - 큐에 추가"""
-    requests = await polling.orchestrator.notion.get_pending_requests()
-    added_count = 0
-    for req in requests:
-        if req.id not in polling.processed_ids:
-            await polling.queue.put(req)
-            # processed_ids에 추가하지 않음 - 워커에서 처리할 때 추가
-            added_count += 1
-            logger.info(f"📥 웹훅으로 새 요청 큐에 추가: {req.id} (큐 크기: {polling.queue.qsize()})")
-    return {"status": "processing", "added_to_queue": added_count}
+async def webhook(request: Request):
+    """Notion 웹훅 (실시간 처리용) - 바뀐 페이지 ID만 ingest 큐에 추가"""
+    from fastapi.responses import JSONResponse
+    
+    body = await request.body()
+    if not _verify_webhook_signature(body, request.headers.get("X-Notion-Signature")):
+        logger.warning("⚠️ 웹훅 서명 불일치 - 무시")
+        return JSONResponse({"error": "invalid signature"}, status_code=401)
+    
+    try:
+        event = json.loads(body) if body else {}
+    except json.JSONDecodeError:
+        event = {}
+    
+    # 구독 등록 시 한 번 오는 검증 토큰 (NOTION_WEBHOOK_SECRET으로 설정, 로그 대신 소유자만 읽을 수 있는 파일로)
+    if "verification_token" in event:
+        path = config.WEBHOOK_TOKEN_PATH
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(event["verification_token"])
+        logger.info(f"🔑 Notion 웹훅 검증 토큰 수신: {path}에 저장")
+        return {"status": "verification_token_received"}
+    
+    # 내용 없는 호출은 즉시 폴링으로 처리
+    if not event:
+        polling.wake()
+        return {"status": "polling"}
+    
+    queued = polling.handle_webhook_event(event)
+    return {"status": "accepted", "queued": queued}
 
 
 ####
@@ -0,0 +1,218 @@
+"""성능 비교용 벤치마크 스크립트
+
+사용법:
+    python benchmarks.py analyze --runs 3    # 질문 분석: 2회 호출(split) vs 통합 프롬프트(combined)
+    python benchmarks.py styles --rows 20000 # 상세 시트 행 스타일: 셀마다 새 객체 vs 워크북별 스타일 인덱스 캐시
+    python benchmarks.py parse --pages 50000 # Notion 페이지 파싱: 기준 커밋의 셀마다 타입 분기 vs 스키마로 컴파일한 추출기 (dict / 슬롯 레코드)
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+import tracemalloc
+import zipfile
+
+import openpyxl
+from openpyxl.styles import Font, PatternFill, Alignment
+
+from app import config, OllamaAnalyzer, ollama_pool, ReportStyles, NotionManager, DISCHARGE
+
+
+# 질문 분석 정답 세트 (질문, 기대 테이블, 기대 필터)
+ANALYZE_CASES = [
+    ("홍길동 선생님 이번 달 입퇴소 현황", ["class", "discharge"], {"teacher_name": "홍길동"}),
+    ("유형신 선생님 담당 재원 학생 목록", "class", {"teacher_name": "유형신"}),
+    ("oo초등학교 3학년 재원 학생 목록 알려줘", "class", {"school_name": "oo초", "grade": 3}),
+    ("2025년 3월부터 7월까지 퇴소 사유 통계", "discharge", {}),
+    ("중3 특목 반 최근 6개월 퇴원 현황", "discharge", {"class_name": "중3 특목"}),
+    ("김민수 쌤 작년 입퇴소 월별 추이", ["class", "discharge"], {"teacher_name": "김민수"}),
+    ("전학으로 퇴소한 학생 명단", "discharge", {"discharging_reason": "전학"}),
+    ("최민욱 학생 입소일 알려줘", "class", {"student_name": "최민욱"}),
+]
+
+
+def _filters_match(expected: dict, actual: dict) -> bool:
+    return all(str(actual.get(k)) == str(v) for k, v in expected.items())
+
+
+async def bench_analyze(runs: int):
+    analyzer = OllamaAnalyzer()
+    original_mode = config.ANALYZE_MODE
+
+    try:
+        for mode in ("split", "combined"):
+            config.ANALYZE_MODE = mode
+            latencies = []
+            table_hits = 0
+            filter_hits = 0
+            total = 0
+
+            for _ in range(runs):
+                for question, expected_tables, expected_filters in ANALYZE_CASES:
+                    started = time.perf_counter()
+                    filters, table_type, _, _ = await analyzer._run_analysis_stages(question)
+                    latencies.append(time.perf_counter() - started)
+
+                    total += 1
+                    table_hits += table_type == expected_tables
+                    filter_hits += _filters_match(expected_filters, filters)
+
+            latencies.sort()
+            p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+            print(f"[{mode:8}] n={total} "
+                  f"avg={statistics.mean(latencies):.2f}s p95={p95:.2f}s | "
+                  f"tables={table_hits / total:.0%} filters={filter_hits / total:.0%}")
+    finally:
+        config.ANALYZE_MODE = original_mode
+        await ollama_pool.close()
+
+
+def _style_row_legacy(ws, row: int, cols: int):
+    # 기존 방식: 셀마다 Font/PatternFill/Alignment 새로 생성
+    for col in range(1, cols + 1):
+        cell = ws.cell(row=row, column=col)
+        cell.alignment = Alignment(horizontal="left")
+        if col == 1:
+            cell.font = Font(color="FF0000", bold=True)
+        if row % 2 == 0:
+            cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
+
+
+def _style_row_registry(ws, row: int, cols: int):
+    for col in range(1, cols + 1):
+        style = "status_discharged" if col == 1 else "detail"
+        ReportStyles.apply(ws.cell(row=row, column=col), ReportStyles.striped(style, row))
+
+
+def bench_styles(rows: int, cols: int):
+    for name, style_row in (("legacy", _style_row_legacy), ("registry", _style_row_registry)):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        for row in range(1, rows + 1):
+            ws.append(["값"] * cols)
+
+        started = time.perf_counter()
+        for row in range(1, rows + 1):
+            style_row(ws, row, cols)
+        elapsed = time.perf_counter() - started
+
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        styles_xml = zipfile.ZipFile(buffer).read("xl/styles.xml")
+        print(f"[{name:8}] rows={rows} cols={cols} "
+              f"total={elapsed:.2f}s per_row={elapsed / rows * 1e6:.1f}us | "
+              f"styles.xml={len(styles_xml)}B xlsx={buffer.tell()}B")
+
+
+PARSE_SCHEMA = {
+    "student_name": "title",
+    "teacher_name": "people",
+    "class_name": "multi_select",
+    "parent_phone_number": "phone_number",
+    "discharge_date": "date",
+    "start_date": "date",
+    "discharging_reason": "rich_text",
+    "school_name": "select",
+    "grade": "number",
+    "sibling": "relation",
+}
+
+
+def _synthetic_page(i: int) -> dict:
+    text = lambda value: [{"type": "text", "text": {"content": value}, "plain_text": value}]
+    values = {
+        "title": text(f"학생{i}"),
+        "people": [{"object": "user", "id": f"u{i % 7}", "name": f"선생님{i % 7}"}],
+        "multi_select": [{"name": name} for name in ("중3 특목", "A")[:i % 2 + 1]],
+        "phone_number": "010-1234-5678",
+        "date": {"start": f"202{4 + i % 3}-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "end": None},
+        "rich_text": text(("전학", "개인 사정", "성적")[i % 3]),
+        "select": {"name": f"oo{i % 5}초"},
+        "number": i % 6 + 1,
+        "relation": [{"id": f"page-{i - 1}"}] if i % 4 == 0 else [],
+    }
+    return {"id": f"page-{i}", "properties": {
+        name: {"id": name[:4], "type": prop_type, prop_type: values[prop_type]}
+        for name, prop_type in PARSE_SCHEMA.items()}}
+
+
+def _legacy_extract_property(page: dict, prop: str):
+    """기준 커밋의 NotionManager._extract_property를 그대로 옮긴 것 (셀마다 타입 분기)"""
+    p = page["properties"].get(prop, {})
+    prop_type = p.get("type", "")
+
+    if prop_type == "title":
+        return p["title"][0]["text"]["content"] if p.get("title") else ""
+    elif prop_type == "rich_text":
+        return p["rich_text"][0]["text"]["content"] if p.get("rich_text") else ""
+    elif prop_type == "number":
+        return p.get("number", 0)
+    elif prop_type == "select":
+        return p["select"]["name"] if p.get("select") else ""
+    elif prop_type == "date":
+        return p["date"]["start"] if p.get("date") else ""
+    elif prop_type == "phone_number":
+        return p.get("phone_number", "")
+    return ""
+
+
+def bench_parse(pages: int):
+    config.MIRROR_ENABLED = False
+    manager = NotionManager()
+    data = [_synthetic_page(i) for i in range(pages)]
+    columns = [col for col in PARSE_SCHEMA if col in DISCHARGE.__dataclass_fields__]
+
+    def legacy():
+        return [{col: _legacy_extract_property(page, col) for col in columns} for page in data]
+
+    def dispatch():
+        return [{col: manager._extract_property(page, col) for col in columns} for page in data]
+
+    def compiled(record_type):
+        extractors = manager._compile_extractors(PARSE_SCHEMA, columns, record_type)
+        return manager._parse_pages(data, extractors, record_type)
+
+    # legacy는 people/multi_select/relation을 ""로 버리므로 같은 결과끼리는 dispatch와 비교한다
+    for name, parse in (("legacy", legacy), ("dispatch", dispatch), ("compiled", lambda: compiled(None)),
+                        ("records", lambda: compiled(DISCHARGE))):
+        best = float("inf")
+        for _ in range(5):
+            started = time.perf_counter()
+            rows = parse()
+            best = min(best, time.perf_counter() - started)
+        # 파싱 결과가 붙잡고 있는 메모리 (행 객체 + 새로 만든 값)
+        tracemalloc.start()
+        rows = parse()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"[{name:8}] pages={pages} cols={len(columns)} "
+              f"total={best:.2f}s per_page={best / pages * 1e6:.1f}us | "
+              f"retained={retained / 1024 / 1024:.1f}MB per_row={retained / pages:.0f}B")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_analyze = sub.add_parser("analyze", help="질문 분석 지연시간/정확도 비교 (Ollama 필요)")
+    p_analyze.add_argument("--runs", type=int, default=3)
+
+    p_styles = sub.add_parser("styles", help="행 단위 셀 스타일 적용 비용 비교")
+    p_styles.add_argument("--rows", type=int, default=20000)
+    p_styles.add_argument("--cols", type=int, default=8)
+
+    p_parse = sub.add_parser("parse", help="Notion 페이지 → 행 파싱 비용 비교 (합성 페이지)")
+    p_parse.add_argument("--pages", type=int, default=50000)
+
+    args = parser.parse_args()
+    if args.command == "analyze":
+        asyncio.run(bench_analyze(args.runs))
+    elif args.command == "styles":
+        bench_styles(args.rows, args.cols)
+    elif args.command == "parse":
+        bench_parse(args.pages)
+
+
+if __name__ == "__main__":
+    main()